@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Офлайн-бенчмарк DNS-конвейера: воспроизводит pcap или текстовый лог
+tcpdump через dns_monitor() + DomainTracker.record() и печатает
+события/сек, p50/p99 задержки на событие и пиковый RSS.
+
+    python3 benchmark.py capture.pcap
+    python3 benchmark.py tcpdump.log --speed 1 --repeat 3
+"""
+
+import argparse
+import asyncio
+import os
+import resource
+import sys
+import time
+from typing import AsyncIterator
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from dns_parser import DomainSource, ReplaySource
+
+
+class TimedSource:
+    """
+    Обёртка над источником: меряет время от выдачи события до запроса
+    следующего — это и есть обработка события в dns_monitor().
+    """
+
+    def __init__(self, source: DomainSource, repeat: int = 1):
+        self.source = source
+        self.repeat = repeat
+        self.latencies: list[float] = []
+
+    async def stream(self) -> AsyncIterator[str]:
+        latencies = self.latencies
+        clock = time.perf_counter
+        for _ in range(self.repeat):
+            async for domain in self.source.stream():
+                t0 = clock()
+                yield domain
+                latencies.append(clock() - t0)
+
+
+def peak_rss_mb() -> float:
+    """Пиковый RSS процесса (ru_maxrss — КБ в Linux, байты в macOS)."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return rss / (1024 * 1024)
+    return rss / 1024
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))
+    return sorted_values[index]
+
+
+async def run(source: TimedSource) -> float:
+    # Импорт здесь: monitor при импорте загружает конфиг в глобальный tracker
+    import monitor
+    start = time.perf_counter()
+    await monitor.dns_monitor(source)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк DNS-конвейера на записанном трафике')
+    parser.add_argument('capture', help='pcap-файл или текстовый лог tcpdump')
+    parser.add_argument('--speed', type=float, default=None,
+                        help='скорость воспроизведения (1 — как записано), по умолчанию максимальная')
+    parser.add_argument('--repeat', type=int, default=1, help='сколько раз прогнать запись')
+    args = parser.parse_args()
+
+    source = TimedSource(ReplaySource(args.capture, args.speed), args.repeat)
+    elapsed = asyncio.run(run(source))
+
+    latencies = sorted(source.latencies)
+    events = len(latencies)
+    print(f"[bench] Событий: {events} за {elapsed:.3f}с")
+    print(f"[bench] Пропускная способность: {events / elapsed if elapsed else 0:,.0f} событий/с")
+    print(f"[bench] Задержка p50: {percentile(latencies, 50) * 1e6:.1f} мкс, "
+          f"p99: {percentile(latencies, 99) * 1e6:.1f} мкс")
+    print(f"[bench] Пиковый RSS: {peak_rss_mb():.1f} МБ")
+
+
+if __name__ == '__main__':
+    main()
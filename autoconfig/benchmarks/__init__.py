@@ -0,0 +1,13 @@
+"""
+Микробенчмарки горячих операций: разбор конфига, матчинг правил,
+разбор вывода tcpdump, операции DomainTracker и классификация
+сохранённых ответов по сигнатурам блокировки (corpus.py).
+
+Входные данные синтетические (generators.py) и детерминированные,
+поэтому прогоны на одной машине сравнимы между собой:
+
+    python3 -m benchmarks                      # из каталога autoconfig
+    python3 -m benchmarks --save               # записать базовую линию
+    python3 -m benchmarks --compare            # сравнить с базовой линией
+    python3 -m benchmarks --sizes 1000 10000 --filter 'engine.*'
+"""
@@ -0,0 +1,76 @@
+"""CLI микробенчмарков: python3 -m benchmarks [--save | --compare]."""
+
+import argparse
+import contextlib
+import fnmatch
+import io
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.cases import DEFAULT_SIZES, all_cases
+from benchmarks.runner import (
+    MIN_ROUND_TIME, REGRESSION_THRESHOLD,
+    compare, format_rate, load_baseline, measure, save_baseline,
+)
+
+
+BASELINE_FILE = Path(__file__).parent / 'baseline.json'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Микробенчмарки горячих операций autoconfig')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                        help='размеры синтетических конфигов (число правил)')
+    parser.add_argument('--filter', default='*', help='glob по именам бенчмарков')
+    parser.add_argument('--min-time', type=float, default=MIN_ROUND_TIME,
+                        help='минимальная длительность раунда, секунд')
+    parser.add_argument('--baseline', type=Path, default=BASELINE_FILE,
+                        help='JSON с базовой линией')
+    parser.add_argument('--save', action='store_true', help='записать результаты как базовую линию')
+    parser.add_argument('--compare', action='store_true',
+                        help='сравнить с базовой линией; код выхода 1 при регрессии')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help='допустимое ухудшение (0.15 = 15%%)')
+    args = parser.parse_args()
+
+    cases = [c for c in all_cases(args.sizes) if fnmatch.fnmatch(c.name, args.filter)]
+    if not cases:
+        print(f"[bench] Нет бенчмарков под фильтр {args.filter!r}")
+        sys.exit(2)
+
+    baseline = load_baseline(args.baseline) if args.compare else {}
+    if args.compare and not baseline:
+        print(f"[bench] Базовая линия {args.baseline} не найдена — только замер")
+
+    results = []
+    regressions = []
+    print(f"{'бенчмарк':<32} {'ops/sec':>10} {'B/op пик':>10} {'B/op ост.':>10}")
+    for case in cases:
+        # DomainTracker и конфиг при создании печатают в stdout — не мешаем таблице
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = measure(case, min_time=args.min_time)
+        results.append(result)
+
+        line = (f"{result.name:<32} {format_rate(result.ops_per_sec):>10} "
+                f"{result.bytes_per_op:>10.0f} {result.retained_per_op:>10.0f}  /{result.unit}")
+        if args.compare:
+            note, regressed = compare(result, baseline.get(result.name), args.threshold)
+            line += f"  {note}"
+            if regressed:
+                regressions.append(result.name)
+        print(line, flush=True)
+
+    if args.save:
+        save_baseline(args.baseline, results)
+        print(f"[bench] Базовая линия записана в {args.baseline}")
+
+    if regressions:
+        print(f"[bench] Регрессии: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
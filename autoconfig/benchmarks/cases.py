@@ -0,0 +1,158 @@
+"""Набор бенчмарков: конфиг, матчинг правил, вывод tcpdump, DomainTracker, сигнатуры."""
+
+import itertools
+
+from benchmarks import generators
+from benchmarks.corpus import corpus_case, load_corpus
+from benchmarks.runner import Case
+from config_document import ConfigDocument
+from domain_utils import get_base_domain
+from dns_parser import DNS_QUERY_RE
+from rules import RuleEngine
+
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+
+MATCH_BATCH = 2_000        # хостов на один вызов матчинга
+TCPDUMP_BATCH = 10_000     # строк tcpdump на вызов
+BURST_SESSIONS = 400       # сайтов во всплесках DNS (~10k событий)
+RELATED_WINDOW = 60.0      # окно DNS-истории для get_related_domains, секунд
+
+
+_configs: dict[int, str] = {}
+
+
+def _config(size: int) -> str:
+    if size not in _configs:
+        _configs[size] = generators.synthetic_config(size)
+    return _configs[size]
+
+
+def _tracker(size: int | None = None):
+    # Импорт здесь: monitor при импорте создаёт глобальный tracker
+    from monitor import DomainTracker
+    tracker = DomainTracker()
+    if size is not None:
+        tracker.document = ConfigDocument.parse(_config(size))
+        tracker.rules = RuleEngine(tracker.document.rules())
+    return tracker
+
+
+def config_cases(size: int) -> list[Case]:
+    def parse():
+        text = _config(size)
+        return lambda: ConfigDocument.parse(text)
+
+    def build():
+        rules = ConfigDocument.parse(_config(size)).rules()
+        return lambda: RuleEngine(rules)
+
+    def match():
+        text = _config(size)
+        engine = RuleEngine(ConfigDocument.parse(text).rules())
+        hosts = generators.config_hostnames(text, MATCH_BATCH)
+        engine_match = engine.match
+
+        def run():
+            for host in hosts:
+                engine_match(host)
+        return run
+
+    def add_domains():
+        document = ConfigDocument.parse(_config(size))
+        counter = itertools.count()
+        # Каждый вызов добавляет 10 новых доменов в растущий документ
+        return lambda: document.add_domains(
+            [f'new{next(counter)}.example.com' for _ in range(10)])
+
+    return [
+        Case(f'config.parse[{size}]', parse, size, 'rule'),
+        Case(f'engine.build[{size}]', build, size, 'rule'),
+        Case(f'engine.match[{size}]', match, MATCH_BATCH, 'lookup'),
+        Case(f'document.add_domains[{size}]', add_domains, 10, 'domain'),
+    ]
+
+
+def tracker_cases(size: int) -> list[Case]:
+    def related():
+        tracker = _tracker(size)
+        # Окно не должно истечь посреди замера
+        tracker.history.ttl = tracker.cooccurrence.ttl = 1e9
+        events = generators.browsing_bursts(BURST_SESSIONS)
+        last = events[-1][0]
+        window = [(ts, domain) for ts, domain in events if ts >= last - RELATED_WINDOW]
+        for ts, domain in window:
+            tracker.record(domain, now=ts)
+        # Сайт — первый домен последнего всплеска
+        site = get_base_domain(window[-1][1])
+        for ts, domain in reversed(window):
+            if ts < window[-1][0] - 2:
+                break
+            site = get_base_domain(domain)
+        return lambda: tracker.get_related_domains(site)
+
+    return [Case(f'tracker.related[{size}]', related, 1, 'call')]
+
+
+def stream_cases() -> list[Case]:
+    def regex():
+        lines = generators.tcpdump_lines(TCPDUMP_BATCH)
+        search = DNS_QUERY_RE.search
+
+        def run():
+            for line in lines:
+                match = search(line)
+                if match:
+                    match.group(1).lower()
+        return run
+
+    def record():
+        tracker = _tracker()
+        events = generators.browsing_bursts(BURST_SESSIONS)
+        record = tracker.record
+        offset = [0.0]
+        span = events[-1][0] + 60
+
+        def run():
+            # Время сдвигается между вызовами, чтобы TTL-вытеснение работало
+            base = offset[0]
+            for ts, domain in events:
+                record(domain, now=base + ts)
+            offset[0] += span
+        return run
+
+    def cleanup():
+        tracker = _tracker()
+        for domain in generators.hostnames(tracker.history.max_size):
+            tracker.record(domain)
+        # Типичный случай: периодическая чистка живого окна
+        return tracker.cleanup
+
+    def ignorable():
+        tracker = _tracker()
+        names = [domain for _, domain in generators.browsing_bursts(BURST_SESSIONS)]
+        is_ignorable = tracker.is_ignorable
+
+        def run():
+            for name in names:
+                is_ignorable(name)
+        return run
+
+    burst_events = len(generators.browsing_bursts(BURST_SESSIONS))
+    return [
+        Case('tcpdump.regex', regex, TCPDUMP_BATCH, 'line'),
+        Case('tracker.record', record, burst_events, 'event'),
+        Case('tracker.cleanup', cleanup, 1, 'call'),
+        Case('tracker.is_ignorable', ignorable, burst_events, 'name'),
+    ]
+
+
+def all_cases(sizes=DEFAULT_SIZES) -> list[Case]:
+    cases = []
+    for size in sizes:
+        cases += config_cases(size)
+    for size in sizes:
+        cases += tracker_cases(size)
+    cases += stream_cases()
+    cases.append(corpus_case(load_corpus()))
+    return cases
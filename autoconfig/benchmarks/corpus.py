@@ -0,0 +1,102 @@
+"""
+Прогон block_signatures по корпусу сохранённых ответов.
+
+Каждый файл в benchmarks/corpus — сырой HTTP-ответ (заголовок и тело);
+ожидаемый вердикт — в префиксе имени: 'blocked--*.http' или 'ok--*.http'.
+Тело подаётся кусками по --chunk байт, как оно приходит из сокета, так
+что проверяются и шаблоны на границе кусков. Затем — скорость
+классификации всего корпуса.
+
+    python3 -m benchmarks.corpus
+    python3 -m benchmarks.corpus --dir ~/saved-responses --chunk 512 -v
+"""
+
+import argparse
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.runner import Case, MIN_ROUND_TIME, format_rate, measure
+from block_signatures import SignatureSet, Verdict, get_signatures, parse_head
+
+
+CORPUS_DIR = Path(__file__).parent / 'corpus'
+CHUNK_SIZE = 1400  # примерно один TCP-сегмент
+
+
+class Sample:
+    def __init__(self, path: Path):
+        self.name = path.name
+        self.expected = path.name.split('--', 1)[0] == 'blocked'
+        raw = path.read_bytes()
+        head, _, self.body = raw.partition(b'\r\n\r\n')
+        self.status, self.headers = parse_head(head)
+
+
+def load_corpus(directory: Path = CORPUS_DIR) -> list[Sample]:
+    return [Sample(path) for path in sorted(directory.glob('*.http'))]
+
+
+def classify(signatures: SignatureSet, sample: Sample, chunk: int = CHUNK_SIZE) -> Verdict:
+    scanner = signatures.scanner(sample.status, sample.headers)
+    body = sample.body
+    for start in range(0, len(body), chunk):
+        if scanner.feed(body[start:start + chunk]):
+            break
+    return scanner.verdict()
+
+
+def corpus_case(samples: list[Sample], signatures: SignatureSet | None = None,
+                chunk: int = CHUNK_SIZE) -> Case:
+    """Бенчмарк: классификация всего корпуса за один вызов."""
+    def setup():
+        sigs = signatures or get_signatures()
+
+        def run():
+            for sample in samples:
+                classify(sigs, sample, chunk)
+        return run
+    return Case('signatures.classify', setup, len(samples), 'response')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Проверка сигнатур блокировки на корпусе ответов')
+    parser.add_argument('--dir', type=Path, default=CORPUS_DIR, help='каталог с *.http')
+    parser.add_argument('--chunk', type=int, default=CHUNK_SIZE, help='размер куска тела, байт')
+    parser.add_argument('--min-time', type=float, default=MIN_ROUND_TIME,
+                        help='минимальная длительность раунда замера, секунд')
+    parser.add_argument('-v', '--verbose', action='store_true', help='печатать все файлы, а не только ошибки')
+    args = parser.parse_args()
+
+    samples = load_corpus(args.dir)
+    if not samples:
+        print(f"[corpus] В {args.dir} нет *.http")
+        sys.exit(2)
+
+    signatures = get_signatures()
+    wrong = 0
+    for sample in samples:
+        verdict = classify(signatures, sample, args.chunk)
+        ok = verdict.blocked == sample.expected
+        wrong += not ok
+        if args.verbose or not ok:
+            mark = 'ok  ' if ok else 'FAIL'
+            rules = ', '.join(s.id for s in verdict.matches) or '-'
+            print(f"{mark} {sample.name:<48} {sample.status} "
+                  f"conf={verdict.confidence:.2f} [{rules}]")
+
+    print(f"[corpus] {len(samples) - wrong}/{len(samples)} вердиктов совпали")
+
+    total = sum(len(sample.body) for sample in samples)
+    result = measure(corpus_case(samples, signatures, args.chunk), min_time=args.min_time)
+    mb_per_sec = result.ops_per_sec * total / len(samples) / 1e6
+    print(f"[corpus] {format_rate(result.ops_per_sec)} ответов/с, {mb_per_sec:,.1f} МБ/с тела")
+
+    if wrong:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""Синтетические данные для бенчмарков: конфиги, вывод tcpdump, DNS-всплески."""
+
+import random
+
+
+SEED = 1729
+
+_SYLLABLES = (
+    'ka', 'lo', 'mi', 'ne', 'ra', 'to', 'vi', 'zu', 'shi', 'dro', 'pan', 'tek',
+    'cor', 'net', 'flux', 'app', 'hub', 'sky', 'byte', 'data', 'stream', 'cloud',
+)
+_TLDS = ('com', 'com', 'com', 'net', 'org', 'io', 'dev', 'ai', 'co', 'co.uk', 'ru', 'de')
+_SUBDOMAINS = ('www', 'api', 'cdn', 'static', 'img', 'media', 'auth', 'ws', 'assets', 'edge')
+
+# Сторонние домены, которые тянет почти любой сайт
+_THIRD_PARTY = (
+    'fonts.googleapis.com', 'fonts.gstatic.com', 'www.google-analytics.com',
+    'www.googletagmanager.com', 'cdn.jsdelivr.net', 'cdnjs.cloudflare.com',
+    'connect.facebook.net', 'static.cloudflareinsights.com', 'js.stripe.com',
+    'browser-intake-datadoghq.com', 'o0.ingest.sentry.io', 'api.segment.io',
+)
+_SYSTEM = (
+    'time.apple.com', 'gateway.icloud.com', 'mesu.apple.com',
+    'printer.local', '_dns.resolver.arpa', 'yandex.ru', 'mail.ru',
+)
+
+
+def base_domain(rng: random.Random) -> str:
+    """Случайный регистрируемый домен вида 'kanetflux.com'."""
+    label = ''.join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 4)))
+    return f'{label}.{rng.choice(_TLDS)}'
+
+
+def hostname(rng: random.Random, base: str | None = None) -> str:
+    """Хост на base (или на случайном домене), иногда с несколькими уровнями."""
+    base = base or base_domain(rng)
+    depth = rng.choice((0, 1, 1, 1, 2))
+    labels = [rng.choice(_SUBDOMAINS) for _ in range(depth)]
+    if depth and rng.random() < 0.3:
+        labels[0] += str(rng.randint(1, 40))
+    return '.'.join([*labels, base])
+
+
+def hostnames(n: int, seed: int = SEED) -> list[str]:
+    rng = random.Random(seed)
+    return [hostname(rng) for _ in range(n)]
+
+
+def synthetic_config(n_rules: int, seed: int = SEED) -> str:
+    """
+    Конфиг в формате shadsocks_in.conf с n_rules доменными правилами.
+    Доли типов близки к реальному конфигу: в основном SUFFIX и KEYWORD,
+    немного точных DOMAIN и DIRECT-исключений.
+    """
+    rng = random.Random(seed)
+    lines = ['[General]', 'bypass-system = true', 'dns-server = system', '', '[Rule]']
+    for _ in range(n_rules):
+        roll = rng.random()
+        if roll < 0.55:
+            lines.append(f'DOMAIN-SUFFIX,{hostname(rng)},PROXY')
+        elif roll < 0.85:
+            lines.append(f'DOMAIN-KEYWORD,{base_domain(rng)},PROXY')
+        elif roll < 0.95:
+            lines.append(f'DOMAIN,{hostname(rng)},PROXY')
+        else:
+            lines.append(f'DOMAIN-SUFFIX,{base_domain(rng)},DIRECT')
+    lines += [
+        '// Proxy',
+        'GEOIP,RU,DIRECT',
+        'FINAL,PROXY',
+        '',
+        '[Host]',
+        'localhost = 127.0.0.1',
+        '',
+    ]
+    return '\n'.join(lines)
+
+
+def config_hostnames(config: str, n: int, hit_ratio: float = 0.5,
+                     seed: int = SEED) -> list[str]:
+    """
+    Запросы для матчинга: доля hit_ratio — поддомены правил конфига,
+    остальное — случайные хосты, которых в конфиге (почти наверняка) нет.
+    """
+    rng = random.Random(seed + 1)
+    values = [
+        line.split(',')[1] for line in config.splitlines()
+        if line.startswith(('DOMAIN,', 'DOMAIN-SUFFIX,', 'DOMAIN-KEYWORD,'))
+    ]
+    result = []
+    for _ in range(n):
+        if values and rng.random() < hit_ratio:
+            result.append(f'{rng.choice(_SUBDOMAINS)}.{rng.choice(values)}')
+        else:
+            result.append(hostname(rng))
+    return result
+
+
+def tcpdump_lines(n: int, seed: int = SEED) -> list[str]:
+    """
+    Строки в формате `tcpdump -l -n udp port 53`: запросы A/AAAA,
+    ответы и прочие типы вперемешку, как в живом выводе.
+    """
+    rng = random.Random(seed)
+    lines = []
+    seconds = 12 * 3600
+    for i in range(n):
+        seconds += rng.random() * 0.05
+        ts = (f'{int(seconds) // 3600 % 24:02d}:{int(seconds) // 60 % 60:02d}:'
+              f'{int(seconds) % 60:02d}.{int(seconds % 1 * 1e6):06d}')
+        port = rng.randint(1024, 65535)
+        qid = rng.randint(1, 65535)
+        name = hostname(rng)
+        roll = rng.random()
+        if roll < 0.45:
+            qtype = 'A?' if rng.random() < 0.6 else 'AAAA?'
+            lines.append(f'{ts} IP 192.168.1.23.{port} > 192.168.1.1.53: '
+                         f'{qid}+ {qtype} {name}. ({len(name) + 17})')
+        elif roll < 0.55:
+            lines.append(f'{ts} IP 192.168.1.23.{port} > 192.168.1.1.53: '
+                         f'{qid}+ [1au] HTTPS? {name}. ({len(name) + 28})')
+        else:
+            ip = '.'.join(str(rng.randint(1, 254)) for _ in range(4))
+            lines.append(f'{ts} IP 192.168.1.1.53 > 192.168.1.23.{port}: '
+                         f'{qid} 2/0/0 CNAME edge.{name}., A {ip} ({len(name) + 60})')
+    return lines
+
+
+def browsing_bursts(sessions: int, seed: int = SEED) -> list[tuple[float, str]]:
+    """
+    Поток (время, домен) «как при сёрфинге»: открытие сайта даёт всплеск
+    из 10–40 запросов за пару секунд (сам сайт, его CDN, сторонние скрипты,
+    фоновые системные запросы), между сайтами — паузы 5–30 секунд.
+    """
+    rng = random.Random(seed)
+    events = []
+    now = 0.0
+    for _ in range(sessions):
+        site = base_domain(rng)
+        cdn = base_domain(rng)
+        for _ in range(rng.randint(10, 40)):
+            roll = rng.random()
+            if roll < 0.45:
+                name = hostname(rng, site)
+            elif roll < 0.65:
+                name = hostname(rng, cdn)
+            elif roll < 0.9:
+                name = rng.choice(_THIRD_PARTY)
+            else:
+                name = rng.choice(_SYSTEM)
+            events.append((now + rng.random() * 2.0, name))
+        now += rng.uniform(5, 30)
+    events.sort()
+    return events
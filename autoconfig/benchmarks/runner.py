@@ -0,0 +1,134 @@
+"""Замер ops/sec и памяти на операцию, базовые линии в JSON."""
+
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Callable
+
+
+# Минимальная длительность одного раунда замера, секунд
+MIN_ROUND_TIME = 0.2
+ROUNDS = 3
+
+# Допустимое ухудшение относительно базовой линии
+REGRESSION_THRESHOLD = 0.15
+# Рост памяти меньше этого (байт на операцию) — шум, не регрессия
+MEMORY_NOISE_BYTES = 64
+
+
+@dataclass
+class Case:
+    """
+    Бенчмарк: setup() готовит данные вне замера и возвращает функцию,
+    один вызов которой выполняет ops операций.
+    """
+    name: str
+    setup: Callable[[], Callable[[], object]]
+    ops: int
+    unit: str = 'op'
+
+
+@dataclass
+class Result:
+    name: str
+    unit: str
+    ops_per_sec: float
+    bytes_per_op: float     # пик аллокаций за вызов / ops
+    retained_per_op: float  # осталось занято после вызова / ops
+
+
+def _time_call(fn: Callable[[], object], calls: int) -> float:
+    clock = time.perf_counter
+    start = clock()
+    for _ in range(calls):
+        fn()
+    return clock() - start
+
+
+def measure(case: Case, min_time: float = MIN_ROUND_TIME, rounds: int = ROUNDS) -> Result:
+    fn = case.setup()
+    fn()  # прогрев: lru_cache, ленивые индексы, аллокатор
+
+    # Калибровка: подбираем число вызовов на раунд не короче min_time
+    calls = 1
+    while True:
+        elapsed = _time_call(fn, calls)
+        if elapsed >= min_time / 4 or calls >= 1 << 20:
+            break
+        calls *= 4
+
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        per_call = min(_time_call(fn, calls) / calls for _ in range(rounds))
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    # Память отдельным вызовом: tracemalloc сильно замедляет код
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        fn()
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return Result(
+        name=case.name,
+        unit=case.unit,
+        ops_per_sec=case.ops / per_call if per_call > 0 else float('inf'),
+        bytes_per_op=max(0, peak - before) / case.ops,
+        retained_per_op=max(0, after - before) / case.ops,
+    )
+
+
+def save_baseline(path: Path, results: list[Result]) -> None:
+    data = {
+        'python': sys.version.split()[0],
+        'machine': platform.platform(),
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'results': {r.name: asdict(r) for r in results},
+    }
+    path.write_text(json.dumps(data, indent=2, ensure_ascii=False) + '\n', encoding='utf-8')
+
+
+def load_baseline(path: Path) -> dict[str, dict]:
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding='utf-8')).get('results', {})
+
+
+def compare(result: Result, baseline: dict | None,
+            threshold: float = REGRESSION_THRESHOLD) -> tuple[str, bool]:
+    """Строка сравнения с базовой линией и флаг регрессии."""
+    if baseline is None:
+        return 'нет базовой линии', False
+
+    speed = result.ops_per_sec / baseline['ops_per_sec'] - 1
+    notes = [f'{speed:+.1%} скорость']
+    regressed = speed < -threshold
+
+    old_mem = baseline['bytes_per_op']
+    grown = result.bytes_per_op - old_mem
+    if grown > MEMORY_NOISE_BYTES and grown > old_mem * threshold:
+        notes.append(f'память {old_mem:.0f}→{result.bytes_per_op:.0f} B/{result.unit}')
+        regressed = True
+
+    if regressed:
+        notes.append('РЕГРЕССИЯ')
+    return ', '.join(notes), regressed
+
+
+def format_rate(value: float) -> str:
+    for limit, suffix in ((1e6, 'M'), (1e3, 'k')):
+        if value >= limit:
+            return f'{value / limit:.2f}{suffix}'
+    return f'{value:.1f}'
@@ -0,0 +1,201 @@
+"""Сигнатуры страниц блокировки: статус, заголовки и тело HTTP-ответа.
+
+Правила загружаются из block_signatures.json. Тело сканируется кусками
+по мере прихода, не дальше BLOCK_BODY_CAP: каждый кусок один раз
+приводится к нижнему регистру (ASCII, без декодирования) и в нём ищутся
+только ещё не сработавшие шаблоны; хвост предыдущего куска ловит
+шаблоны на границе. Поиск подстроки в bytes идёт в C и на десятках
+шаблонов быстрее автомата на чистом Python.
+Каждое сработавшее правило добавляет свою уверенность:
+итог = 1 - П(1 - c). Ответ считается блокировкой, когда итог достигает
+порога из файла; сканирование тела на этом останавливается.
+"""
+
+import json
+from functools import lru_cache
+from pathlib import Path
+
+from config import BLOCK_SIGNATURES_FILE, BLOCK_BODY_CAP
+
+
+class Signature:
+    """Одно правило: что ищем, при каких статусах и с какой уверенностью."""
+
+    __slots__ = ('id', 'kind', 'confidence', 'statuses', 'header', 'needle')
+
+    def __init__(self, id: str, kind: str, confidence: float,
+                 statuses: frozenset[int] | None, header: str = '', needle: str = ''):
+        self.id = id
+        self.kind = kind            # 'status' | 'header' | 'body'
+        self.confidence = confidence
+        self.statuses = statuses    # None — при любом статусе
+        self.header = header        # имя заголовка в нижнем регистре
+        self.needle = needle        # подстрока (заголовок или шаблон тела)
+
+    def applies(self, status: int | None) -> bool:
+        return self.statuses is None or status in self.statuses
+
+    def __repr__(self) -> str:
+        return f'Signature({self.id!r}, {self.kind}, {self.confidence})'
+
+
+class Verdict:
+    """Итог классификации: блокировка, уверенность и сработавшие правила."""
+
+    __slots__ = ('blocked', 'confidence', 'rule', 'matches')
+
+    def __init__(self, blocked: bool, confidence: float, matches: list[Signature]):
+        self.blocked = blocked
+        self.confidence = confidence
+        self.matches = matches
+        # Главное правило — самое уверенное из сработавших
+        self.rule = max(matches, key=lambda s: s.confidence).id if matches else None
+
+    def __repr__(self) -> str:
+        return (f'Verdict(blocked={self.blocked}, confidence={self.confidence:.2f}, '
+                f'rule={self.rule!r})')
+
+
+# Приведение ASCII к нижнему регистру без декодирования
+_ASCII_LOWER = bytes.maketrans(bytes(range(65, 91)), bytes(range(97, 123)))
+
+
+class SignatureSet:
+    """Скомпилированный набор правил из JSON-файла."""
+
+    def __init__(self, data: dict, body_cap: int = BLOCK_BODY_CAP):
+        self.threshold = float(data.get('threshold', 0.7))
+        self.body_cap = body_cap
+
+        def statuses(item):
+            value = item.get('status')
+            if value is None:
+                return None
+            return frozenset(value if isinstance(value, list) else [value])
+
+        self.status_rules = [
+            Signature(item['id'], 'status', float(item['confidence']), statuses(item))
+            for item in data.get('status', [])
+        ]
+        self.header_rules = [
+            Signature(item['id'], 'header', float(item['confidence']), statuses(item),
+                      header=item['header'].lower(), needle=item.get('contains', '').lower())
+            for item in data.get('headers', [])
+        ]
+        self.body_rules = [
+            Signature(item['id'], 'body', float(item['confidence']), statuses(item),
+                      needle=item['pattern'].lower())
+            for item in data.get('body', [])
+        ]
+        self.patterns = [s.needle.encode('utf-8') for s in self.body_rules]
+        # Столько байт предыдущего куска нужно, чтобы не потерять шаблон на границе
+        self.overlap = max((len(p) for p in self.patterns), default=1) - 1
+
+    @classmethod
+    def load(cls, path: Path = BLOCK_SIGNATURES_FILE, body_cap: int = BLOCK_BODY_CAP) -> 'SignatureSet':
+        return cls(json.loads(path.read_text(encoding='utf-8')), body_cap)
+
+    def __len__(self) -> int:
+        return len(self.status_rules) + len(self.header_rules) + len(self.body_rules)
+
+    def scanner(self, status: int | None, headers: dict[str, str]) -> 'Scanner':
+        """Сканер одного ответа; статус и заголовки (имена в нижнем регистре) уже известны."""
+        return Scanner(self, status, headers)
+
+    def classify(self, status: int | None, headers: dict[str, str], body: bytes) -> Verdict:
+        scanner = self.scanner(status, headers)
+        scanner.feed(body)
+        return scanner.verdict()
+
+
+class Scanner:
+    """
+    Потоковая классификация одного ответа. feed() принимает очередной кусок
+    тела и возвращает True, когда читать дальше незачем: порог достигнут,
+    для этого статуса нет правил тела или прочитан body_cap байт.
+    """
+
+    def __init__(self, signatures: SignatureSet, status: int | None, headers: dict[str, str]):
+        self.signatures = signatures
+        self.matches: list[Signature] = []
+        self._miss = 1.0  # П(1 - c) по сработавшим правилам
+        self._tail = b''
+        self._read = 0
+
+        for rule in signatures.status_rules:
+            if rule.applies(status):
+                self._hit(rule)
+        for rule in signatures.header_rules:
+            if rule.applies(status):
+                value = headers.get(rule.header)
+                if value is not None and rule.needle in value.lower():
+                    self._hit(rule)
+
+        # Индексы правил тела, которые при этом статусе ещё не сработали
+        self._active = [i for i, rule in enumerate(signatures.body_rules) if rule.applies(status)]
+        self.done = not self._active or self.blocked
+
+    @property
+    def confidence(self) -> float:
+        return 1.0 - self._miss
+
+    @property
+    def blocked(self) -> bool:
+        return self.confidence >= self.signatures.threshold
+
+    def _hit(self, rule: Signature) -> None:
+        self.matches.append(rule)
+        self._miss *= 1.0 - rule.confidence
+
+    def feed(self, chunk: bytes) -> bool:
+        if self.done:
+            return True
+        room = self.signatures.body_cap - self._read
+        if len(chunk) > room:
+            chunk = chunk[:room]
+        self._read += len(chunk)
+
+        window = self._tail + chunk.translate(_ASCII_LOWER)
+        patterns, body_rules = self.signatures.patterns, self.signatures.body_rules
+        remaining = []
+        for index in self._active:
+            if patterns[index] in window:
+                self._hit(body_rules[index])  # каждое правило — один раз
+            else:
+                remaining.append(index)
+        self._active = remaining
+        if self.blocked or not remaining:
+            self.done = True
+
+        overlap = self.signatures.overlap
+        self._tail = window[-overlap:] if overlap else b''
+        if self._read >= self.signatures.body_cap:
+            self.done = True
+        return self.done
+
+    def verdict(self) -> Verdict:
+        return Verdict(self.blocked, self.confidence, self.matches)
+
+
+@lru_cache(maxsize=1)
+def get_signatures() -> SignatureSet:
+    """Набор из BLOCK_SIGNATURES_FILE, загружается при первом обращении."""
+    return SignatureSet.load()
+
+
+def parse_head(head: bytes) -> tuple[int | None, dict[str, str]]:
+    """(статус, заголовки) из заголовка HTTP/1.x ответа без пустой строки."""
+    lines = head.split(b'\r\n')
+    status_line = lines[0].split()
+    if len(status_line) < 2 or not status_line[0].startswith(b'HTTP/'):
+        return None, {}
+    try:
+        status = int(status_line[1])
+    except ValueError:
+        return None, {}
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(b':')
+        if sep:
+            headers[name.strip().decode('latin-1').lower()] = value.strip().decode('latin-1')
+    return status, headers
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Массовый импорт внешнего списка доменов в shadsocks_in.conf.
+
+Список читается построчно, целиком в память не загружается. Понимает
+простой формат (домен на строку), hosts-файлы ('0.0.0.0 a.com b.com')
+и adblock-строки вида '||a.com^'. Каждое имя сводится к base-домену;
+отбрасываются служебные, системные и DIRECT-домены и всё, что уже
+маршрутизируется правилами конфига. Оставшиеся (с --check — только
+подтверждённо заблокированные) добавляются одной атомарной записью.
+
+    python3 bulk_import.py blocklist.txt                 # только отчёт
+    python3 bulk_import.py hosts.txt --check --write
+    curl -s https://example.org/list.txt | python3 bulk_import.py - --write
+"""
+
+import argparse
+import asyncio
+import re
+import sys
+import os
+import time
+from pathlib import Path
+from typing import Iterable, Iterator, TextIO
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import CONFIG_FILE, CHECK_BATCH_DEADLINE
+from config_document import ConfigDocument
+from domain_utils import get_base_domain, classify_domain, CANDIDATE
+from rules import RuleEngine, is_hostname
+
+
+# Домен верхнего уровня в списках: буквенный, от двух символов (не IP, не 'local')
+TLD_RE = re.compile(r'[a-z][a-z0-9-]{1,62}')
+IPV4_RE = re.compile(r'^\d{1,3}(?:\.\d{1,3}){3}$')
+
+# Адреса-заглушки в hosts-файлах и имена, которые там встречаются сами по себе
+HOSTS_SINK_NAMES = {'localhost', 'localhost.localdomain', 'local', 'broadcasthost',
+                    'ip6-localhost', 'ip6-loopback', '0.0.0.0'}
+
+PROGRESS_INTERVAL = 1.0  # секунд между строками прогресса
+CHECK_CHUNK = 500        # доменов на один вызов check_many
+
+
+def parse_list_line(line: str) -> list[str]:
+    """Имена хостов из строки списка (простой формат, hosts или adblock)."""
+    line = line.split('#', 1)[0].strip()
+    if not line or line.startswith('!') or line.startswith('['):
+        return []
+
+    fields = line.split()
+    if len(fields) > 1 and (IPV4_RE.match(fields[0]) or ':' in fields[0]):
+        names = fields[1:]  # hosts: адрес, затем одно или несколько имён
+    else:
+        names = fields[:1]
+
+    result = []
+    for name in names:
+        name = name.lower()
+        if name.startswith('||'):
+            name = name[2:].split('^', 1)[0]
+        name = name.removeprefix('*.').removeprefix('.').rstrip('.')
+        if name in HOSTS_SINK_NAMES or IPV4_RE.match(name):
+            continue
+        if is_hostname(name) and '.' in name and TLD_RE.fullmatch(name.rsplit('.', 1)[1]):
+            result.append(name)
+    return result
+
+
+class ImportStats:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.lines = 0
+        self.names = 0
+        self.ignored = 0    # служебные, системные, DIRECT
+        self.covered = 0    # уже маршрутизируются правилами
+        self.duplicates = 0
+        self.new = 0
+        self._last_report = self.started
+
+    def maybe_report(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._last_report < PROGRESS_INTERVAL:
+            return
+        self._last_report = now
+        elapsed = max(now - self.started, 1e-9)
+        print(f"[import] строк: {self.lines}, имён: {self.names}, новых: {self.new}, "
+              f"покрыто: {self.covered}, отброшено: {self.ignored}, "
+              f"повторов: {self.duplicates} — {self.lines / elapsed:,.0f} строк/с", flush=True)
+
+
+def iter_candidates(lines: Iterable[str], engine: RuleEngine,
+                    stats: ImportStats) -> Iterator[str]:
+    """Новые base-домены из потока строк, каждый — один раз."""
+    seen: set[str] = set()
+    for line in lines:
+        stats.lines += 1
+        for name in parse_list_line(line):
+            stats.names += 1
+            base = get_base_domain(name)
+            if base in seen:
+                stats.duplicates += 1
+                continue
+            seen.add(base)
+            if classify_domain(base) != CANDIDATE:
+                stats.ignored += 1
+            elif engine.covers(base):
+                stats.covered += 1
+            else:
+                stats.new += 1
+                yield base
+        stats.maybe_report()
+
+
+async def filter_blocked(domains: list[str], deadline: float) -> list[str]:
+    """Оставляет только заблокированные домены (параллельная проверка)."""
+    from checker import check_many
+
+    blocked = []
+    started = time.monotonic()
+    for i in range(0, len(domains), CHECK_CHUNK):
+        chunk = domains[i:i + CHECK_CHUNK]
+        async for result in check_many(chunk, deadline=deadline):
+            if result.blocked:
+                blocked.append(result.domain)
+        done = i + len(chunk)
+        rate = done / max(time.monotonic() - started, 1e-9)
+        print(f"[check] проверено: {done}/{len(domains)}, заблокировано: {len(blocked)} "
+              f"— {rate:,.1f} доменов/с", flush=True)
+    # Порядок — как во входном списке, а не как завершались проверки
+    order = {domain: i for i, domain in enumerate(domains)}
+    blocked.sort(key=order.__getitem__)
+    return blocked
+
+
+def open_source(path: str) -> TextIO:
+    if path == '-':
+        return open(sys.stdin.fileno(), encoding='utf-8', errors='ignore', closefd=False)
+    return open(path, encoding='utf-8', errors='ignore')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Массовый импорт доменов в конфиг Shadowrocket')
+    parser.add_argument('source', help="файл со списком доменов или hosts-файл ('-' — stdin)")
+    parser.add_argument('--config', default=str(CONFIG_FILE),
+                        help='путь к конфигу (по умолчанию shadsocks_in.conf)')
+    parser.add_argument('--policy', default='PROXY', help='политика новых правил')
+    parser.add_argument('--check', action='store_true',
+                        help='добавлять только домены, которые checker считает заблокированными')
+    parser.add_argument('--check-deadline', type=float, default=CHECK_BATCH_DEADLINE,
+                        help=f'секунд на пачку из {CHECK_CHUNK} проверок')
+    parser.add_argument('--write', action='store_true',
+                        help='записать результат (иначе только отчёт)')
+    args = parser.parse_args()
+
+    path = Path(args.config)
+    document = ConfigDocument.load(path)
+    engine = RuleEngine(document.rules())
+
+    stats = ImportStats()
+    with open_source(args.source) as source:
+        candidates = list(iter_candidates(source, engine, stats))
+    stats.maybe_report(force=True)
+
+    if args.check and candidates:
+        candidates = asyncio.run(filter_blocked(candidates, args.check_deadline))
+
+    if not candidates:
+        print('[import] Нечего добавлять')
+        return
+
+    added = document.add_domains(candidates, args.policy)
+    print(f'[import] Новых правил: {len(added)}')
+    if args.write:
+        # Одна атомарная запись; работающий демон подхватит правку сам
+        document.save(path)
+        print(f'[import] Записано в {path}')
+    else:
+        for rule in added[:20]:
+            print(f'  {rule.line}')
+        if len(added) > 20:
+            print(f'  ... и ещё {len(added) - 20}')
+        print('[import] Запустите с --write, чтобы записать')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+"""Фильтр захвата DNS: что отсечь в ядре, а что — до DomainTracker.
+
+BPF-выражение для tcpdump пропускает запросы (udp dst port 53), кроме
+точных имён из SYSTEM_DOMAINS и ignored_domains.txt: первое имя вопроса
+в IPv4-пакете лежит с фиксированного смещения udp[20], и его
+wire-формат сравнивается кусками по 4/2/1 байта. Ответы пропускаются
+целиком — из них берутся CNAME-цели (вопросы ответа парсер и так
+не отдаёт); для IPv4 — только с флагом QR, udp[] в libpcap к IPv6
+не применяется. DNS поверх TCP пропускается как есть.
+Суффиксы и поддомены так не выразить (длина префикса неизвестна),
+IPv6 — тоже (udp[] для ip6 поддерживают не все libpcap), их отсекает
+IngestFilter уже в Python: дубли одного имени в окне CAPTURE_DEDUP_MS,
+собственные запросы checker и игнорируемые категории доменов.
+"""
+
+import time
+
+from config import (
+    SYSTEM_DOMAINS,
+    CAPTURE_DEDUP_MS, CAPTURE_DEDUP_MAX_SIZE, CAPTURE_OWN_LOOKUP_TTL,
+    CAPTURE_BPF_MAX_NAMES, CAPTURE_REPORT_INTERVAL,
+)
+from config_updater import load_ignored_domains
+from domain_utils import get_base_domain, classify_domain, IGNORE, SYSTEM
+import metrics
+
+
+# Запросы идут на порт 53, ответы — с него (mDNS — 5353, не попадает)
+BPF_QUERIES = 'udp dst port 53'
+BPF_RESPONSES = 'udp src port 53 and (ip6 or udp[10] & 0x80 != 0)'  # udp[10] — флаг QR
+BPF_TCP = 'tcp port 53'
+
+# Смещение имени вопроса от начала UDP: 8 байт UDP + 12 байт заголовка DNS
+QNAME_OFFSET = 20
+
+# Больше стольких собственных имён не помним (вытесняются самые старые)
+OWN_LOOKUPS_MAX_SIZE = 4096
+
+
+def encode_qname(name: str) -> bytes | None:
+    """Имя в wire-формате DNS (метки с длиной и нулевой байт); None — не ASCII."""
+    try:
+        labels = name.strip('.').lower().encode('ascii').split(b'.')
+    except UnicodeEncodeError:
+        return None
+    if not all(0 < len(label) < 64 for label in labels):
+        return None
+    return b''.join(bytes([len(label)]) + label for label in labels) + b'\x00'
+
+
+def qname_clause(name: str) -> str | None:
+    """BPF-условие «имя вопроса равно name» (без учёта 0x20-регистра)."""
+    wire = encode_qname(name)
+    if wire is None:
+        return None
+    parts = []
+    pos = 0
+    while pos < len(wire):
+        size = 4 if len(wire) - pos >= 4 else 2 if len(wire) - pos >= 2 else 1
+        chunk = wire[pos:pos + size]
+        offset = QNAME_OFFSET + pos
+        index = f'udp[{offset}]' if size == 1 else f'udp[{offset}:{size}]'
+        parts.append(f'{index} = 0x{chunk.hex()}')
+        pos += size
+    return '(' + ' and '.join(parts) + ')'
+
+
+def bpf_exact_names() -> list[str]:
+    """Точные имена для ядра: системные домены и отклонённые пользователем."""
+    names = sorted(SYSTEM_DOMAINS) + sorted(load_ignored_domains() - SYSTEM_DOMAINS)
+    return names[:CAPTURE_BPF_MAX_NAMES]
+
+
+def build_bpf_filter(names: list[str] | None = None, responses: bool = True) -> str:
+    """
+    Выражение для tcpdump: запросы, кроме точных имён names (только IPv4),
+    ответы (ради CNAME-целей; responses=False — без них, для текстового
+    режима, где разбираются только строки запросов) и DNS поверх TCP.
+    """
+    if names is None:
+        names = bpf_exact_names()
+    clauses = [c for c in map(qname_clause, names) if c is not None]
+    queries = BPF_QUERIES
+    if clauses:
+        queries = f"{BPF_QUERIES} and not (ip and ({' or '.join(clauses)}))"
+    if not responses:
+        return f"({queries}) or ({BPF_TCP})"
+    return f"({queries}) or ({BPF_RESPONSES}) or ({BPF_TCP})"
+
+
+class OwnLookups:
+    """
+    Имена, которые демон резолвит сам (checker.resolve). Их запросы
+    видны в захвате и не должны выглядеть как действия пользователя.
+    """
+
+    def __init__(self, ttl: float = CAPTURE_OWN_LOOKUP_TTL):
+        self.ttl = ttl
+        self._names: dict[str, float] = {}  # имя → до какого момента своё, по возрастанию
+
+    def add(self, name: str) -> None:
+        now = time.monotonic()
+        self.expire(now)  # без захвата (bulk_import) чистить больше некому
+        names = self._names
+        name = name.lower()
+        names.pop(name, None)  # в конец: срок у всех одинаковый
+        if len(names) >= OWN_LOOKUPS_MAX_SIZE:
+            del names[next(iter(names))]
+        names[name] = now + self.ttl
+
+    def __contains__(self, name: str) -> bool:
+        until = self._names.get(name)
+        return until is not None and time.monotonic() < until
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def expire(self, now: float) -> None:
+        names = self._names
+        while names:
+            oldest = next(iter(names))
+            if names[oldest] > now:
+                break
+            del names[oldest]
+
+
+own_lookups = OwnLookups()
+
+
+class IngestFilter:
+    """
+    Пропускает имя из захвата в DomainTracker, если это не повтор в окне
+    window_ms, не собственный запрос демона и не игнорируемый домен.
+    Раз в секунду обновляет долю пропущенных (sr_capture_accept_ratio),
+    раз в report_interval печатает статистику.
+    """
+
+    def __init__(self, window_ms: int = CAPTURE_DEDUP_MS,
+                 own: OwnLookups = own_lookups,
+                 report_interval: float = CAPTURE_REPORT_INTERVAL):
+        self.window = window_ms / 1000
+        self.own = own
+        self.report_interval = report_interval
+        self.ignored = load_ignored_domains()
+        self._seen: dict[str, float] = {}  # имя → время пропуска, по возрастанию
+
+        now = time.monotonic()
+        self._second_end = now + 1
+        self._second = [0, 0]  # пропущено, отброшено за текущую секунду
+        self._report_end = now + report_interval
+        self._report = {'accepted': 0, 'duplicate': 0, 'own': 0, 'ignored': 0}
+
+    def _drop(self, reason: str) -> bool:
+        metrics.capture_dropped[reason].inc()
+        self._second[1] += 1
+        self._report[reason] += 1
+        return False
+
+    def accept(self, name: str, now: float | None = None) -> bool:
+        if now is None:
+            now = time.monotonic()
+        if now >= self._second_end:
+            self._tick(now)
+
+        seen = self._seen
+        # Словарь упорядочен по времени пропуска: истёкшие — в начале
+        while seen:
+            oldest = next(iter(seen))
+            if now - seen[oldest] < self.window and len(seen) < CAPTURE_DEDUP_MAX_SIZE:
+                break
+            del seen[oldest]
+        if name in seen:
+            return self._drop('duplicate')
+        if name in self.own:
+            return self._drop('own')
+        category = classify_domain(name)
+        if category == IGNORE or category == SYSTEM or get_base_domain(name) in self.ignored:
+            return self._drop('ignored')
+
+        seen[name] = now
+        metrics.capture_accepted.inc()
+        self._second[0] += 1
+        self._report['accepted'] += 1
+        return True
+
+    def _tick(self, now: float) -> None:
+        accepted, dropped = self._second
+        total = accepted + dropped
+        metrics.capture_accept_ratio.set(accepted / total if total else 1.0)
+        self._second = [0, 0]
+        self._second_end = now + 1
+        if now >= self._report_end:
+            self._log(now)
+
+    def _log(self, now: float) -> None:
+        report = self._report
+        total = sum(report.values())
+        if total:
+            span = self.report_interval + (now - self._report_end)
+            dropped = total - report['accepted']
+            print(f"[dns] {total / span:.1f} имён/с: пропущено {report['accepted'] / span:.1f}/с, "
+                  f"отброшено {dropped / span:.1f}/с ({100 * dropped / total:.0f}%; "
+                  f"дубли {report['duplicate']}, свои {report['own']}, "
+                  f"игнор {report['ignored']})")
+        self._report = dict.fromkeys(report, 0)
+        self._report_end = now + self.report_interval
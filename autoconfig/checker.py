@@ -1,99 +1,443 @@
-"""Проверка доступности доменов через TCP connect + HTTP check."""
+"""Проверка доступности доменов: TCP connect + TLS + HTTP на одном соединении."""
 
 import asyncio
 import socket
 import ssl
-import urllib.request
-import urllib.error
-from config import CHECK_TIMEOUT, CHECK_PORT, MAX_CONCURRENT_CHECKS
-
-
-_semaphore = asyncio.Semaphore(MAX_CONCURRENT_CHECKS)
-
-# Паттерны в теле ответа, указывающие на геоблокировку
-BLOCK_INDICATORS = [
-    # Cloudflare / WAF
-    'you have been blocked',
-    'access denied',
-    'blocked by',
-    # Геоблокировка
-    'not available in your country',
-    'not available in your region',
-    'geo restriction',
-    'this content is not available',
-    'unavailable in your location',
-    # Санкционные блокировки
-    'sanctioned countries',
-    'restricted countries',
-    'access from your country',
-    'your region is restricted',
-    'service is not available in your',
-    'restricted in your country',
-    'not supported in your country',
-    'blocked in your region',
-    'embargo',
-]
-
-
-def _http_check_blocked(domain: str) -> bool:
-    """
-    HTTP-проверка: запрос к домену и анализ ответа.
-    Возвращает True если сайт блокирует по геолокации.
-    """
-    ctx = ssl.create_default_context()
-    ctx.check_hostname = False
-    ctx.verify_mode = ssl.CERT_NONE
+import time
+from collections import deque
+from typing import AsyncIterator
+from config import (
+    CHECK_TIMEOUT, CHECK_PORT, MAX_CONCURRENT_CHECKS,
+    CHECK_MIN_CONCURRENCY, CHECK_MAX_CONCURRENCY, CHECK_PER_IP_CONCURRENCY,
+    CHECK_TIMEOUT_RATE_THRESHOLD, CHECK_BATCH_DEADLINE,
+    VERDICT_CACHE_FILE, VERDICT_POSITIVE_TTL, VERDICT_NEGATIVE_TTL, BLOCK_BODY_CAP,
+)
+from block_signatures import get_signatures, parse_head
+from capture_filter import own_lookups
+from verdict_cache import VerdictCache
+import metrics
+
+
+# Семафор создаётся внутри работающего цикла, а не при импорте
+_semaphore: asyncio.Semaphore | None = None
+
+MAX_HEADER_BYTES = 16384
+USER_AGENT = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7)'
+
+# Этапы проверки
+STAGE_DNS = 'dns'
+STAGE_CONNECT = 'connect'
+STAGE_TLS = 'tls'
+STAGE_HTTP = 'http'
+
+
+class ProbeResult:
+    """Итог проверки: вердикт, этап, на котором он получен, и тайминги этапов."""
+
+    __slots__ = ('domain', 'blocked', 'stage', 'reason', 'status', 'signature', 'confidence',
+                 'connect_time', 'tls_time', 'first_byte_time')
+
+    def __init__(self, domain: str):
+        self.domain = domain
+        self.blocked = False
+        self.stage = STAGE_DNS
+        self.reason = ''
+        self.status: int | None = None
+        self.signature: str | None = None  # сработавшее правило block_signatures
+        self.confidence = 0.0
+        self.connect_time: float | None = None
+        self.tls_time: float | None = None
+        self.first_byte_time: float | None = None
+
+    def finish(self, blocked: bool, reason: str) -> 'ProbeResult':
+        self.blocked = blocked
+        self.reason = reason
+        return self
+
+    def __repr__(self) -> str:
+        return (f'ProbeResult({self.domain!r}, blocked={self.blocked}, '
+                f'stage={self.stage!r}, reason={self.reason!r}, status={self.status})')
+
+
+_ssl_context: ssl.SSLContext | None = None
+
+
+def _get_ssl_context() -> ssl.SSLContext:
+    """Общий SSLContext: создание контекста дорогое, а сертификаты нам не важны."""
+    global _ssl_context
+    if _ssl_context is None:
+        ctx = ssl.create_default_context()
+        ctx.check_hostname = False
+        ctx.verify_mode = ssl.CERT_NONE
+        ctx.set_alpn_protocols(['http/1.1'])
+        _ssl_context = ctx
+    return _ssl_context
+
+
+class _ProbeProtocol(asyncio.Protocol):
+    """Копит начало ответа до лимита и будит ожидающего на каждом куске."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.buffer = bytearray()
+        self.closed = False
+        self._waiter: asyncio.Future | None = None
+
+    def data_received(self, data: bytes) -> None:
+        room = self.limit - len(self.buffer)
+        if room > 0:
+            self.buffer += data[:room]
+        self._wake()
 
-    req = urllib.request.Request(
-        f'https://{domain}/',
-        method='GET',
-        headers={'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7)'},
-    )
+    def eof_received(self) -> bool:
+        self.closed = True
+        self._wake()
+        return False
 
+    def connection_lost(self, exc: Exception | None) -> None:
+        self.closed = True
+        self._wake()
+
+    def _wake(self) -> None:
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def wait_data(self) -> None:
+        self._waiter = asyncio.get_running_loop().create_future()
+        try:
+            await self._waiter
+        finally:
+            self._waiter = None
+
+
+def is_block_page(status: int | None, body: bytes,
+                  headers: dict[str, str] | None = None) -> bool:
+    """Признаки геоблокировки в ответе по сигнатурам из block_signatures.json."""
+    return get_signatures().classify(status, headers or {}, body).blocked
+
+
+async def resolve(domain: str) -> tuple[int, tuple] | None | bool:
+    """(family, sockaddr) первого адреса; None — ошибка DNS, False — таймаут."""
+    loop = asyncio.get_running_loop()
+    own_lookups.add(domain)  # этот запрос увидит захват DNS
     try:
-        with urllib.request.urlopen(req, timeout=CHECK_TIMEOUT, context=ctx) as resp:
-            if resp.status in (403, 451):
-                body = resp.read(4096).decode('utf-8', errors='ignore').lower()
-                return any(ind in body for ind in BLOCK_INDICATORS)
-            return False  # 200/301/302 — доступен
-    except urllib.error.HTTPError as e:
-        if e.code == 451:
-            return True  # Unavailable For Legal Reasons — санкции
-        if e.code == 403:
-            body = e.read(4096).decode('utf-8', errors='ignore').lower()
-            return any(ind in body for ind in BLOCK_INDICATORS)
-        return False  # Другие HTTP ошибки — не геоблокировка
-    except (urllib.error.URLError, OSError, socket.timeout):
-        return False  # Сетевая ошибка — обработана в TCP-проверке
+        infos = await asyncio.wait_for(
+            loop.getaddrinfo(domain, CHECK_PORT, type=socket.SOCK_STREAM),
+            timeout=CHECK_TIMEOUT,
+        )
+    except asyncio.TimeoutError:
+        return False
+    except (socket.gaierror, OSError):
+        return None
+    except UnicodeError:
+        return None  # пустая или длиннее 63 символов метка: 'a..b.com'
+    if not infos:
+        return None
+    family, _, _, _, address = infos[0]
+    return family, address
 
 
-async def is_domain_blocked(domain: str) -> bool:
+async def probe_domain(domain: str, resolved: tuple[int, tuple] | None = None) -> ProbeResult:
     """
-    Проверяет, заблокирован ли домен.
+    Проверка на одном соединении с классификацией по этапам:
 
-    Этап 1: TCP connect к :443
-    - Timeout → заблокирован
-    - RST → заблокирован
+    - connect: timeout или RST → заблокирован
+    - TLS: RST/обрыв на ClientHello (типичный DPI) или timeout → заблокирован
+    - HTTP: статус, заголовки и тело по сигнатурам (block_signatures) —
+      451, 403 со страницей блокировки, редирект на гео-заглушку
 
-    Этап 2: HTTP GET (если TCP ok)
-    - 403 + "blocked" в теле → заблокирован (Cloudflare/гео)
+    DNS-ошибки, отказ в соединении и прочие ошибки — не блокировка.
     """
-    async with _semaphore:
-        # Этап 1: TCP connect
+    result = ProbeResult(domain)
+    loop = asyncio.get_running_loop()
+    clock = time.perf_counter
+
+    # DNS (если адрес не передан уже разрешённым)
+    if resolved is None:
+        resolved = await resolve(domain)
+        if resolved is False:
+            return result.finish(True, 'dns_timeout')
+        if resolved is None:
+            return result.finish(False, 'dns_error')
+    family, address = resolved
+
+    # TCP connect
+    result.stage = STAGE_CONNECT
+    protocol = _ProbeProtocol(MAX_HEADER_BYTES + BLOCK_BODY_CAP)
+    started = clock()
+    try:
+        transport, _ = await asyncio.wait_for(
+            loop.create_connection(lambda: protocol, address[0], address[1], family=family),
+            timeout=CHECK_TIMEOUT,
+        )
+    except asyncio.TimeoutError:
+        return result.finish(True, 'connect_timeout')
+    except ConnectionResetError:
+        return result.finish(True, 'connect_reset')
+    except OSError:
+        return result.finish(False, 'connect_error')
+    result.connect_time = clock() - started
+    metrics.checker_stage['connect'].observe(result.connect_time)
+
+    try:
+        # TLS на том же сокете
+        result.stage = STAGE_TLS
+        started = clock()
         try:
-            _, writer = await asyncio.wait_for(
-                asyncio.open_connection(domain, CHECK_PORT),
+            transport = await asyncio.wait_for(
+                loop.start_tls(transport, protocol, _get_ssl_context(), server_hostname=domain),
                 timeout=CHECK_TIMEOUT,
             )
-            writer.close()
-            await writer.wait_closed()
         except asyncio.TimeoutError:
-            return True  # Timeout → заблокирован
-        except ConnectionResetError:
-            return True  # RST → заблокирован DPI
-        except (socket.gaierror, ConnectionRefusedError, OSError):
-            return False  # DNS error / другое — не блокировка
-
-        # Этап 2: HTTP-проверка на геоблокировку
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, _http_check_blocked, domain)
+            return result.finish(True, 'tls_timeout')
+        except (ConnectionResetError, ssl.SSLEOFError, ssl.SSLZeroReturnError):
+            return result.finish(True, 'tls_reset')
+        except (ssl.SSLError, OSError):
+            return result.finish(False, 'tls_error')
+        result.tls_time = clock() - started
+        metrics.checker_stage['tls'].observe(result.tls_time)
+
+        # Минимальный HTTP/1.1 запрос; тело сканируется по мере прихода
+        # и дочитывается, только пока сигнатуры не дали ответа
+        result.stage = STAGE_HTTP
+        started = clock()
+        transport.write(
+            f'GET / HTTP/1.1\r\nHost: {domain}\r\nUser-Agent: {USER_AGENT}\r\n'
+            f'Accept: */*\r\nConnection: close\r\n\r\n'.encode('ascii', errors='ignore')
+        )
+        deadline = loop.time() + CHECK_TIMEOUT
+        scanner = None
+        scanned = 0
+        body_end = None  # конец тела по Content-Length, если он указан
+        try:
+            while True:
+                data = protocol.buffer
+                if result.first_byte_time is None and data:
+                    result.first_byte_time = clock() - started
+                    metrics.checker_stage['first_byte'].observe(result.first_byte_time)
+                if scanner is None:
+                    head_end = data.find(b'\r\n\r\n')
+                    if head_end >= 0:
+                        status, headers = parse_head(bytes(data[:head_end]))
+                        result.status = status
+                        scanner = get_signatures().scanner(status, headers)
+                        scanned = head_end + 4
+                        length = headers.get('content-length', '')
+                        if length.isdigit():
+                            body_end = scanned + int(length)
+                if scanner is not None and len(data) > scanned:
+                    scanner.feed(bytes(data[scanned:]))
+                    scanned = len(data)
+                if scanner is not None and scanner.done:
+                    break
+                if body_end is not None and len(data) >= body_end:
+                    break
+                if protocol.closed or len(data) >= protocol.limit:
+                    break
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                await asyncio.wait_for(protocol.wait_data(), timeout=remaining)
+        except asyncio.TimeoutError:
+            pass
+
+        if not protocol.buffer:
+            return result.finish(False, 'http_timeout')
+        if scanner is None:
+            return result.finish(False, 'ok')  # заголовок не пришёл целиком
+
+        verdict = scanner.verdict()
+        result.signature = verdict.rule
+        result.confidence = verdict.confidence
+        if verdict.blocked:
+            return result.finish(True, 'http_451' if result.status == 451 else 'block_page')
+        return result.finish(False, 'ok')
+    finally:
+        transport.abort()
+
+
+async def is_domain_blocked(domain: str) -> bool:
+    """Проверяет, заблокирован ли домен (см. probe_domain)."""
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(MAX_CONCURRENT_CHECKS)
+    async with _semaphore:
+        result = await probe_domain(domain)
+    return result.blocked
+
+
+# Исходы, которые считаются таймаутом для AIMD
+TIMEOUT_REASONS = {'dns_timeout', 'connect_timeout', 'tls_timeout', 'http_timeout'}
+
+# Таймаут резолвера говорит о сети/DNS, а не о домене — в кеш на сутки не кладём
+UNCACHED_REASONS = {'dns_timeout'}
+
+
+class _Aimd:
+    """Additive increase / multiplicative decrease по доле таймаутов в окне."""
+
+    def __init__(self, start: int, low: int, high: int, threshold: float):
+        self.limit = max(low, min(high, start))
+        self.low = low
+        self.high = high
+        self.threshold = threshold
+        self._done = 0
+        self._timeouts = 0
+
+    def observe(self, timed_out: bool) -> None:
+        self._done += 1
+        self._timeouts += timed_out
+        # Окно — текущая параллельность: решение примерно раз за «поколение»
+        if self._done < self.limit:
+            return
+        if self._timeouts / self._done > self.threshold:
+            self.limit = max(self.low, self.limit // 2)
+        else:
+            self.limit = min(self.high, self.limit + 1)
+        self._done = self._timeouts = 0
+
+
+async def check_many(
+    domains: list[str],
+    deadline: float = CHECK_BATCH_DEADLINE,
+    use_cache: bool = True,
+) -> AsyncIterator[ProbeResult]:
+    """
+    Проверяет пачку доменов и отдаёт результаты по мере готовности:
+
+        async for result in check_many(domains):
+            ...
+
+    - параллельность подстраивается AIMD по доле таймаутов
+    - домены группируются по IP: на один адрес не больше
+      CHECK_PER_IP_CONCURRENCY проверок одновременно, группы чередуются
+    - по истечении deadline незавершённые проверки отменяются и
+      отдаются с reason='deadline' (в кеш не попадают)
+    """
+    loop = asyncio.get_running_loop()
+    stop_at = loop.time() + deadline
+    cache = get_verdict_cache() if use_cache else None
+    aimd = _Aimd(MAX_CONCURRENT_CHECKS, CHECK_MIN_CONCURRENCY,
+                 CHECK_MAX_CONCURRENCY, CHECK_TIMEOUT_RATE_THRESHOLD)
+
+    pending: list[str] = []
+    for domain in dict.fromkeys(domains):
+        cached = cache.get(domain) if cache is not None else None
+        if cached is not None:
+            cache.hits += 1
+            yield ProbeResult(domain).finish(cached, 'cached')
+        else:
+            pending.append(domain)
+    if not pending:
+        return
+
+    # Разрешаем имена (ограниченно параллельно) и группируем по IP
+    resolve_limit = asyncio.Semaphore(CHECK_MAX_CONCURRENCY)
+
+    async def resolve_one(domain: str):
+        async with resolve_limit:
+            return domain, await resolve(domain)
+
+    groups: dict[str, deque] = {}
+    unresolved = set(pending)
+    resolve_tasks = [asyncio.ensure_future(resolve_one(d)) for d in pending]
+    try:
+        for next_done in asyncio.as_completed(resolve_tasks, timeout=max(0.0, stop_at - loop.time())):
+            domain, resolved = await next_done
+            unresolved.discard(domain)
+            if resolved is None or resolved is False:
+                timed_out = resolved is False
+                result = ProbeResult(domain).finish(
+                    timed_out, 'dns_timeout' if timed_out else 'dns_error')
+                _store(cache, result)
+                yield result
+            else:
+                groups.setdefault(resolved[1][0], deque()).append((domain, resolved))
+    except asyncio.TimeoutError:
+        for domain in unresolved:
+            yield ProbeResult(domain).finish(False, 'deadline')
+    finally:
+        # В том числе при aclose() генератора посреди разрешения имён
+        for task in resolve_tasks:
+            task.cancel()
+
+    # Очередь групп по кругу: соседние проверки идут на разные адреса
+    ring = deque(groups.items())
+    per_ip: dict[str, int] = {}
+    active: dict[asyncio.Task, tuple[str, str]] = {}  # task -> (ip, domain)
+
+    def next_candidate():
+        for _ in range(len(ring)):
+            ip, queue = ring[0]
+            ring.rotate(-1)
+            if queue and per_ip.get(ip, 0) < CHECK_PER_IP_CONCURRENCY:
+                return ip, queue.popleft()
+        return None
+
+    try:
+        while loop.time() < stop_at:
+            while len(active) < aimd.limit:
+                candidate = next_candidate()
+                if candidate is None:
+                    break
+                ip, (domain, resolved) = candidate
+                per_ip[ip] = per_ip.get(ip, 0) + 1
+                task = asyncio.ensure_future(probe_domain(domain, resolved))
+                active[task] = (ip, domain)
+            if not active:
+                break
+
+            done, _ = await asyncio.wait(
+                active, timeout=stop_at - loop.time(), return_when=asyncio.FIRST_COMPLETED,
+            )
+            for task in done:
+                ip, _ = active.pop(task)
+                per_ip[ip] -= 1
+                result = task.result()
+                aimd.observe(result.reason in TIMEOUT_REASONS)
+                _store(cache, result)
+                yield result
+    finally:
+        for task in active:
+            task.cancel()
+
+    # Дедлайн: всё, что не успели проверить, отдаём без вердикта
+    for _, domain in active.values():
+        yield ProbeResult(domain).finish(False, 'deadline')
+    for _, queue in ring:
+        for domain, _ in queue:
+            yield ProbeResult(domain).finish(False, 'deadline')
+
+
+def _store(cache: VerdictCache | None, result: ProbeResult) -> None:
+    if cache is not None:
+        cache.misses += 1
+        if result.reason not in UNCACHED_REASONS:
+            cache.put(result.domain, result.blocked)
+
+
+_verdict_cache: VerdictCache | None = None
+
+
+def get_verdict_cache() -> VerdictCache:
+    """Кеш вердиктов, открывается при первом обращении."""
+    global _verdict_cache
+    if _verdict_cache is None:
+        _verdict_cache = VerdictCache(
+            VERDICT_CACHE_FILE, VERDICT_POSITIVE_TTL, VERDICT_NEGATIVE_TTL,
+        )
+    return _verdict_cache
+
+
+async def check_domain(domain: str) -> bool:
+    """
+    is_domain_blocked() через персистентный кеш: повторные вопросы о домене
+    (в том числе после рестарта демона) не запускают новую проверку.
+    """
+    return await get_verdict_cache().check(domain, is_domain_blocked)
+
+
+metrics.CallbackMetric('sr_verdict_cache_hits_total', 'Ответов из кеша вердиктов',
+                       lambda: _verdict_cache.hits if _verdict_cache else 0, type='counter')
+metrics.CallbackMetric('sr_verdict_cache_misses_total', 'Промахов кеша вердиктов',
+                       lambda: _verdict_cache.misses if _verdict_cache else 0, type='counter')
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Компактизация правил shadsocks_in.conf.
+
+Shadowrocket проверяет правила по порядку на каждом соединении, поэтому
+лишние строки стоят задержки. Удаляются правила, без которых результат
+первого совпадения не меняется:
+
+1. Битые значения, которые не могут совпасть ни с одним хостом
+2. Правила после FINAL
+3. Затенённые: всё, что они матчат, раньше перехватывает другое правило
+4. Сквозные: без правила хост дойдёт до более широкого правила с той же
+   политикой, и по дороге не встретит правил с другой политикой
+
+С --promote-keywords DOMAIN-KEYWORD со значением-хостом ('github.com')
+заменяется на DOMAIN-SUFFIX. Это дешевле, но не строго эквивалентно:
+keyword матчил и 'github.com.example.net'.
+"""
+
+import argparse
+import bisect
+import re
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import CONFIG_FILE
+from config_document import ConfigDocument
+from rules import Rule, RuleEngine, DOMAIN_RULE_TYPES, HOSTNAME_RE, is_valid_value
+
+
+TLD_RE = re.compile(r'^(?:[a-z]{2,}|xn--[a-z0-9-]+)$')
+
+
+class CompactResult:
+    """Итог компактизации: что удалить и что заменить."""
+
+    def __init__(self):
+        self.removed: list[tuple[Rule, str]] = []   # (правило, причина)
+        self.promoted: list[tuple[Rule, Rule]] = []  # (keyword, suffix)
+
+    def report(self) -> str:
+        lines = []
+        for old, new in self.promoted:
+            lines.append(f'[promote] {old.line} -> {new.line}')
+        for rule, reason in self.removed:
+            lines.append(f'[remove] {rule.line}  ({reason})')
+        lines.append(
+            f'[compact] Удалено {len(self.removed)}, '
+            f'заменено {len(self.promoted)} правил'
+        )
+        return '\n'.join(lines)
+
+
+def is_hostname_keyword(rule: Rule) -> bool:
+    """DOMAIN-KEYWORD, который на самом деле имя хоста: 'github.com'."""
+    if rule.type != 'DOMAIN-KEYWORD' or '.' not in rule.value:
+        return False
+    if not HOSTNAME_RE.fullmatch(rule.value):
+        return False
+    return bool(TLD_RE.match(rule.value.rsplit('.', 1)[1]))
+
+
+def _shadowed_by(rule: Rule, engine: RuleEngine) -> Rule | None:
+    """Более раннее правило, перехватывающее всё, что матчит rule."""
+    if rule.type == 'DOMAIN-SUFFIX':
+        # Суффикс-предок или keyword, входящий в значение, покрывают
+        # и сам домен, и все его поддомены
+        hit = engine.match_suffix(rule.value)
+        if hit is not None and hit.type == 'DOMAIN-SUFFIX' and hit.position < rule.position:
+            return hit
+        hit = engine.match_keyword(rule.value)
+        if hit is not None and hit.position < rule.position:
+            return hit
+    elif rule.type == 'DOMAIN-KEYWORD':
+        hit = engine.match_keyword(rule.value)
+        if hit is not None and hit.position < rule.position:
+            return hit
+    elif rule.type == 'DOMAIN':
+        hit = engine.match(rule.value)
+        if hit is not None and hit[0].position < rule.position:
+            return hit[0]
+    return None
+
+
+class _FallthroughIndex:
+    """Индексы для поиска «куда упадёт хост, если правило убрать»."""
+
+    def __init__(self, rules: list[Rule], engine: RuleEngine):
+        self.engine = engine
+        self.by_suffix: dict[str, list[Rule]] = {}
+        # Позиции keyword-правил по политике
+        self.keywords: dict[str, list[int]] = {}
+        # Позиции IP-правил (GEOIP, IP-CIDR, ...): любое из них требует
+        # DNS-резолва, поэтому проход сквозь него — не эквивалентность
+        self.ip_rules: list[int] = []
+        self.final: Rule | None = engine.final
+
+        for rule in rules:
+            if rule.type == 'DOMAIN-SUFFIX':
+                self.by_suffix.setdefault(rule.value, []).append(rule)
+            elif rule.type == 'DOMAIN-KEYWORD':
+                self.keywords.setdefault(rule.policy, []).append(rule.position)
+            elif rule.type not in DOMAIN_RULE_TYPES and rule.type != 'FINAL':
+                self.ip_rules.append(rule.position)
+
+    @staticmethod
+    def _next_after(positions: list[int], position: int) -> int | None:
+        i = bisect.bisect_right(positions, position)
+        return positions[i] if i < len(positions) else None
+
+    def fallthrough(self, rule: Rule) -> Rule | None:
+        """
+        Правило с той же политикой, до которого дойдёт любой хост из
+        множества rule, если rule удалить. None — удалять нельзя.
+        """
+        inf = float('inf')
+        policy = rule.policy
+        cover: Rule | None = None
+        blocker = inf
+
+        def consider(other: Rule, covers: bool) -> None:
+            nonlocal cover, blocker
+            if other.position <= rule.position:
+                return
+            if other.policy != policy:
+                blocker = min(blocker, other.position)
+            elif covers and (cover is None or other.position < cover.position):
+                cover = other
+
+        # Суффиксы-предки (и сам суффикс) покрывают всё множество
+        labels = rule.value.split('.')
+        for i in range(len(labels)):
+            for other in self.by_suffix.get('.'.join(labels[i:]), ()):
+                consider(other, True)
+
+        # Keyword внутри значения покрывает всё множество
+        for other in self.engine.keywords_in(rule.value):
+            consider(other, True)
+
+        if rule.type == 'DOMAIN-SUFFIX':
+            # Вложенные правила и любые keyword перехватывают часть поддоменов
+            node = self.engine.suffix_node(rule.value)
+            stack = [node] if node is not None else []
+            while stack:
+                node = stack.pop()
+                for other in node.suffix + node.exact:
+                    consider(other, False)
+                stack.extend(node.children.values())
+            for kw_policy, positions in self.keywords.items():
+                if kw_policy != policy:
+                    nxt = self._next_after(positions, rule.position)
+                    if nxt is not None:
+                        blocker = min(blocker, nxt)
+        else:
+            node = self.engine.suffix_node(rule.value)
+            for other in node.exact if node is not None else ():
+                consider(other, True)
+
+        nxt = self._next_after(self.ip_rules, rule.position)
+        if nxt is not None:
+            blocker = min(blocker, nxt)
+        if self.final is not None:
+            consider(self.final, True)
+
+        if cover is not None and cover.position < blocker:
+            return cover
+        return None
+
+
+def compact_rules(rules: list[Rule], promote_keywords: bool = False) -> CompactResult:
+    """Вычисляет минимальный эквивалентный список правил."""
+    result = CompactResult()
+    rules = list(rules)
+
+    if promote_keywords:
+        for i, rule in enumerate(rules):
+            if is_hostname_keyword(rule):
+                new = Rule('DOMAIN-SUFFIX', rule.value, rule.policy,
+                           rule.position, rule.options)
+                result.promoted.append((rule, new))
+                rules[i] = new
+
+    alive = []
+    seen_final = None
+    for rule in rules:
+        if seen_final is not None:
+            result.removed.append((rule, f'после {seen_final.line}'))
+        elif rule.type in DOMAIN_RULE_TYPES and not is_valid_value(rule):
+            result.removed.append((rule, 'битое значение'))
+        else:
+            alive.append(rule)
+            if rule.type == 'FINAL':
+                seen_final = rule
+
+    # Затенённые правила: удаление не меняет семантику, независимо от политики
+    engine = RuleEngine(alive)
+    survivors = []
+    for rule in alive:
+        by = _shadowed_by(rule, engine)
+        if by is not None and by.key == rule.key:
+            result.removed.append((rule, 'дубликат'))
+        elif by is not None:
+            result.removed.append((rule, f'затенено {by.line}'))
+        else:
+            survivors.append(rule)
+
+    # Сквозные: только DOMAIN/DOMAIN-SUFFIX — множество keyword слишком широкое
+    index = _FallthroughIndex(survivors, RuleEngine(survivors))
+    for rule in survivors:
+        if rule.type not in ('DOMAIN', 'DOMAIN-SUFFIX'):
+            continue
+        to = index.fallthrough(rule)
+        if to is not None:
+            result.removed.append((rule, f'покрыто ниже {to.line}'))
+
+    result.removed.sort(key=lambda item: item[0].position)
+    return result
+
+
+def compact_document(document: ConfigDocument, promote_keywords: bool = False) -> CompactResult:
+    """Компактизирует документ на месте."""
+    result = compact_rules(document.rules(), promote_keywords)
+    for old, new in result.promoted:
+        document.replace_rule(old, new)
+    document.remove_rules([rule for rule, _ in result.removed])
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Компактизация правил Shadowrocket')
+    parser.add_argument('config', nargs='?', default=str(CONFIG_FILE),
+                        help='путь к конфигу (по умолчанию shadsocks_in.conf)')
+    parser.add_argument('--promote-keywords', action='store_true',
+                        help='заменять DOMAIN-KEYWORD с именем хоста на DOMAIN-SUFFIX')
+    parser.add_argument('--write', action='store_true',
+                        help='записать результат (иначе только отчёт)')
+    args = parser.parse_args()
+
+    from pathlib import Path
+    path = Path(args.config)
+    document = ConfigDocument.load(path)
+    before = len(document.rules())
+    result = compact_document(document, args.promote_keywords)
+    print(result.report())
+    print(f'[compact] Правил: {before} -> {len(document.rules())}')
+
+    if args.write:
+        document.save(path)
+        print(f'[compact] Записано в {path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
 """Настройки для shadowrocket-autoconfig."""
 
 import os
+import sys
 from pathlib import Path
 
 # Путь к репозиторию с конфигом
@@ -15,11 +16,36 @@ CONFIG_FILE = REPO_PATH / "shadsocks_in.conf"
 # Путь к файлу игнорируемых доменов
 IGNORED_DOMAINS_FILE = Path(os.path.dirname(os.path.abspath(__file__))) / "ignored_domains.txt"
 
+# Снимок Public Suffix List (https://publicsuffix.org/list/public_suffix_list.dat)
+PUBLIC_SUFFIX_LIST_FILE = Path(os.path.dirname(os.path.abspath(__file__))) / "public_suffix_list.dat"
+
+# Захват DNS: 'pcap' — бинарный разбор `tcpdump -w -`, 'text' — regex по тексту
+DNS_CAPTURE_MODE = os.environ.get("SR_CAPTURE_MODE", "pcap")
+
+# Фильтр захвата: ответы и точные имена из списков отсекает BPF в ядре,
+# остальное — фильтр до DomainTracker (дубли, собственные запросы checker, игнор)
+CAPTURE_DEDUP_MS = 1000          # одно имя чаще раза в столько мс не пропускаем
+CAPTURE_DEDUP_MAX_SIZE = 10000   # имён в окне дедупликации
+CAPTURE_OWN_LOOKUP_TTL = 10      # секунд считать запрос имени своим после resolve()
+CAPTURE_BPF_MAX_NAMES = 64       # точных имён в BPF-выражении (длина фильтра)
+CAPTURE_REPORT_INTERVAL = 60     # секунд между строками статистики в лог
+
 # TCP-проверка доступности
 CHECK_TIMEOUT = 2  # секунды (если за 2с нет ответа — заблокирован)
 CHECK_PORT = 443
 MAX_CONCURRENT_CHECKS = 10
 
+# check_many: адаптивная (AIMD) параллельность по доле таймаутов
+CHECK_MIN_CONCURRENCY = 2
+CHECK_MAX_CONCURRENCY = 64
+CHECK_PER_IP_CONCURRENCY = 2      # не больше проверок на один IP (CDN edge)
+CHECK_TIMEOUT_RATE_THRESHOLD = 0.3  # выше — делим параллельность пополам
+CHECK_BATCH_DEADLINE = 60         # секунд на весь пакет
+
+# Сигнатуры страниц блокировки (статус, заголовки, тело ответа)
+BLOCK_SIGNATURES_FILE = Path(os.path.dirname(os.path.abspath(__file__))) / "block_signatures.json"
+BLOCK_BODY_CAP = 8192  # байт тела, которые сканируются не дальше
+
 # Российские TLD — идут DIRECT, не проверяем
 DIRECT_TLDS = {
     '.ru', '.su', '.xn--p1ai',  # .рф
@@ -43,5 +69,66 @@ IGNORED_SUFFIXES = {
 # Минимальная длина домена для проверки
 MIN_DOMAIN_LENGTH = 4
 
+# Размер LRU-кеша для get_base_domain / classify_domain
+DOMAIN_CACHE_SIZE = 8192
+
 # Интервал дедупликации (секунды) — не проверять один домен чаще
 DEDUP_TTL = 3600  # 1 час
+
+# Кеш вердиктов checker: заблокированные домены стабильны, доступные
+# перепроверяем через DEDUP_TTL
+VERDICT_CACHE_FILE = Path(os.path.dirname(os.path.abspath(__file__))) / "verdicts.sqlite3"
+VERDICT_POSITIVE_TTL = 24 * 3600  # вердикт "заблокирован"
+VERDICT_NEGATIVE_TTL = DEDUP_TTL  # вердикт "доступен"
+
+# Публикация изменений: окно сбора добавлений перед одним commit/push
+PUBLISH_WINDOW = 5       # секунд тишины после последнего добавления
+PUBLISH_MAX_DELAY = 30   # но не дольше этого от первого добавления
+PUSH_RETRIES = 5
+PUSH_BACKOFF = 2         # секунд, удваивается на каждой попытке
+PUBLISH_RETRY_DELAY = 60        # неудачная публикация: повтор через столько секунд,
+PUBLISH_RETRY_MAX_DELAY = 1800  # удваивая паузу до этого предела
+
+# Снимок окна DNS-истории: после рестарта /add сразу видит связанные домены
+SNAPSHOT_FILE = Path(os.path.dirname(os.path.abspath(__file__))) / "state.snapshot"
+SNAPSHOT_INTERVAL = 30   # секунд между снимками
+
+# Экспорт правил в DOMAIN-SET/RULE-SET по политикам (export_rulesets.py)
+RULESET_DIR = REPO_PATH / "rulesets"
+RULESET_SLIM_CONFIG = REPO_PATH / "shadsocks_slim.conf"
+RULESET_BASE_URL = os.environ.get(
+    "SR_RULESET_BASE_URL",
+    "https://raw.githubusercontent.com/0legSan/Shadowrocket-Russia-config/main/rulesets",
+)
+
+# Горячая перезагрузка конфига после git pull или ручной правки
+CONFIG_POLL_INTERVAL = 2  # секунд между stat() файла конфига
+
+# Перепроверка существующих PROXY-правил: не нужны ли они ещё
+REVALIDATE_INTERVAL = 24 * 3600   # секунд между началами прогонов
+REVALIDATE_RATE = 0.5             # проверок в секунду
+REVALIDATE_CONCURRENCY = 2        # одновременных проверок (остальное — живым запросам)
+REVALIDATE_PRUNE_RUNS = 3         # столько прогонов подряд доступен — предложить удалить
+REVALIDATE_CHECKPOINT_FILE = Path(os.path.dirname(os.path.abspath(__file__))) / "revalidate.json"
+REVALIDATE_PROPOSAL_FILE = Path(os.path.dirname(os.path.abspath(__file__))) / "prune_proposal.txt"
+REVALIDATE_VPN_RETRY = 600        # VPN подключён — проверять напрямую нельзя, ждём столько секунд
+VPN_STATUS_TTL = 30               # секунд кешировать состояние VPN
+
+# VPN-сервис Shadowrocket в macOS (scutil --nc)
+VPN_SERVICE = "Shadowrocket"
+
+# Уведомления: сколько копить найденные домены перед одним диалогом
+NOTIFY_BACKEND = os.environ.get("SR_NOTIFY_BACKEND", "osascript" if sys.platform == "darwin" else "console")
+NOTIFY_WINDOW = 10       # секунд тишины после последнего найденного домена
+NOTIFY_MAX_DELAY = 30    # но не дольше этого от первого
+NOTIFY_TIMEOUT = 60      # секунд на ответ пользователя
+GUI_USER_TTL = 300       # секунд кешировать пользователя GUI-сессии
+
+# Автоматическое обнаружение: DNS → фильтр → checker → уведомление → запись
+AUTO_DETECT = os.environ.get("SR_AUTO_DETECT", "0") == "1"  # по умолчанию выключено: SR_AUTO_DETECT=1
+PIPELINE_INGEST_QUEUE = 4096   # имён из tcpdump ждут фильтра (старые вытесняются)
+PIPELINE_CHECK_QUEUE = 256     # доменов ждут проверки (старые вытесняются)
+PIPELINE_NOTIFY_QUEUE = 256    # заблокированных доменов ждут уведомления
+PIPELINE_WRITE_QUEUE = 64      # решений пользователя ждут записи
+PIPELINE_CHECK_WORKERS = 4     # одновременных проверок из конвейера
+PIPELINE_DEDUP_MAX_SIZE = 50000  # доменов в окне дедупликации DEDUP_TTL
@@ -0,0 +1,202 @@
+"""Модель документа shadsocks_in.conf: секции, блоки правил, атомарная запись."""
+
+import os
+import tempfile
+from pathlib import Path
+
+from rules import Rule, parse_rule, is_writable
+
+
+# Комментарий, перед которым вставляются новые PROXY-правила
+PROXY_MARKER = '// Proxy'
+
+
+class Entry:
+    """Строка секции: исходный текст и разобранное правило (если это правило)."""
+
+    __slots__ = ('text', 'rule')
+
+    def __init__(self, text: str, rule: Rule | None = None):
+        self.text = text
+        self.rule = rule
+
+
+class Section:
+    """Секция конфига, например [Rule] или [Host]."""
+
+    def __init__(self, name: str | None, header: str | None = None):
+        self.name = name        # None — строки до первого заголовка
+        self.header = header
+        self.entries: list[Entry] = []
+
+
+class ConfigDocument:
+    """
+    Конфиг, разобранный один раз на секции и правила.
+    Строки, которые не трогаем, записываются обратно как есть.
+    """
+
+    def __init__(self, sections: list[Section], trailing_newline: bool = True):
+        self.sections = sections
+        self.trailing_newline = trailing_newline
+        self.renumber()
+
+    @classmethod
+    def parse(cls, text: str) -> 'ConfigDocument':
+        sections = [Section(None)]
+        for line in text.splitlines():
+            stripped = line.strip()
+            if stripped.startswith('[') and stripped.endswith(']'):
+                sections.append(Section(stripped[1:-1], line))
+                continue
+            section = sections[-1]
+            rule = parse_rule(stripped) if section.name == 'Rule' else None
+            section.entries.append(Entry(line, rule))
+        return cls(sections, trailing_newline=text.endswith('\n'))
+
+    @classmethod
+    def load(cls, path: Path) -> 'ConfigDocument':
+        if not path.exists():
+            return cls([Section(None), Section('Rule', '[Rule]')])
+        return cls.parse(path.read_text(encoding='utf-8'))
+
+    def section(self, name: str) -> Section | None:
+        for section in self.sections:
+            if section.name == name:
+                return section
+        return None
+
+    def rules(self) -> list[Rule]:
+        """Правила секции [Rule] в порядке первого совпадения."""
+        section = self.section('Rule')
+        if section is None:
+            return []
+        return [e.rule for e in section.entries if e.rule is not None]
+
+    def renumber(self) -> None:
+        """Проставляет rule.position по текущему порядку секции [Rule]."""
+        # Перенумерация сохраняет относительный порядок, поэтому индексы
+        # RuleEngine, ссылающиеся на те же объекты Rule, остаются валидными
+        for position, rule in enumerate(self.rules()):
+            rule.position = position
+
+    def _insert_index(self, entries: list[Entry]) -> int:
+        """Куда вставлять: перед '// Proxy', иначе перед FINAL, иначе в конец."""
+        for i, entry in enumerate(entries):
+            if entry.text.strip() == PROXY_MARKER:
+                return i
+        for i, entry in enumerate(entries):
+            if entry.rule is not None and entry.rule.type == 'FINAL':
+                return i
+        # В конец секции, но перед хвостовыми пустыми строками
+        i = len(entries)
+        while i and not entries[i - 1].text.strip():
+            i -= 1
+        return i
+
+    def add_rules(self, rules: list[Rule]) -> list[Rule]:
+        """
+        Вставляет правила одним проходом. Правила с тем же типом и
+        значением, что уже есть в конфиге, пропускаются; так же — правила,
+        которые нельзя записать одной строкой (см. rules.is_writable):
+        имя с запятой или переводом строки испортило бы секцию.
+        Возвращает фактически добавленные правила.
+        """
+        section = self.section('Rule')
+        if section is None:
+            section = Section('Rule', '[Rule]')
+            self.sections.insert(1, section)
+
+        existing = {(r.type, r.value) for r in self.rules()}
+        new_entries = []
+        added = []
+        for rule in rules:
+            if (rule.type, rule.value) in existing or not is_writable(rule):
+                continue
+            existing.add((rule.type, rule.value))
+            new_entries.append(Entry(rule.line, rule))
+            added.append(rule)
+
+        if added:
+            i = self._insert_index(section.entries)
+            section.entries[i:i] = new_entries
+            self.renumber()
+        return added
+
+    def add_domains(self, domains: list[str], policy: str = 'PROXY') -> list[Rule]:
+        """Добавляет DOMAIN-SUFFIX правила для списка доменов."""
+        return self.add_rules([
+            Rule('DOMAIN-SUFFIX', d.lower(), policy) for d in domains
+        ])
+
+    def remove_rules(self, rules: list[Rule]) -> None:
+        """Удаляет строки указанных правил (сравнение по объекту)."""
+        doomed = {id(r) for r in rules}
+        section = self.section('Rule')
+        if section is None or not doomed:
+            return
+        section.entries = [
+            e for e in section.entries
+            if e.rule is None or id(e.rule) not in doomed
+        ]
+        self.renumber()
+
+    def replace_rule(self, old: Rule, new: Rule) -> None:
+        """Заменяет правило на месте, сохраняя его позицию."""
+        section = self.section('Rule')
+        for entry in section.entries if section else []:
+            if entry.rule is old:
+                entry.text = new.line
+                entry.rule = new
+                new.position = old.position
+                return
+        raise ValueError(f'rule not in document: {old.line}')
+
+    def render(self) -> str:
+        lines = []
+        for section in self.sections:
+            if section.header is not None:
+                lines.append(section.header)
+            lines.extend(e.text for e in section.entries)
+        text = '\n'.join(lines)
+        return text + '\n' if self.trailing_newline else text
+
+    def save(self, path: Path) -> None:
+        atomic_write(path, self.render())
+
+
+def atomic_write(path: Path, content: str | bytes) -> None:
+    """Пишет файл через temp + fsync + rename: файл либо старый, либо новый."""
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    directory = path.parent
+    fd, tmp_name = tempfile.mkstemp(prefix=f'.{path.name}.', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        if path.exists():
+            # Демон работает от root, а репозиторий принадлежит пользователю
+            st = path.stat()
+            os.chmod(tmp_name, st.st_mode & 0o7777)
+            try:
+                os.chown(tmp_name, st.st_uid, st.st_gid)
+            except PermissionError:
+                pass
+        else:
+            os.chmod(tmp_name, 0o644)
+        os.replace(tmp_name, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except FileNotFoundError:
+            pass
+        raise
+
+    # fsync каталога, чтобы rename пережил сбой питания
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
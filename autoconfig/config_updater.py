@@ -1,24 +1,55 @@
 """Обновление конфига Shadowrocket и push в GitHub."""
 
 import asyncio
+import time
 from config import CONFIG_FILE, REPO_PATH, IGNORED_DOMAINS_FILE
+from config_document import ConfigDocument, atomic_write
+from rules import Rule
+import metrics
 
 
-def load_config_domains() -> set[str]:
-    """Загружает все домены из текущего конфига (PROXY и DIRECT)."""
-    domains = set()
-    if not CONFIG_FILE.exists():
-        return domains
+# Кеш разобранного конфига: (st_mtime_ns, st_size, документ)
+_document_cache: tuple[int, int, ConfigDocument] | None = None
 
-    for line in CONFIG_FILE.read_text(encoding='utf-8').splitlines():
-        line = line.strip()
-        if line.startswith('DOMAIN-SUFFIX,') or line.startswith('DOMAIN-KEYWORD,'):
-            parts = line.split(',')
-            if len(parts) >= 2:
-                domain = parts[1].strip().lstrip('.')
-                if domain:
-                    domains.add(domain.lower())
-    return domains
+
+def _file_signature() -> tuple[int, int]:
+    try:
+        st = CONFIG_FILE.stat()
+    except FileNotFoundError:
+        return (0, 0)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def get_document() -> ConfigDocument:
+    """
+    Возвращает разобранный конфиг. Файл перечитывается только если
+    изменился на диске (mtime/size), иначе берётся из памяти.
+    """
+    global _document_cache
+    signature = _file_signature()
+    if _document_cache is not None and _document_cache[:2] == signature:
+        return _document_cache[2]
+    document = ConfigDocument.load(CONFIG_FILE)
+    _document_cache = (*signature, document)
+    return document
+
+
+def document_signature(document: ConfigDocument) -> tuple[int, int] | None:
+    """(mtime_ns, size) файла, которому соответствует документ, или None."""
+    if _document_cache is not None and _document_cache[2] is document:
+        return _document_cache[:2]
+    return None
+
+
+def is_current(document: ConfigDocument) -> bool:
+    """True если документ соответствует файлу на диске (без чтения файла)."""
+    return document_signature(document) == _file_signature()
+
+
+def adopt_document(signature: tuple[int, int], document: ConfigDocument) -> None:
+    """Принимает готовый документ (например, от ConfigWatcher) как разбор текущего файла."""
+    global _document_cache
+    _document_cache = (*signature, document)
 
 
 def load_ignored_domains() -> set[str]:
@@ -38,39 +69,93 @@ def save_ignored_domain(domain: str) -> None:
         f.write(domain + '\n')
 
 
+def add_domains_to_config(domains: list[str]) -> list[Rule]:
+    """
+    Добавляет DOMAIN-SUFFIX правила перед строкой '// Proxy' за одну запись.
+    Уже существующие правила пропускаются. Возвращает добавленные правила.
+    """
+    global _document_cache
+    document = get_document()
+    added = document.add_domains(domains)
+    if added:
+        try:
+            document.save(CONFIG_FILE)
+        except BaseException:
+            document.remove_rules(added)  # в памяти — то же, что на диске
+            raise
+        _document_cache = (*_file_signature(), document)
+    return added
+
+
+# Записи файла идут по очереди: поздний снимок не обгонит ранний
+_write_lock = asyncio.Lock()
+
+
+async def add_domains_to_config_async(domains: list[str]) -> list[Rule]:
+    """
+    То же, что add_domains_to_config, но запись файла — в отдельном потоке.
+    Документ меняется на цикле событий, в поток уходит только готовый текст,
+    поэтому индексы, читающие позиции правил, не видят гонок. Если запись
+    не удалась, добавленные правила убираются из документа: иначе кеш
+    считал бы их уже записанными и они никогда не попали бы на диск.
+    """
+    global _document_cache
+    async with _write_lock:
+        # Правка и запись под одной блокировкой: текст следующей записи
+        # не включит правила, которые откатываются после ошибки этой
+        document = get_document()
+        added = document.add_domains(domains)
+        if added:
+            content = document.render()
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(atomic_write, CONFIG_FILE, content)
+            except BaseException:
+                document.remove_rules(added)
+                raise
+            metrics.config_write.observe(time.perf_counter() - started)
+            _document_cache = (*_file_signature(), document)
+    return added
+
+
 def add_domain_to_config(domain: str) -> None:
-    """Добавляет DOMAIN-SUFFIX правило в конфиг перед строкой '// Proxy'."""
-    content = CONFIG_FILE.read_text(encoding='utf-8')
-    new_rule = f'DOMAIN-SUFFIX,{domain},PROXY\n'
-
-    # Вставляем перед "// Proxy" если есть, иначе перед FINAL
-    if '// Proxy' in content:
-        content = content.replace('// Proxy\n', new_rule + '// Proxy\n')
-    elif 'FINAL,' in content:
-        content = content.replace('FINAL,', new_rule + 'FINAL,')
-    else:
-        # Добавляем в конец секции [Rule]
-        content = content.replace('[Host]', new_rule + '\n[Host]')
-
-    CONFIG_FILE.write_text(content, encoding='utf-8')
-
-
-async def git_push(domain: str) -> bool:
-    """Коммитит и пушит изменения в GitHub."""
-    commands = [
-        ['git', '-C', str(REPO_PATH), 'add', str(CONFIG_FILE.name)],
-        ['git', '-C', str(REPO_PATH), 'commit', '-m', f'Add {domain} to proxy'],
-        ['git', '-C', str(REPO_PATH), 'push'],
-    ]
-
-    for cmd in commands:
-        proc = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.DEVNULL,
-            stderr=asyncio.subprocess.PIPE,
-        )
-        _, stderr = await proc.communicate()
-        if proc.returncode != 0:
-            print(f"[git error] {' '.join(cmd)}: {stderr.decode()}")
-            return False
+    """Добавляет одно DOMAIN-SUFFIX правило в конфиг."""
+    add_domains_to_config([domain])
+
+
+async def _git(*args: str) -> tuple[int, str]:
+    """Запускает git в репозитории конфига. Возвращает (код, stderr)."""
+    proc = await asyncio.create_subprocess_exec(
+        'git', '-C', str(REPO_PATH), *args,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    _, stderr = await proc.communicate()
+    return proc.returncode, stderr.decode(errors='ignore')
+
+
+async def git_commit(message: str) -> bool:
+    """Коммитит конфиг. Нечего коммитить — тоже успех."""
+    code, stderr = await _git('add', CONFIG_FILE.name)
+    if code != 0:
+        print(f"[git error] add: {stderr}")
+        return False
+    # diff --cached --quiet: 0 — изменений нет, 1 — есть
+    code, _ = await _git('diff', '--cached', '--quiet')
+    if code == 0:
+        return True
+    code, stderr = await _git('commit', '-m', message)
+    if code != 0:
+        print(f"[git error] commit: {stderr}")
+        return False
     return True
+
+
+async def git_push_remote() -> bool:
+    """Пушит текущую ветку в её upstream."""
+    code, stderr = await _git('push')
+    if code != 0:
+        print(f"[git error] push: {stderr}")
+        return False
+    return True
+
@@ -0,0 +1,144 @@
+"""Горячая перезагрузка конфига: опрос stat и применение только изменённых правил."""
+
+import asyncio
+import difflib
+import os
+from pathlib import Path
+
+from config import CONFIG_FILE, CONFIG_POLL_INTERVAL
+from config_document import ConfigDocument
+from config_updater import adopt_document, document_signature
+from rules import Rule, RuleEngine, compile_keywords
+
+
+# Если поменялось больше этой доли правил, индекс дешевле построить заново
+FULL_REBUILD_SHARE = 0.5
+
+
+def file_state(path: Path) -> tuple[int, int, int] | None:
+    """(inode, mtime_ns, size) — os.replace и git checkout меняют inode."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+class ReloadPlan:
+    """Результат разбора и сравнения, подготовленный вне цикла событий."""
+
+    def __init__(self, document: ConfigDocument, signature: tuple[int, int],
+                 removed: list[Rule], inserted: list[Rule], engine: RuleEngine | None,
+                 keywords=None):
+        self.document = document
+        self.signature = signature
+        self.removed = removed
+        self.inserted = inserted
+        self.engine = engine      # готовый индекс, если изменений слишком много
+        self.keywords = keywords  # новый автомат, если менялись DOMAIN-KEYWORD
+
+
+def plan_reload(path: Path, old_rules: list[Rule]) -> ReloadPlan:
+    """
+    Читает и разбирает конфиг, сравнивает правила со старыми.
+    Совпавшие правила в новом документе заменяются старыми объектами Rule,
+    поэтому в индексе остаётся только удалить и вставить разницу.
+    Работает в отдельном потоке: старые правила только читаются.
+    """
+    st = os.stat(path)
+    signature = (st.st_mtime_ns, st.st_size)
+    document = ConfigDocument.load(path)
+
+    section = document.section('Rule')
+    entries = [e for e in section.entries if e.rule is not None] if section else []
+    new_lines = [e.rule.line for e in entries]
+    old_lines = [r.line for r in old_rules]
+
+    removed: list[Rule] = []
+    inserted: list[Rule] = []
+    equal = []
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            equal.append((i1, i2, j1))
+        else:
+            removed.extend(old_rules[i1:i2])
+            inserted.extend(e.rule for e in entries[j1:j2])
+
+    if len(removed) + len(inserted) > max(len(old_rules), 1) * FULL_REBUILD_SHARE:
+        return ReloadPlan(document, signature, removed, inserted, RuleEngine(document.rules()))
+
+    for i1, i2, j1 in equal:
+        for old, entry in zip(old_rules[i1:i2], entries[j1:]):
+            entry.rule = old
+
+    # Переходы и fail-ссылки автомата — самая дорогая часть, строим здесь;
+    # лучшие выходы пересчитаются на цикле после перенумерации
+    keywords = None
+    if any(r.type == 'DOMAIN-KEYWORD' for r in (*removed, *inserted)):
+        keywords = compile_keywords([e.rule for e in entries])
+    return ReloadPlan(document, signature, removed, inserted, None, keywords)
+
+
+class ConfigWatcher:
+    """
+    Следит за shadsocks_in.conf (git pull, ручная правка) и обновляет
+    DomainTracker без рестарта.
+
+    Раз в interval секунд — один stat(). Чтение, разбор и diff идут в
+    отдельном потоке; на цикле событий остаются только перенумерация и
+    вставка/удаление изменившихся правил в индексе. inotify в stdlib нет,
+    а демон живёт на macOS, поэтому опрос — единственный механизм.
+    """
+
+    def __init__(self, tracker, path: Path = CONFIG_FILE, interval: float = CONFIG_POLL_INTERVAL):
+        self.tracker = tracker
+        self.path = path
+        self.interval = interval
+        self._state = file_state(path)
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.check()
+            except (OSError, UnicodeDecodeError) as e:
+                print(f"[config] Не удалось перечитать конфиг: {e}")
+
+    async def check(self) -> bool:
+        """Применяет внешние изменения конфига. True — индекс обновлён."""
+        state = file_state(self.path)
+        if state == self._state:
+            return False
+        self._state = state
+        if state is None:
+            return False
+
+        tracker = self.tracker
+        # Наша собственная запись (add_domains) — документ уже актуален
+        if document_signature(tracker.document) == state[1:]:
+            return False
+
+        generation = tracker.generation
+        plan = await asyncio.to_thread(plan_reload, self.path, tracker.rules.rules)
+        if tracker.generation != generation:
+            # Пока шёл разбор, трекер сам поменял конфиг — повторим на следующем тике
+            self._state = None
+            return False
+
+        self.apply(plan)
+        return True
+
+    def apply(self, plan: ReloadPlan) -> None:
+        tracker = self.tracker
+        if plan.engine is not None:
+            tracker.rules = plan.engine
+        else:
+            # Порядок сохранившихся правил не меняется, индексы остаются валидными
+            plan.document.renumber()
+            tracker.rules.apply_changes(plan.removed, plan.inserted, plan.keywords)
+        tracker.document = plan.document
+        tracker.generation += 1
+        adopt_document(plan.signature, plan.document)
+        print(f"[config] Конфиг изменён снаружи: +{len(plan.inserted)} "
+              f"-{len(plan.removed)} правил, всего {len(tracker.rules)}")
@@ -0,0 +1,161 @@
+"""Индекс совместной встречаемости DNS-имён по временным корзинам."""
+
+import math
+import time
+from collections import OrderedDict
+
+from domain_utils import get_base_domain
+
+
+# Хост, который есть в большей доле живых корзин, — фон (push, телеметрия),
+# а не ресурс сайта. Решаем так только при достаточно длинной истории.
+BACKGROUND_SHARE = 0.5
+
+
+class Related:
+    """Хост, резолвившийся рядом по времени с запросами сайта."""
+
+    __slots__ = ('host', 'score', 'proximity', 'hits')
+
+    def __init__(self, host: str):
+        self.host = host
+        self.score = 0.0                # сила связи с сайтом
+        self.proximity = math.inf       # минимальный разрыв с запросом сайта, секунд
+        self.hits = 0                   # скольких запросов сайта хост оказался рядом
+
+    def __repr__(self) -> str:
+        return f'Related({self.host!r}, score={self.score:.2f}, proximity={self.proximity:.2f})'
+
+
+class CooccurrenceIndex:
+    """
+    DNS-запросы, разложенные по корзинам по bucket секунд, и индекс
+    «base-домен → корзины, где он резолвился».
+
+    Связанные с сайтом хосты ищутся только в корзинах сайта и соседних
+    (radius корзин в каждую сторону), без прохода по всей истории.
+    Корзины старше ttl и сверх max_size записей вытесняются с головы.
+    """
+
+    def __init__(self, bucket: float, radius: int, ttl: float, max_size: int):
+        self.bucket = bucket
+        self.radius = radius
+        self.ttl = ttl
+        self.max_size = max_size
+
+        # id корзины -> {хост: время последнего запроса в этой корзине}
+        self._buckets: OrderedDict[int, dict[str, float]] = OrderedDict()
+        # base-домен -> упорядоченное множество id корзин
+        self._by_base: dict[str, dict[int, None]] = {}
+        # хост -> в скольких живых корзинах встречается (для фона)
+        self._spread: dict[str, int] = {}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, host: str, now: float | None = None) -> None:
+        if now is None:
+            now = time.monotonic()
+        bucket_id = int(now // self.bucket)
+        bucket = self._buckets.get(bucket_id)
+        if bucket is None:
+            bucket = self._buckets[bucket_id] = {}
+        if host not in bucket:
+            self._size += 1
+            self._spread[host] = self._spread.get(host, 0) + 1
+            self._by_base.setdefault(get_base_domain(host), {})[bucket_id] = None
+        bucket[host] = now
+
+        while self._size > self.max_size and len(self._buckets) > 1:
+            self._evict_oldest()
+        self.expire(now)
+
+    def expire(self, now: float | None = None) -> None:
+        if now is None:
+            now = time.monotonic()
+        oldest = int((now - self.ttl) // self.bucket)
+        while self._buckets and next(iter(self._buckets)) < oldest:
+            self._evict_oldest()
+
+    def events(self) -> list[tuple[str, float]]:
+        """Все (хост, время) живого окна в порядке времени — для снимка."""
+        result = [item for bucket in self._buckets.values() for item in bucket.items()]
+        result.sort(key=lambda item: item[1])
+        return result
+
+    def _evict_oldest(self) -> None:
+        bucket_id, bucket = self._buckets.popitem(last=False)
+        self._size -= len(bucket)
+        for host in bucket:
+            spread = self._spread[host] - 1
+            if spread:
+                self._spread[host] = spread
+            else:
+                del self._spread[host]
+            base = get_base_domain(host)
+            buckets = self._by_base.get(base)
+            if buckets is not None:
+                buckets.pop(bucket_id, None)
+                if not buckets:
+                    del self._by_base[base]
+
+    def related(self, base_domain: str) -> list[Related]:
+        """
+        Хосты других доменов, резолвившиеся в пределах radius корзин от
+        запросов base_domain, от самых связанных к наименее.
+
+        Вклад каждого запроса сайта — 1 / (1 + разрыв в секундах), сумма
+        умножается на редкость хоста в окне: фоновые запросы, которые есть
+        почти в каждой корзине, ранжируются ниже хостов, появившихся
+        только вместе с сайтом, а присутствующие в большинстве корзин
+        отбрасываются.
+        """
+        site_buckets = self._by_base.get(base_domain)
+        if not site_buckets:
+            return []
+
+        window = (self.radius + 1) * self.bucket
+        found: dict[str, Related] = {}
+        for bucket_id in site_buckets:
+            bucket = self._buckets.get(bucket_id)
+            if bucket is None:
+                continue
+            site_times = [t for h, t in bucket.items() if get_base_domain(h) == base_domain]
+
+            # Лучший вклад хоста для этой группы запросов сайта
+            best: dict[str, float] = {}
+            for neighbour_id in range(bucket_id - self.radius, bucket_id + self.radius + 1):
+                neighbour = self._buckets.get(neighbour_id)
+                if neighbour is None:
+                    continue
+                for host, seen in neighbour.items():
+                    if get_base_domain(host) == base_domain:
+                        continue
+                    gap = min(abs(seen - t) for t in site_times)
+                    if gap > window:
+                        continue
+                    item = found.get(host)
+                    if item is None:
+                        item = found[host] = Related(host)
+                    item.proximity = min(item.proximity, gap)
+                    weight = 1.0 / (1.0 + gap)
+                    if weight > best.get(host, 0.0):
+                        best[host] = weight
+
+            for host, weight in best.items():
+                item = found[host]
+                item.score += weight
+                item.hits += 1
+
+        total = len(self._buckets)
+        judge_background = total >= 2 * (2 * self.radius + 1)
+        result = []
+        for item in found.values():
+            spread = self._spread[item.host]
+            if judge_background and spread > total * BACKGROUND_SHARE:
+                continue
+            item.score *= math.log((total + 1) / spread) + 1.0
+            result.append(item)
+
+        return sorted(result, key=lambda r: (-r.score, r.proximity, r.host))
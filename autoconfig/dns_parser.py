@@ -1,20 +1,170 @@
-"""Парсинг DNS-запросов из вывода tcpdump."""
+"""Парсинг DNS-запросов из tcpdump: бинарный pcap или текстовый вывод."""
 
 import re
 import asyncio
-from typing import AsyncIterator
+import time
+from pathlib import Path
+from typing import AsyncIterator, Iterator, Protocol
+
+from config import DNS_CAPTURE_MODE
+from capture_filter import IngestFilter, build_bpf_filter
+from dns_wire import PcapParser, PCAP_MAGIC_US, PCAP_MAGIC_NS
+from rules import is_hostname
+import metrics
 
 
 # Regex для извлечения домена из tcpdump DNS query
 # Формат: "12345+ A? example.com. (30)" или "AAAA? example.com."
 DNS_QUERY_RE = re.compile(r'(?:A|AAAA)\?\s+(\S+?)\.\s')
 
+PCAP_SNAPLEN = 1500
+PCAP_READ_SIZE = 65536
+
+# Метка времени в начале строки tcpdump: "12:34:56.789012 IP ..."
+TEXT_TIMESTAMP_RE = re.compile(r'^(\d{2}):(\d{2}):(\d{2})\.(\d+)')
+
+# Как часто отдавать управление циклу при воспроизведении на максимальной скорости
+REPLAY_YIELD_EVERY = 256
+
+
+class DomainSource(Protocol):
+    """Источник DNS-имён для dns_monitor()."""
+
+    def stream(self) -> AsyncIterator[str]:
+        ...
+
+
+class TcpdumpSource:
+    """
+    Живой захват через tcpdump (нужен root). Запросы с точными именами
+    из списков игнора отсекает BPF в ядре, остальное — IngestFilter.
+    """
+
+    def __init__(self, mode: str = DNS_CAPTURE_MODE, ingest: IngestFilter | None = None):
+        self.mode = mode
+        self.ingest = ingest
+
+    async def stream(self) -> AsyncIterator[str]:
+        if self.ingest is None:
+            self.ingest = IngestFilter()
+        if self.mode == 'text':
+            domains = stream_dns_domains_text(build_bpf_filter(responses=False))
+        else:
+            domains = stream_dns_domains_pcap(build_bpf_filter())
+        accept = self.ingest.accept
+        async for domain in domains:
+            if accept(domain):
+                yield domain
+
+
+class ReplaySource:
+    """
+    Воспроизведение сохранённого pcap или текстового лога tcpdump.
+    speed=None — максимальная скорость, 1.0 — как записано, 2.0 — вдвое быстрее.
+    """
+
+    def __init__(self, path: Path, speed: float | None = None):
+        self.path = Path(path)
+        self.speed = speed
+
+    def _is_pcap(self) -> bool:
+        with open(self.path, 'rb') as f:
+            head = f.read(4)
+        if len(head) < 4:
+            return False
+        return (
+            int.from_bytes(head, 'little') in (PCAP_MAGIC_US, PCAP_MAGIC_NS)
+            or int.from_bytes(head, 'big') in (PCAP_MAGIC_US, PCAP_MAGIC_NS)
+        )
+
+    def _pcap_events(self) -> Iterator[tuple[float | None, str]]:
+        parser = PcapParser()
+        with open(self.path, 'rb') as f:
+            while chunk := f.read(PCAP_READ_SIZE):
+                yield from parser.domains(chunk)
+
+    def _text_events(self) -> Iterator[tuple[float | None, str]]:
+        with open(self.path, 'r', encoding='utf-8', errors='ignore') as f:
+            for line in f:
+                domain = parse_domain_from_line(line)
+                if domain is None:
+                    continue
+                m = TEXT_TIMESTAMP_RE.match(line)
+                ts = None
+                if m:
+                    h, mi, sec, frac = m.groups()
+                    ts = int(h) * 3600 + int(mi) * 60 + int(sec) + float('0.' + frac)
+                yield ts, domain
+
+    async def stream(self) -> AsyncIterator[str]:
+        events = self._pcap_events() if self._is_pcap() else self._text_events()
+        start_ts = None
+        start_wall = time.monotonic()
+        count = 0
+
+        for ts, domain in events:
+            if self.speed and ts is not None:
+                if start_ts is None:
+                    start_ts = ts
+                delay = (ts - start_ts) / self.speed - (time.monotonic() - start_wall)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            else:
+                count += 1
+                if count % REPLAY_YIELD_EVERY == 0:
+                    await asyncio.sleep(0)
+            yield domain
+
+
+async def stream_dns_domains(source: DomainSource | None = None) -> AsyncIterator[str]:
+    """Стримит DNS-домены из источника (по умолчанию — живой tcpdump)."""
+    if source is None:
+        source = TcpdumpSource()
+    async for domain in source.stream():
+        yield domain
+
+
+async def stream_pcap_domains(reader: asyncio.StreamReader) -> AsyncIterator[str]:
+    """Стримит DNS-имена из любого pcap-потока (вопросы + CNAME-цели)."""
+    parser = PcapParser()
+    while True:
+        chunk = await reader.read(PCAP_READ_SIZE)
+        if not chunk:
+            return
+        packets, messages = parser.packets, parser.messages
+        for _, domain in parser.domains(chunk):
+            yield domain
+        metrics.dns_lines_read.inc(parser.packets - packets)
+        metrics.dns_lines_parsed.inc(parser.messages - messages)
+
+
+async def stream_dns_domains_pcap(bpf: str) -> AsyncIterator[str]:
+    """tcpdump пишет pcap в stdout, DNS разбирается из wire format."""
+    proc = await asyncio.create_subprocess_exec(
+        '/usr/sbin/tcpdump', '-i', 'any', '-U', '-w', '-',
+        '-s', str(PCAP_SNAPLEN), '--immediate-mode', '-n',
+        bpf,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+
+    stdout = proc.stdout
+    if stdout is None:
+        return
+
+    try:
+        async for domain in stream_pcap_domains(stdout):
+            yield domain
+    finally:
+        proc.terminate()
+        await proc.wait()
+
 
-async def stream_dns_domains() -> AsyncIterator[str]:
-    """Запускает tcpdump и стримит DNS-домены по мере поступления."""
+async def stream_dns_domains_text(bpf: str) -> AsyncIterator[str]:
+    """Запасной путь: текстовый вывод tcpdump + DNS_QUERY_RE."""
     proc = await asyncio.create_subprocess_exec(
-        '/usr/sbin/tcpdump', '-i', 'any', '-l', 'port', '53',
-        '--immediate-mode', '-n',
+        '/usr/sbin/tcpdump', '-i', 'any', '-l',
+        '--immediate-mode', '-n', bpf,
         stdout=asyncio.subprocess.PIPE,
         stderr=asyncio.subprocess.DEVNULL,
     )
@@ -25,10 +175,11 @@ async def stream_dns_domains() -> AsyncIterator[str]:
 
     try:
         async for line in stdout:
+            metrics.dns_lines_read.inc()
             decoded = line.decode('utf-8', errors='ignore')
-            match = DNS_QUERY_RE.search(decoded)
-            if match:
-                domain = match.group(1).lower()
+            domain = parse_domain_from_line(decoded)
+            if domain is not None:
+                metrics.dns_lines_parsed.inc()
                 yield domain
     finally:
         proc.terminate()
@@ -36,8 +187,10 @@ async def stream_dns_domains() -> AsyncIterator[str]:
 
 
 def parse_domain_from_line(line: str) -> str | None:
-    """Извлекает домен из одной строки вывода tcpdump."""
+    """Извлекает домен из одной строки вывода tcpdump; не имя хоста — None."""
     match = DNS_QUERY_RE.search(line)
     if match:
-        return match.group(1).lower()
+        domain = match.group(1).lower()
+        if is_hostname(domain):
+            return domain
     return None
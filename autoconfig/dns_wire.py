@@ -0,0 +1,255 @@
+"""Разбор pcap-потока и DNS wire format без текстового вывода tcpdump."""
+
+import re
+import struct
+from typing import Iterator
+
+
+# Заголовки pcap
+PCAP_MAGIC_US = 0xA1B2C3D4
+PCAP_MAGIC_NS = 0xA1B23C4D
+PCAP_GLOBAL_HEADER_LEN = 24
+PCAP_RECORD_HEADER_LEN = 16
+
+# Типы канального уровня (LINKTYPE_*/DLT_*)
+LINKTYPE_NULL = 0
+LINKTYPE_EN10MB = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LOOP = 108
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_PKTAP_DARWIN = 149  # DLT_PKTAP на macOS (tcpdump -i any)
+LINKTYPE_PKTAP = 258
+LINKTYPE_LINUX_SLL2 = 276
+LINKTYPES_RAW_IP = {LINKTYPE_RAW, 12, 14}
+
+DNS_PORT = 53
+DNS_TYPE_CNAME = 5
+MAX_NAME_JUMPS = 32
+MAX_NAME_LENGTH = 253
+
+# Метка имени хоста (регистр любой: 0x20-рандомизация); см. rules.HOSTNAME_RE
+LABEL_RE = re.compile(rb'[A-Za-z0-9_-]{1,63}')
+
+
+class DnsParseError(ValueError):
+    """Повреждённое или обрезанное DNS-сообщение."""
+
+
+def read_name(msg: memoryview, offset: int) -> tuple[str | None, int]:
+    """
+    Читает имя с учётом сжатия (RFC 1035 4.1.4).
+    Возвращает (имя в нижнем регистре без точки в конце, смещение после имени).
+    Имя с меткой не из [a-z0-9_-] (точка, запятая, перевод строки, \\x00...)
+    или длиннее 253 символов — None: такое имя не должно дойти до конфига.
+    """
+    labels = []
+    end = -1
+    jumps = 0
+    size = len(msg)
+    while True:
+        if offset >= size:
+            raise DnsParseError('name out of bounds')
+        length = msg[offset]
+        if length == 0:
+            offset += 1
+            break
+        if length & 0xC0 == 0xC0:
+            if offset + 1 >= size:
+                raise DnsParseError('pointer out of bounds')
+            if end < 0:
+                end = offset + 2
+            jumps += 1
+            if jumps > MAX_NAME_JUMPS:
+                raise DnsParseError('compression loop')
+            offset = ((length & 0x3F) << 8) | msg[offset + 1]
+            continue
+        if length & 0xC0:
+            raise DnsParseError('unsupported label type')
+        offset += 1
+        if offset + length > size:
+            raise DnsParseError('label out of bounds')
+        labels.append(msg[offset:offset + length])
+        offset += length
+
+    end = end if end >= 0 else offset
+    fullmatch = LABEL_RE.fullmatch
+    labels = [bytes(label) for label in labels]
+    if not all(fullmatch(label) for label in labels):
+        return None, end
+    name = b'.'.join(labels).lower().decode('ascii')
+    if len(name) > MAX_NAME_LENGTH:
+        return None, end
+    return name, end
+
+
+def parse_dns_message(msg: memoryview) -> list[str]:
+    """
+    Имена из DNS-сообщения: вопросы из запросов и CNAME-цели из ответов.
+    Вопросы ответа не возвращаются — они уже пришли с запросом.
+    Имена, которые не являются именами хостов, пропускаются.
+    """
+    if len(msg) < 12:
+        raise DnsParseError('short header')
+    flags, qdcount, ancount = struct.unpack_from('!HHH', msg, 2)
+    is_response = bool(flags & 0x8000)
+    if flags & 0x7800:  # opcode != QUERY
+        return []
+
+    names = []
+    offset = 12
+    for _ in range(qdcount):
+        name, offset = read_name(msg, offset)
+        offset += 4  # QTYPE + QCLASS
+        if not is_response and name:  # None — не имя хоста, '' — корень
+            names.append(name)
+
+    if not is_response:
+        return names
+
+    for _ in range(ancount):
+        _, offset = read_name(msg, offset)
+        if offset + 10 > len(msg):
+            raise DnsParseError('short answer')
+        rtype, _, _, rdlength = struct.unpack_from('!HHIH', msg, offset)
+        offset += 10
+        if rtype == DNS_TYPE_CNAME:
+            target, _ = read_name(msg, offset)
+            if target:
+                names.append(target)
+        offset += rdlength
+    return names
+
+
+def _ip_payload(packet: memoryview) -> memoryview | None:
+    """DNS-полезная нагрузка IPv4/IPv6 пакета (UDP или TCP на порту 53)."""
+    if not packet:
+        return None
+    version = packet[0] >> 4
+    if version == 4:
+        if len(packet) < 20:
+            return None
+        ihl = (packet[0] & 0x0F) * 4
+        frag = struct.unpack_from('!H', packet, 6)[0]
+        if frag & 0x3FFF:  # фрагменты не собираем
+            return None
+        proto = packet[9]
+        segment = packet[ihl:]
+    elif version == 6:
+        if len(packet) < 40:
+            return None
+        proto = packet[6]
+        segment = packet[40:]
+    else:
+        return None
+
+    if proto == 17 and len(segment) >= 8:
+        sport, dport = struct.unpack_from('!HH', segment, 0)
+        if DNS_PORT in (sport, dport):
+            return segment[8:]
+    elif proto == 6 and len(segment) >= 20:
+        sport, dport = struct.unpack_from('!HH', segment, 0)
+        if DNS_PORT in (sport, dport):
+            data = segment[(segment[12] >> 4) * 4:]
+            # DNS over TCP: 2 байта длины; берём только целые сообщения
+            if len(data) >= 2:
+                length = struct.unpack_from('!H', data, 0)[0]
+                if len(data) >= 2 + length:
+                    return data[2:2 + length]
+    return None
+
+
+def dns_payload(linktype: int, frame: memoryview) -> memoryview | None:
+    """Снимает канальный заголовок и возвращает DNS-сообщение, если это DNS."""
+    if linktype == LINKTYPE_EN10MB:
+        if len(frame) < 14:
+            return None
+        offset = 12
+        ethertype = struct.unpack_from('!H', frame, offset)[0]
+        while ethertype in (0x8100, 0x88A8) and len(frame) >= offset + 6:
+            offset += 4
+            ethertype = struct.unpack_from('!H', frame, offset)[0]
+        if ethertype not in (0x0800, 0x86DD):
+            return None
+        return _ip_payload(frame[offset + 2:])
+    if linktype in (LINKTYPE_NULL, LINKTYPE_LOOP):
+        return _ip_payload(frame[4:])
+    if linktype in LINKTYPES_RAW_IP:
+        return _ip_payload(frame)
+    if linktype == LINKTYPE_LINUX_SLL:
+        return _ip_payload(frame[16:])
+    if linktype == LINKTYPE_LINUX_SLL2:
+        return _ip_payload(frame[20:])
+    if linktype in (LINKTYPE_PKTAP, LINKTYPE_PKTAP_DARWIN):
+        # struct pktap_header: pth_length, pth_type_next, pth_dlt (host order)
+        if len(frame) < 12:
+            return None
+        header_len, _, inner = struct.unpack_from('<III', frame, 0)
+        if header_len > len(frame) or inner in (LINKTYPE_PKTAP, LINKTYPE_PKTAP_DARWIN):
+            return None
+        return dns_payload(inner, frame[header_len:])
+    return None
+
+
+class PcapParser:
+    """
+    Инкрементальный разбор pcap-потока: feed() принимает куски байт и
+    отдаёт (timestamp, frame) по мере появления целых записей.
+    Кадры — memoryview поверх входного буфера, без копирования.
+    """
+
+    def __init__(self):
+        self.linktype: int | None = None
+        self.packets = 0   # прочитано записей pcap
+        self.messages = 0  # из них разобрано DNS-сообщений
+        self._endian = '<'
+        self._ts_div = 1e6
+        self._pending = b''
+
+    def feed(self, data: bytes) -> Iterator[tuple[float, memoryview]]:
+        buf = self._pending + data if self._pending else data
+        view = memoryview(buf)
+        offset = 0
+
+        if self.linktype is None:
+            if len(buf) < PCAP_GLOBAL_HEADER_LEN:
+                self._pending = buf
+                return
+            self._read_global_header(view)
+            offset = PCAP_GLOBAL_HEADER_LEN
+
+        record = struct.Struct(self._endian + 'IIII')
+        size = len(buf)
+        while offset + PCAP_RECORD_HEADER_LEN <= size:
+            sec, frac, caplen, _ = record.unpack_from(view, offset)
+            start = offset + PCAP_RECORD_HEADER_LEN
+            if start + caplen > size:
+                break
+            yield sec + frac / self._ts_div, view[start:start + caplen]
+            offset = start + caplen
+
+        self._pending = buf[offset:]
+
+    def _read_global_header(self, view: memoryview) -> None:
+        for endian in ('<', '>'):
+            magic = struct.unpack_from(endian + 'I', view, 0)[0]
+            if magic in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+                self._endian = endian
+                self._ts_div = 1e9 if magic == PCAP_MAGIC_NS else 1e6
+                self.linktype = struct.unpack_from(endian + 'I', view, 20)[0] & 0x0FFFFFFF
+                return
+        raise DnsParseError('not a pcap stream')
+
+    def domains(self, data: bytes) -> Iterator[tuple[float, str]]:
+        """(timestamp, домен) для всех DNS-имён в очередном куске потока."""
+        for ts, frame in self.feed(data):
+            self.packets += 1
+            payload = dns_payload(self.linktype, frame)
+            if payload is None:
+                continue
+            try:
+                names = parse_dns_message(payload)
+            except (DnsParseError, struct.error):
+                continue
+            self.messages += 1
+            for name in names:
+                yield ts, name
@@ -0,0 +1,182 @@
+"""Базовый домен по Public Suffix List и классификация доменов."""
+
+from functools import lru_cache
+from pathlib import Path
+
+from config import (
+    PUBLIC_SUFFIX_LIST_FILE, DOMAIN_CACHE_SIZE, MIN_DOMAIN_LENGTH,
+    DIRECT_TLDS, SYSTEM_DOMAINS, IGNORED_SUFFIXES,
+)
+
+
+# Результаты classify_domain, по убыванию приоритета
+IGNORE = 'ignore'        # локальные/служебные имена
+SYSTEM = 'system'        # системные домены macOS
+DIRECT = 'direct'        # российские TLD — идут DIRECT
+CANDIDATE = 'candidate'  # кандидат на проверку/добавление
+
+_PRIORITY = {IGNORE: 3, SYSTEM: 2, DIRECT: 1}
+
+
+class _SuffixNode:
+    __slots__ = ('children', 'rule', 'exception')
+
+    def __init__(self):
+        self.children: dict[str, _SuffixNode] = {}
+        self.rule = False       # здесь заканчивается правило PSL
+        self.exception = False  # правило-исключение '!label'
+
+
+def _to_ascii(label: str) -> str | None:
+    if label.isascii():
+        return label
+    try:
+        return label.encode('idna').decode('ascii')
+    except UnicodeError:
+        return None
+
+
+def _load_suffix_trie(path: Path) -> _SuffixNode:
+    """Строит дерево перевёрнутых меток из файла PSL."""
+    root = _SuffixNode()
+    if not path.exists():
+        return root
+
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('//'):
+                continue
+            exception = line.startswith('!')
+            labels = [_to_ascii(l) for l in line.lstrip('!').lower().split('.')]
+            if None in labels:
+                continue
+
+            node = root
+            for label in reversed(labels):
+                child = node.children.get(label)
+                if child is None:
+                    child = node.children[label] = _SuffixNode()
+                node = child
+            if exception:
+                node.exception = True
+            else:
+                node.rule = True
+    return root
+
+
+_psl_root: _SuffixNode | None = None
+
+
+def _psl() -> _SuffixNode:
+    global _psl_root
+    if _psl_root is None:
+        _psl_root = _load_suffix_trie(PUBLIC_SUFFIX_LIST_FILE)
+    return _psl_root
+
+
+def public_suffix_length(labels: list[str]) -> int:
+    """Число меток публичного суффикса (по умолчанию — одна, правило '*')."""
+    nodes = [_psl()]
+    length = 1
+    exception_at = 0
+    depth = 0
+    for label in reversed(labels):
+        depth += 1
+        nxt = []
+        for node in nodes:
+            for key in (label, '*'):
+                child = node.children.get(key)
+                if child is None:
+                    continue
+                if child.exception:
+                    exception_at = max(exception_at, depth)
+                if child.rule:
+                    length = max(length, depth)
+                nxt.append(child)
+        if not nxt:
+            break
+        nodes = nxt
+
+    # Исключение '!www.ck' делает публичным суффиксом родителя
+    if exception_at:
+        return exception_at - 1
+    return length
+
+
+@lru_cache(maxsize=DOMAIN_CACHE_SIZE)
+def get_base_domain(domain: str) -> str:
+    """
+    Регистрируемый домен: публичный суффикс + одна метка.
+    'a.b.example.co.uk' → 'example.co.uk'. Сам публичный суффикс
+    возвращается как есть.
+    """
+    domain = domain.lower().rstrip('.')
+    labels = domain.split('.')
+    suffix = public_suffix_length(labels)
+    if suffix >= len(labels):
+        return domain
+    return '.'.join(labels[-(suffix + 1):])
+
+
+class _ClassNode:
+    __slots__ = ('children', 'category', 'exact')
+
+    def __init__(self):
+        self.children: dict[str, _ClassNode] = {}
+        self.category: str | None = None  # совпадение для поддоменов
+        self.exact: str | None = None     # совпадение только для самого имени
+
+
+def _build_classifier() -> _ClassNode:
+    root = _ClassNode()
+
+    def insert(name: str, category: str, include_self: bool) -> None:
+        node = root
+        for label in reversed(name.split('.')):
+            node = node.children.setdefault(label, _ClassNode())
+        # category действует на поддомены, exact — на само имя
+        if _PRIORITY[category] > _PRIORITY.get(node.category, 0):
+            node.category = category
+        if include_self and _PRIORITY[category] > _PRIORITY.get(node.exact, 0):
+            node.exact = category
+
+    # '.local' / '.ru' — только поддомены, как endswith('.local')
+    for suffix in IGNORED_SUFFIXES:
+        insert(suffix.lstrip('.'), IGNORE, include_self=False)
+    for tld in DIRECT_TLDS:
+        insert(tld.lstrip('.'), DIRECT, include_self=False)
+    # Системные домены — само имя и все поддомены
+    for name in SYSTEM_DOMAINS:
+        insert(name, SYSTEM, include_self=True)
+    return root
+
+
+_classifier = _build_classifier()
+
+
+@lru_cache(maxsize=DOMAIN_CACHE_SIZE)
+def classify_domain(domain: str) -> str:
+    """
+    Классифицирует домен за один проход по меткам справа налево:
+    IGNORE / SYSTEM / DIRECT / CANDIDATE.
+    """
+    if len(domain) < MIN_DOMAIN_LENGTH or '.' not in domain:
+        return IGNORE
+
+    labels = domain.split('.')
+    node = _classifier
+    best: str | None = None
+    last = len(labels) - 1
+    for i in range(last, -1, -1):
+        node = node.children.get(labels[i])
+        if node is None:
+            break
+        # category у узла относится к поддоменам, т.е. если ещё есть метки левее
+        found = node.category if i > 0 else node.exact
+        if found is not None and _PRIORITY[found] > _PRIORITY.get(best, 0):
+            best = found
+            if best == IGNORE:
+                break
+
+    return best or CANDIDATE
@@ -0,0 +1,451 @@
+#!/usr/bin/env python3
+"""
+Экспорт [Rule] в наборы правил по политикам и тонкий основной конфиг.
+
+Shadowrocket проверяет встроенные правила по одному на каждом
+соединении; DOMAIN-SET ищется по хешу суффиксов, поэтому сотни
+DOMAIN-SUFFIX дешевле держать в нём. Порядок работы:
+
+0. Доменные правила с лишними полями или неизвестной политикой (не
+   встроенной и не из [Proxy]/[Proxy Group]) в наборы не попадают:
+   отчёт их перечисляет, --write отказывается писать, пока их не исправят
+1. compact.py: удаляются затенённые и сквозные правила; с
+   --promote-keywords DOMAIN-KEYWORD с именем хоста становятся
+   DOMAIN-SUFFIX — это меняет, что матчит правило, поэтому такие
+   правила перечисляются в отчёте
+2. Доменные правила до первого IP-правила (GEOIP, IP-CIDR) раскладываются
+   по политикам: DOMAIN/DOMAIN-SUFFIX — в <policy>.domains (DOMAIN-SET),
+   оставшиеся DOMAIN-KEYWORD — в <policy>.keywords.list (RULE-SET).
+   Внутри набора остаётся минимальное покрытие: записи под суффиксом
+   или keyword той же политики выбрасываются.
+3. Наборы идут в основном конфиге подряд, поэтому первое совпадение
+   теперь решается порядком политик. Для каждой пары пересекающихся
+   правил разных политик, чей порядок набор бы перевернул, раннее
+   правило остаётся встроенным перед наборами. Порядок политик
+   выбирается так, чтобы таких правил было меньше всего.
+
+Пересечение keyword с суффиксом считается только когда keyword входит
+в значение суффикса (или суффикс — хвост keyword): 'google' и
+'example.com' формально пересекаются на 'google.example.com', но такие
+хосты в расчёт не берутся.
+
+Файлы сортируются по перевёрнутым меткам домена, без дат — повторный
+экспорт того же конфига даёт тот же вывод.
+
+    python3 export_rulesets.py                 # отчёт и оценка стоимости
+    python3 export_rulesets.py --write
+    python3 export_rulesets.py --promote-keywords --write
+"""
+
+import argparse
+import bisect
+import itertools
+import os
+import re
+import sys
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import CONFIG_FILE, RULESET_DIR, RULESET_SLIM_CONFIG, RULESET_BASE_URL
+from config_document import ConfigDocument, Entry, atomic_write
+from compact import compact_document
+from rules import Rule, RuleEngine, DOMAIN_RULE_TYPES
+
+
+# Условная стоимость проверки одного правила на соединении (сравнения строк)
+RULE_COST = {'DOMAIN': 1.0, 'DOMAIN-SUFFIX': 1.0, 'DOMAIN-KEYWORD': 3.0}
+DOMAIN_SET_COST = 3.0   # хеш-поиск по суффиксам хоста, ~по метке
+OTHER_RULE_COST = 1.0
+
+MAX_PERMUTED_POLICIES = 7  # больше политик — порядок первого появления
+HEADER = '# Сгенерировано export_rulesets.py из shadsocks_in.conf — не править вручную'
+
+# Встроенные политики Shadowrocket; остальные — имена из [Proxy] и [Proxy Group]
+BUILTIN_POLICIES = {
+    'PROXY', 'DIRECT', 'REJECT', 'REJECT-DICT', 'REJECT-ARRAY', 'REJECT-200',
+    'REJECT-IMG', 'REJECT-TINYGIF', 'REJECT-DROP', 'REJECT-NO-DROP',
+}
+
+
+def _sort_key(rule: Rule) -> tuple:
+    return (rule.value.split('.')[::-1], rule.type)
+
+
+def _slug(policy: str) -> str:
+    return re.sub(r'[^a-z0-9]+', '-', policy.lower()).strip('-') or 'policy'
+
+
+def _suffixes(value: str):
+    """'a.b.c' → 'a.b.c', 'b.c', 'c'."""
+    labels = value.split('.')
+    return ('.'.join(labels[k:]) for k in range(len(labels)))
+
+
+def _matches(rule: Rule, host: str) -> bool:
+    if rule.type == 'DOMAIN-KEYWORD':
+        return rule.value in host
+    if rule.type == 'DOMAIN':
+        return host == rule.value
+    return host == rule.value or host.endswith('.' + rule.value)
+
+
+def known_policies(document: ConfigDocument) -> set[str]:
+    """Встроенные политики и имена прокси и групп из конфига."""
+    policies = set(BUILTIN_POLICIES)
+    for name in ('Proxy', 'Proxy Group'):
+        section = document.section(name)
+        for entry in section.entries if section else []:
+            key, sep, _ = entry.text.partition('=')
+            if sep and not entry.text.lstrip().startswith(('#', '//')):
+                policies.add(key.strip())
+    return policies
+
+
+def invalid_rules(rules: list[Rule], policies: set[str]) -> list[tuple[Rule, str]]:
+    """
+    Доменные правила, которые нельзя переносить в наборы: лишние поля
+    ('DOMAIN-KEYWORD,a,B.COM,PROXY' читается как политика 'B.COM') или
+    неизвестная политика. Набор с такой политикой ссылался бы в никуда.
+    """
+    result = []
+    for rule in rules:
+        if rule.type not in DOMAIN_RULE_TYPES:
+            continue
+        if rule.options:
+            result.append((rule, f'лишние поля после политики: {rule.options}'))
+        elif rule.policy not in policies:
+            result.append((rule, f'неизвестная политика {rule.policy}'))
+    return result
+
+
+def is_generated(path: Path) -> bool:
+    """Файл записан этим скриптом (первая строка — HEADER)."""
+    try:
+        with open(path, encoding='utf-8') as f:
+            return f.readline().rstrip('\n') == HEADER
+    except (OSError, UnicodeDecodeError):
+        return False
+
+
+def overlapping_pairs(rules: list[Rule]) -> set[tuple[int, int]]:
+    """
+    Пары (раннее, позднее) индексов в rules с пересекающимися множествами
+    хостов и разными политиками.
+    """
+    pairs: set[tuple[int, int]] = set()
+    by_suffix: dict[str, list[int]] = {}
+    by_exact: dict[str, list[int]] = {}
+    keywords: list[int] = []
+    for i, rule in enumerate(rules):
+        if rule.type == 'DOMAIN-SUFFIX':
+            by_suffix.setdefault(rule.value, []).append(i)
+        elif rule.type == 'DOMAIN':
+            by_exact.setdefault(rule.value, []).append(i)
+        else:
+            keywords.append(i)
+
+    def add(i: int, j: int) -> None:
+        if i != j and rules[i].policy != rules[j].policy:
+            pairs.add((min(i, j), max(i, j)))
+
+    # Суффиксы-предки и совпадающие DOMAIN
+    for i, rule in enumerate(rules):
+        if rule.type == 'DOMAIN-KEYWORD':
+            continue
+        for suffix in _suffixes(rule.value):
+            for j in by_suffix.get(suffix, ()):
+                add(i, j)
+        if rule.type == 'DOMAIN':
+            for j in by_exact.get(rule.value, ()):
+                add(i, j)
+
+    # keyword внутри значений: одна строка со всеми значениями, поиск в C
+    domain_ids = [i for i, r in enumerate(rules) if r.type != 'DOMAIN-KEYWORD']
+    starts, parts, offset = [], [], 0
+    for i in domain_ids:
+        starts.append(offset)
+        parts.append(rules[i].value)
+        offset += len(rules[i].value) + 1
+    haystack = '\n'.join(parts)
+    for k in keywords:
+        value = rules[k].value
+        found = haystack.find(value)
+        while found >= 0:
+            add(k, domain_ids[bisect.bisect_right(starts, found) - 1])
+            found = haystack.find(value, found + 1)
+        for suffix in _suffixes(value):
+            for j in by_suffix.get(suffix, ()):
+                add(k, j)
+
+    for a, b in itertools.combinations(keywords, 2):
+        if rules[a].value in rules[b].value or rules[b].value in rules[a].value:
+            add(a, b)
+    return pairs
+
+
+def plan_inline(rules: list[Rule], order: list[str],
+                pairs: set[tuple[int, int]]) -> set[int]:
+    """Индексы правил, которые при этом порядке политик должны остаться встроенными."""
+    rank = {policy: n for n, policy in enumerate(order)}
+    earlier: dict[int, list[int]] = {}
+    inline = set()
+    for a, b in pairs:
+        earlier.setdefault(b, []).append(a)
+        if rank[rules[a].policy] > rank[rules[b].policy]:
+            inline.add(a)
+    # Встроенное правило обгоняет все наборы — раньше него пересекающиеся
+    # правила других политик тоже должны быть встроены
+    stack = list(inline)
+    while stack:
+        for a in earlier.get(stack.pop(), ()):
+            if a not in inline:
+                inline.add(a)
+                stack.append(a)
+    return inline
+
+
+class RuleSetFile:
+    """Файл набора: DOMAIN-SET ('.domains') или RULE-SET с keyword ('.keywords.list')."""
+
+    def __init__(self, policy: str, kind: str, rules: list[Rule]):
+        self.policy = policy
+        self.kind = kind  # 'DOMAIN-SET' | 'RULE-SET'
+        self.rules = sorted(rules, key=_sort_key)
+        suffix = 'domains' if kind == 'DOMAIN-SET' else 'keywords.list'
+        self.name = f'{_slug(policy)}.{suffix}'
+
+    def render(self) -> str:
+        if self.kind == 'DOMAIN-SET':
+            body = ['.' + r.value if r.type == 'DOMAIN-SUFFIX' else r.value for r in self.rules]
+        else:
+            body = [f'{r.type},{r.value}' for r in self.rules]
+        return '\n'.join([HEADER, f'# {self.policy}: {len(self.rules)}', *body]) + '\n'
+
+    def cost(self) -> float:
+        if self.kind == 'DOMAIN-SET':
+            return DOMAIN_SET_COST
+        return sum(RULE_COST[r.type] for r in self.rules)
+
+
+class ExportPlan:
+    """Результат: встроенные правила, наборы в порядке проверки и хвост."""
+
+    def __init__(self, inline: list[Rule], sets: list[RuleSetFile], tail: list[Rule],
+                 dropped: list[tuple[Rule, Rule]], order: list[str]):
+        self.inline = inline
+        self.sets = sets
+        self.tail = tail
+        self.dropped = dropped  # (запись, покрывающая её в том же наборе)
+        self.order = order
+        self._engines = [RuleEngine(s.rules) for s in sets]
+        self._inline_engine = RuleEngine(inline)
+
+    def policy(self, host: str) -> str | None:
+        """Политика для хоста в тонком конфиге (без GEOIP — как RuleEngine.policy)."""
+        hit = self._inline_engine.match(host)
+        if hit is not None:
+            return hit[1]
+        for ruleset, engine in zip(self.sets, self._engines):
+            if engine.match(host) is not None:
+                return ruleset.policy
+        for rule in self.tail:
+            if rule.type == 'FINAL':
+                return rule.policy
+        return None
+
+    def cost(self, host: str) -> float:
+        """Условная стоимость первого совпадения для хоста в тонком конфиге."""
+        total = 0.0
+        for rule in self.inline:
+            total += RULE_COST[rule.type]
+            if _matches(rule, host):
+                return total
+        for ruleset, engine in zip(self.sets, self._engines):
+            total += ruleset.cost()
+            if engine.match(host) is not None:
+                return total
+        return total + len(self.tail) * OTHER_RULE_COST
+
+
+def plan_export(rules: list[Rule]) -> ExportPlan:
+    """Раскладывает (уже компактизированные) правила по наборам."""
+    head = []
+    for rule in rules:
+        if rule.type not in DOMAIN_RULE_TYPES:
+            break
+        head.append(rule)
+    tail = rules[len(head):]
+
+    policies = list(dict.fromkeys(r.policy for r in head))
+    pairs = overlapping_pairs(head)
+    if len(policies) <= MAX_PERMUTED_POLICIES:
+        candidates = itertools.permutations(policies)
+    else:
+        candidates = [tuple(policies)]
+    best = None
+    for order in candidates:
+        inline = plan_inline(head, list(order), pairs)
+        if best is None or len(inline) < len(best[1]):
+            best = (list(order), inline)
+    order, inline_ids = best if best else ([], set())
+
+    sets = []
+    dropped = []
+    for policy in order:
+        members = [r for i, r in enumerate(head) if i not in inline_ids and r.policy == policy]
+        # Минимальное покрытие внутри набора: суффикс-предок или keyword той же политики
+        keywords = [r for r in members if r.type == 'DOMAIN-KEYWORD']
+        suffix_rules = {r.value: r for r in members if r.type == 'DOMAIN-SUFFIX'}
+        kept_domains = []
+        for rule in members:
+            if rule.type == 'DOMAIN-KEYWORD':
+                continue
+            cover = next((k for k in keywords if k.value in rule.value), None)
+            if cover is None:
+                ancestors = _suffixes(rule.value)
+                if rule.type == 'DOMAIN-SUFFIX':
+                    next(ancestors)  # сам себя не покрывает
+                cover = next((suffix_rules[a] for a in ancestors if a in suffix_rules), None)
+            if cover is not None:
+                dropped.append((rule, cover))
+            else:
+                kept_domains.append(rule)
+        if kept_domains:
+            sets.append(RuleSetFile(policy, 'DOMAIN-SET', kept_domains))
+        if keywords:
+            sets.append(RuleSetFile(policy, 'RULE-SET', keywords))
+
+    inline = [r for i, r in enumerate(head) if i in inline_ids]
+    return ExportPlan(inline, sets, tail, dropped, order)
+
+
+def sample_hosts(rules: list[Rule]) -> list[str]:
+    """Хосты для оценки: по одному на правило и столько же не совпадающих."""
+    hosts = []
+    for rule in rules:
+        if rule.type == 'DOMAIN-SUFFIX':
+            hosts.append('www.' + rule.value)
+        elif rule.type == 'DOMAIN':
+            hosts.append(rule.value)
+        elif rule.type == 'DOMAIN-KEYWORD':
+            hosts.append(f'x{rule.value}x.com')
+    hosts += [f'host{i}.example-unmatched.org' for i in range(max(len(hosts), 1))]
+    return hosts
+
+
+def inline_cost(rules: list[Rule], host: str, engine: RuleEngine) -> float:
+    """Условная стоимость первого совпадения при линейной проверке rules."""
+    hit = engine.match(host)
+    last = hit[0].position if hit is not None else len(rules) - 1
+    total = 0.0
+    for rule in rules[:last + 1]:
+        total += RULE_COST.get(rule.type, OTHER_RULE_COST)
+    return total
+
+
+def slim_document(document: ConfigDocument, plan: ExportPlan, base_url: str) -> ConfigDocument:
+    """Копия документа, где [Rule] ссылается на наборы."""
+    slim = ConfigDocument.parse(document.render())
+    section = slim.section('Rule')
+    entries = [Entry(HEADER.replace('#', '//', 1))]
+    entries += [Entry(r.line, r) for r in plan.inline]
+    for ruleset in plan.sets:
+        rule = Rule(ruleset.kind, f'{base_url.rstrip("/")}/{ruleset.name}', ruleset.policy)
+        entries.append(Entry(rule.line, rule))
+    entries += [Entry(r.line, r) for r in plan.tail]
+    # Пустые строки между секциями сохраняем
+    trailing = []
+    for entry in reversed(section.entries):
+        if entry.text.strip():
+            break
+        trailing.append(entry)
+    section.entries = entries + trailing[::-1]
+    slim.renumber()
+    return slim
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Экспорт правил Shadowrocket в наборы по политикам')
+    parser.add_argument('config', nargs='?', default=str(CONFIG_FILE),
+                        help='путь к конфигу (по умолчанию shadsocks_in.conf)')
+    parser.add_argument('--out-dir', type=Path, default=RULESET_DIR, help='каталог для наборов')
+    parser.add_argument('--slim', type=Path, default=RULESET_SLIM_CONFIG,
+                        help='куда записать тонкий основной конфиг')
+    parser.add_argument('--base-url', default=RULESET_BASE_URL,
+                        help='URL каталога наборов, на который ссылается тонкий конфиг')
+    parser.add_argument('--promote-keywords', action='store_true',
+                        help='заменить DOMAIN-KEYWORD с именем хоста на DOMAIN-SUFFIX '
+                             '(меняет, что матчит правило)')
+    parser.add_argument('--write', action='store_true',
+                        help='записать файлы (иначе только отчёт)')
+    args = parser.parse_args()
+
+    path = Path(args.config)
+    document = ConfigDocument.load(path)
+    original = document.rules()
+    original_engine = RuleEngine(original)
+
+    invalid = invalid_rules(original, known_policies(document))
+    for rule, reason in invalid:
+        print(f"[export] Некорректное правило, в наборы не попадёт: {rule.line} ({reason})")
+
+    compacted = ConfigDocument.parse(document.render())
+    compacted.remove_rules([r for r, _ in invalid_rules(compacted.rules(), known_policies(compacted))])
+    result = compact_document(compacted, promote_keywords=args.promote_keywords)
+    for old, new in result.promoted:
+        print(f"[promote] {old.line} -> {new.line}  (больше не матчит '{old.value}' внутри имени)")
+    plan = plan_export(compacted.rules())
+    compacted_engine = RuleEngine(compacted.rules())
+    hosts = sample_hosts(compacted.rules())
+
+    keywords_before = sum(r.type == 'DOMAIN-KEYWORD' for r in original)
+    keywords_after = sum(r.type == 'DOMAIN-KEYWORD' for r in plan.inline) + \
+        sum(len(s.rules) for s in plan.sets if s.kind == 'RULE-SET')
+    print(f"[export] Правил: {len(original)}, после compact: {len(compacted.rules())} "
+          f"(удалено {len(result.removed)}, keyword -> suffix {len(result.promoted)})")
+    print(f"[export] DOMAIN-KEYWORD: {keywords_before} -> {keywords_after}; "
+          f"покрыто внутри наборов: {len(plan.dropped)}")
+    print(f"[export] Порядок политик: {', '.join(plan.order) or '-'}; "
+          f"встроено перед наборами: {len(plan.inline)}")
+    for ruleset in plan.sets:
+        print(f"  {ruleset.kind},{ruleset.name},{ruleset.policy}  ({len(ruleset.rules)})")
+
+    before = [inline_cost(original, h, original_engine) for h in hosts]
+    after = [plan.cost(h) for h in hosts]
+    unmatched = len(hosts) // 2
+    print(f"[export] Оценка стоимости на соединение (условные сравнения): "
+          f"среднее {sum(before) / len(before):.1f} -> {sum(after) / len(after):.1f}, "
+          f"без совпадения {before[-1]:.1f} -> {after[-1]:.1f}")
+
+    # Раскладка по наборам не должна менять политику относительно compact
+    # (keyword -> suffix с --promote-keywords меняет её намеренно, см. выше)
+    changed = [h for h in hosts[:len(hosts) - unmatched]
+               if compacted_engine.policy(h) != plan.policy(h)]
+    if changed:
+        print(f"[export] Политика изменилась для {len(changed)} хостов "
+              f"(пересечения keyword), например: {', '.join(changed[:5])}")
+
+    if not args.write:
+        print('[export] Запустите с --write, чтобы записать')
+        return
+    if invalid:
+        print(f"[export] Исправьте {len(invalid)} некорректных правил в {path.name} — "
+              f"иначе тонкий конфиг потеряет их")
+        sys.exit(1)
+
+    args.out_dir.mkdir(parents=True, exist_ok=True)
+    written = {ruleset.name for ruleset in plan.sets}
+    for ruleset in plan.sets:
+        atomic_write(args.out_dir / ruleset.name, ruleset.render())
+    # Наборы политик, которых больше нет, иначе тонкий конфиг и каталог разойдутся;
+    # чужие файлы в каталоге не трогаем
+    for stale in args.out_dir.iterdir():
+        if stale.name not in written and stale.suffix in ('.domains', '.list') and is_generated(stale):
+            stale.unlink()
+    slim_document(document, plan, args.base_url).save(args.slim)
+    print(f"[export] Записано: {args.out_dir}/ ({len(plan.sets)} файлов), {args.slim}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""История DNS-запросов с вытеснением по TTL и жёстким лимитом размера."""
+
+import time
+from collections import OrderedDict
+from typing import Iterator
+
+
+class DnsHistory:
+    """
+    Домены в порядке последнего запроса: самый старый — в голове.
+
+    Повторный запрос переносит домен в хвост, поэтому просроченные записи
+    всегда лежат в начале и вытесняются с головы за амортизированное O(1)
+    на запись — без пересборки словаря.
+    """
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.evicted = 0  # сколько записей вытеснено за всё время
+        self._entries: OrderedDict[str, float] = OrderedDict()
+
+    def record(self, domain: str, now: float | None = None) -> None:
+        """Записывает запрос домена и вытесняет устаревшие записи."""
+        if now is None:
+            now = time.monotonic()
+        entries = self._entries
+        if domain in entries:
+            entries.move_to_end(domain)
+        entries[domain] = now
+
+        while len(entries) > self.max_size:
+            entries.popitem(last=False)
+            self.evicted += 1
+        self.expire(now)
+
+    def expire(self, now: float | None = None) -> None:
+        """Вытесняет с головы записи старше TTL."""
+        if now is None:
+            now = time.monotonic()
+        entries = self._entries
+        deadline = now - self.ttl
+        while entries:
+            domain, seen = next(iter(entries.items()))
+            if seen >= deadline:
+                break
+            del entries[domain]
+            self.evicted += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, domain: str) -> bool:
+        return domain in self._entries
+
+    def __iter__(self) -> Iterator[tuple[str, float]]:
+        """(домен, время) живого окна, от старых к новым, без копирования."""
+        self.expire()
+        return iter(self._entries.items())
+
+    def newest_first(self) -> Iterator[tuple[str, float]]:
+        """(домен, время) живого окна, от новых к старым, без копирования."""
+        self.expire()
+        return reversed(self._entries.items())
@@ -0,0 +1,274 @@
+"""Минимальный HTTP/1.1 сервер на asyncio: keep-alive, CORS, лимиты размера."""
+
+import asyncio
+import json
+from typing import AsyncGenerator, Awaitable, Callable
+from urllib.parse import urlsplit, parse_qs
+
+
+MAX_REQUEST_LINE = 8192
+MAX_HEADERS_BYTES = 16384
+MAX_BODY_BYTES = 1024 * 1024
+KEEPALIVE_TIMEOUT = 15  # секунд простоя соединения
+REQUEST_TIMEOUT = 10    # секунд на чтение одного запроса
+
+REASONS = {
+    200: 'OK', 204: 'No Content', 400: 'Bad Request', 404: 'Not Found',
+    405: 'Method Not Allowed', 408: 'Request Timeout',
+    413: 'Payload Too Large', 431: 'Request Header Fields Too Large',
+    500: 'Internal Server Error',
+}
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type',
+}
+
+
+class HttpError(Exception):
+    """Ошибка разбора запроса: ответить статусом и закрыть соединение."""
+
+    def __init__(self, status: int, message: str = ''):
+        super().__init__(message or REASONS.get(status, ''))
+        self.status = status
+
+
+class Request:
+    def __init__(self, method: str, target: str, version: str,
+                 headers: dict[str, str], body: bytes):
+        self.method = method
+        self.version = version
+        self.headers = headers
+        self.body = body
+        parts = urlsplit(target)
+        self.path = parts.path
+        self.query = parse_qs(parts.query)
+
+    def json(self):
+        return json.loads(self.body.decode('utf-8'))
+
+    @property
+    def keep_alive(self) -> bool:
+        connection = self.headers.get('connection', '').lower()
+        if self.version == 'HTTP/1.0':
+            return connection == 'keep-alive'
+        return connection != 'close'
+
+
+class Response:
+    def __init__(self, status: int = 200, body: bytes = b'',
+                 content_type: str = 'text/plain; charset=utf-8',
+                 headers: dict[str, str] | None = None):
+        self.status = status
+        self.body = body
+        self.headers = {'Content-Type': content_type, **(headers or {})}
+
+
+class StreamResponse(Response):
+    """
+    Тело отдаётся по мере готовности: каждый кусок из chunks уходит
+    отдельным chunk'ом Transfer-Encoding: chunked (HTTP/1.0 — до закрытия
+    соединения). Между кусками writer.drain() — медленный клиент
+    притормаживает генератор, а не раздувает буфер.
+    """
+
+    def __init__(self, status: int, chunks: AsyncGenerator[bytes, None],
+                 content_type: str = 'application/x-ndjson',
+                 headers: dict[str, str] | None = None):
+        super().__init__(status, b'', content_type, headers)
+        self.chunks = chunks
+
+
+def json_response(status: int, data) -> Response:
+    body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+    return Response(status, body, 'application/json')
+
+
+Handler = Callable[[Request], Awaitable[Response]]
+
+
+class ApiServer:
+    """
+    HTTP API на том же цикле, что и DNS-мониторинг: обработчики — корутины,
+    соединения обслуживаются параллельно, одно медленное не держит остальные.
+    """
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.routes: dict[tuple[str, str], Handler] = {}
+        self.body_limits: dict[tuple[str, str], int] = {}
+        self._server: asyncio.AbstractServer | None = None
+
+    def route(self, method: str, path: str, handler: Handler,
+              max_body: int = MAX_BODY_BYTES) -> None:
+        """max_body — свой лимит тела для маршрутов, которым мало MAX_BODY_BYTES."""
+        self.routes[(method, path)] = handler
+        self.body_limits[(method, path)] = max_body
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(
+            self._serve_connection, self.host, self.port,
+            limit=MAX_REQUEST_LINE,
+        )
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _serve_connection(self, reader: asyncio.StreamReader,
+                                writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except HttpError as e:
+                    await self._write(writer, json_response(e.status, {'error': str(e)}), False)
+                    return
+                if request is None:
+                    return
+
+                response = await self._dispatch(request)
+                print(f"[api] {request.method} {request.path} {response.status}")
+                keep_alive = request.keep_alive
+                if isinstance(response, StreamResponse):
+                    keep_alive = keep_alive and request.version != 'HTTP/1.0'
+                    if not await self._write_stream(writer, response, keep_alive,
+                                                    request.method == 'HEAD'):
+                        return  # тело оборвано — соединение только закрыть
+                else:
+                    await self._write(writer, response, keep_alive, request.method == 'HEAD')
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Request | None:
+        # Ждём начала следующего запроса не дольше keep-alive таймаута
+        try:
+            line = await asyncio.wait_for(reader.readline(), timeout=KEEPALIVE_TIMEOUT)
+        except asyncio.TimeoutError:
+            return None
+        except (asyncio.LimitOverrunError, ValueError):
+            raise HttpError(400, 'Request line too long')
+        if not line:
+            return None
+
+        try:
+            return await asyncio.wait_for(self._read_rest(reader, line), timeout=REQUEST_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise HttpError(408)
+
+    async def _read_rest(self, reader: asyncio.StreamReader, line: bytes) -> Request:
+        parts = line.decode('latin-1').strip().split()
+        if len(parts) != 3 or not parts[2].startswith('HTTP/1.'):
+            raise HttpError(400, 'Malformed request line')
+        method, target, version = parts
+
+        headers: dict[str, str] = {}
+        total = 0
+        while True:
+            try:
+                raw = await reader.readline()
+            except (asyncio.LimitOverrunError, ValueError):
+                raise HttpError(431)
+            total += len(raw)
+            if total > MAX_HEADERS_BYTES:
+                raise HttpError(431)
+            raw = raw.rstrip(b'\r\n')
+            if not raw:
+                break
+            name, sep, value = raw.decode('latin-1').partition(':')
+            if not sep:
+                raise HttpError(400, 'Malformed header')
+            headers[name.strip().lower()] = value.strip()
+
+        if 'chunked' in headers.get('transfer-encoding', '').lower():
+            raise HttpError(400, 'Chunked request bodies are not supported')
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise HttpError(400, 'Bad Content-Length')
+        if length < 0:
+            raise HttpError(400, 'Bad Content-Length')
+        limit = self.body_limits.get((method.upper(), urlsplit(target).path), MAX_BODY_BYTES)
+        if length > limit:
+            raise HttpError(413)
+        body = await reader.readexactly(length) if length else b''
+        return Request(method.upper(), target, version, headers, body)
+
+    async def _dispatch(self, request: Request) -> Response:
+        if request.method == 'OPTIONS':
+            return Response(200)  # CORS preflight
+        handler = self.routes.get((request.method, request.path))
+        if handler is None and request.method == 'HEAD':
+            handler = self.routes.get(('GET', request.path))
+        if handler is None:
+            known = any(path == request.path for _, path in self.routes)
+            status = 405 if known else 404
+            return json_response(status, {'error': REASONS[status]})
+        try:
+            return await handler(request)
+        except Exception as e:
+            print(f"[api error] {request.method} {request.path}: {e!r}")
+            return json_response(500, {'error': 'Internal error'})
+
+    async def _write(self, writer: asyncio.StreamWriter, response: Response,
+                     keep_alive: bool, head_only: bool = False) -> None:
+        status = response.status
+        lines = [f'HTTP/1.1 {status} {REASONS.get(status, "")}']
+        headers = {**CORS_HEADERS, **response.headers}
+        headers['Content-Length'] = str(len(response.body))
+        headers['Connection'] = 'keep-alive' if keep_alive else 'close'
+        lines.extend(f'{k}: {v}' for k, v in headers.items())
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        if not head_only:
+            writer.write(response.body)
+        await writer.drain()
+
+    async def _write_stream(self, writer: asyncio.StreamWriter, response: StreamResponse,
+                            keep_alive: bool, head_only: bool = False) -> bool:
+        """
+        False — генератор тела упал: заголовки уже ушли, поэтому ответ
+        обрывается без завершающего chunk'а и клиент видит усечённое тело.
+        """
+        status = response.status
+        lines = [f'HTTP/1.1 {status} {REASONS.get(status, "")}']
+        headers = {**CORS_HEADERS, **response.headers}
+        # Без keep-alive (HTTP/1.0) конец тела — закрытие соединения
+        if keep_alive:
+            headers['Transfer-Encoding'] = 'chunked'
+        headers['Connection'] = 'keep-alive' if keep_alive else 'close'
+        lines.extend(f'{k}: {v}' for k, v in headers.items())
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        if head_only:
+            await response.chunks.aclose()
+            await writer.drain()
+            return True
+        try:
+            async for chunk in response.chunks:
+                if not chunk:
+                    continue
+                if keep_alive:
+                    writer.write(b'%x\r\n%b\r\n' % (len(chunk), chunk))
+                else:
+                    writer.write(chunk)
+                await writer.drain()
+        except ConnectionError:
+            raise
+        except Exception as e:
+            print(f"[api error] поток ответа оборван: {e!r}")
+            await writer.drain()
+            return False
+        if keep_alive:
+            writer.write(b'0\r\n\r\n')
+        await writer.drain()
+        return True
@@ -0,0 +1,165 @@
+"""Метрики демона в текстовом формате Prometheus.
+
+Счётчики и корзины гистограмм выделяются один раз при создании метрики;
+inc()/observe() на горячем пути только меняют числа в готовых списках.
+"""
+
+from bisect import bisect_left
+from typing import Callable
+
+
+# Корзины задержек, секунды: от 10 мкс до 10 с
+LATENCY_BUCKETS = (
+    0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005,
+    0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+_registry: list['_Metric'] = []
+
+
+def _format_labels(labels: dict[str, str], extra: str = '') -> str:
+    parts = [f'{k}="{v}"' for k, v in labels.items()]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type = 'untyped'
+
+    def __init__(self, name: str, help: str, labels: dict[str, str] | None = None):
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+        _registry.append(self)
+
+    def samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def __init__(self, name: str, help: str, labels: dict[str, str] | None = None):
+        super().__init__(name, help, labels)
+        self.value = 0
+
+    def inc(self, amount: int = 1) -> None:
+        self.value += amount
+
+    def samples(self) -> list[str]:
+        return [f'{self.name}{_format_labels(self.labels)} {_format_value(self.value)}']
+
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def __init__(self, name: str, help: str, labels: dict[str, str] | None = None):
+        super().__init__(name, help, labels)
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def samples(self) -> list[str]:
+        return [f'{self.name}{_format_labels(self.labels)} {_format_value(self.value)}']
+
+
+class CallbackMetric(_Metric):
+    """Значение читается при выгрузке — на горячем пути ничего не стоит."""
+
+    def __init__(self, name: str, help: str, fn: Callable[[], float],
+                 type: str = 'gauge', labels: dict[str, str] | None = None):
+        super().__init__(name, help, labels)
+        self.fn = fn
+        self.type = type
+
+    def samples(self) -> list[str]:
+        return [f'{self.name}{_format_labels(self.labels)} {_format_value(self.fn())}']
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, buckets: tuple[float, ...] = LATENCY_BUCKETS,
+                 labels: dict[str, str] | None = None):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # последняя — +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip((*self.buckets, float('inf')), self.counts):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f'{self.name}_bucket{_format_labels(self.labels, le)} {cumulative}')
+        labels = _format_labels(self.labels)
+        lines.append(f'{self.name}_sum{labels} {_format_value(self.sum)}')
+        lines.append(f'{self.name}_count{labels} {self.count}')
+        return lines
+
+
+def render() -> str:
+    """Все зарегистрированные метрики в text exposition format 0.0.4."""
+    families: dict[str, list[_Metric]] = {}
+    for metric in _registry:
+        families.setdefault(metric.name, []).append(metric)
+
+    lines = []
+    for name, metrics in families.items():
+        lines.append(f'# HELP {name} {metrics[0].help}')
+        lines.append(f'# TYPE {name} {metrics[0].type}')
+        for metric in metrics:
+            lines.extend(metric.samples())
+    return '\n'.join(lines) + '\n'
+
+
+# --- Метрики демона ---
+
+# DNS-захват (скорость — через rate() в Prometheus)
+dns_lines_read = Counter(
+    'sr_dns_lines_read_total', 'Строк (text) или пакетов (pcap), прочитанных из tcpdump')
+dns_lines_parsed = Counter(
+    'sr_dns_lines_parsed_total', 'Строк или пакетов, разобранных как DNS')
+dns_names_matched = Counter(
+    'sr_dns_names_matched_total', 'DNS-имён, переданных в DomainTracker')
+capture_accepted = Counter(
+    'sr_capture_accepted_total', 'DNS-имён, пропущенных фильтром захвата')
+capture_dropped = {
+    reason: Counter('sr_capture_dropped_total', 'DNS-имён, отброшенных фильтром захвата',
+                    {'reason': reason})
+    for reason in ('duplicate', 'own', 'ignored')
+}
+capture_accept_ratio = Gauge(
+    'sr_capture_accept_ratio', 'Доля пропущенных имён за последнюю секунду')
+
+# DomainTracker
+related_latency = Histogram(
+    'sr_related_domains_seconds', 'Время DomainTracker.get_related_domains')
+
+# checker: задержки по этапам одного соединения
+checker_stage = {
+    stage: Histogram('sr_checker_stage_seconds', 'Задержка этапа проверки домена',
+                     labels={'stage': stage})
+    for stage in ('connect', 'tls', 'first_byte')
+}
+
+# Публикация конфига
+config_write = Histogram('sr_config_write_seconds', 'Атомарная запись shadsocks_in.conf')
+git_push = Histogram('sr_git_push_seconds', 'git push (с повторами)')
@@ -5,241 +5,337 @@ Shadowrocket AutoConfig Monitor + HTTP API.
 1. Мониторит DNS-запросы через tcpdump, хранит историю
 2. HTTP API на localhost:7890 для браузерного расширения
 3. При запросе — собирает связанные домены, обновляет конфиг
+4. Автообнаружение (выключено, включается SR_AUTO_DETECT=1): новые домены
+   проверяются checker, о заблокированных спрашивает notifier
 """
 
 import asyncio
+import signal
 import sys
 import os
 import time
 import json
-from http.server import HTTPServer, BaseHTTPRequestHandler
-from threading import Thread
-from urllib.parse import urlparse
+from urllib.parse import urlparse, urlsplit
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from config import DIRECT_TLDS, SYSTEM_DOMAINS, IGNORED_SUFFIXES
-from domain_utils import get_base_domain
-from dns_parser import stream_dns_domains
-from config_updater import (
-    load_config_domains, add_domain_to_config, git_push,
-)
+from domain_utils import get_base_domain, classify_domain, CANDIDATE, DIRECT
+from dns_parser import DomainSource, stream_dns_domains
+from config import SNAPSHOT_FILE, AUTO_DETECT, VPN_SERVICE
+from config_updater import get_document, add_domains_to_config_async, is_current
+from rules import RuleEngine
+from history import DnsHistory
+from cooccurrence import CooccurrenceIndex
+from publisher import ConfigPublisher
+from http_api import ApiServer, Request, Response, StreamResponse, json_response
+from snapshot import Snapshotter, load_snapshot
+from config_watcher import ConfigWatcher
+from revalidate import Revalidator
+from notifier import Notifier, CallbackBackend, make_backend
+from pipeline import DetectionPipeline
+import metrics
 
 # Настройки
 API_PORT = 7890
 DNS_HISTORY_TTL = 60  # секунд — хранить DNS-историю
+DNS_HISTORY_MAX_SIZE = 20000  # жёсткий лимит записей в истории
+RELATED_BUCKET = 2  # секунд — ширина корзины индекса совместной встречаемости
+RELATED_RADIUS = 2  # корзин в каждую сторону от запросов сайта (~±5 с)
+MATCH_MAX_HOSTS = 50000  # хостов в одном запросе POST /match
+MATCH_MAX_BODY = MATCH_MAX_HOSTS * 320  # байт тела /match: URL или хост до ~300 символов на строку
+MATCH_CHUNK = 1000       # строк NDJSON в одном chunk ответа
 
 
 class DomainTracker:
     """Хранит историю DNS-запросов."""
 
-    def __init__(self):
-        self.history: dict[str, float] = {}  # domain -> last_seen timestamp
-        self.config_domains: set[str] = set()
+    def __init__(self, snapshot_path=None):
+        self.history = DnsHistory(DNS_HISTORY_TTL, DNS_HISTORY_MAX_SIZE)
+        self.cooccurrence = CooccurrenceIndex(
+            RELATED_BUCKET, RELATED_RADIUS, DNS_HISTORY_TTL, DNS_HISTORY_MAX_SIZE,
+        )
+        self.rules = RuleEngine([])
+        self.generation = 0  # растёт при каждом изменении document/rules
+        self.watcher: ConfigWatcher | None = None
+
         self._reload_config()
 
+        snapshot = load_snapshot(snapshot_path) if snapshot_path else None
+        if snapshot is not None:
+            for domain, seen in snapshot.events:
+                self.record(domain, seen)
+            print(f"[snapshot] Восстановлено {len(self.history)} доменов DNS-истории")
+
     def _reload_config(self):
-        self.config_domains = load_config_domains()
-        print(f"[config] Loaded {len(self.config_domains)} domains from config")
+        self.generation += 1
+        self.document = get_document()
+        self.rules = RuleEngine(self.document.rules())
+        print(f"[config] Loaded {len(self.rules)} rules from config")
+
+    def is_in_config(self, domain: str) -> bool:
+        """Проверяет, маршрутизирует ли домен какое-либо правило (PROXY или DIRECT)."""
+        return self.rules.covers(domain)
 
-    def record(self, domain: str):
+    def record(self, domain: str, now: float | None = None):
         """Записывает DNS-запрос в историю."""
-        self.history[domain] = time.time()
+        if now is None:
+            now = time.monotonic()
+        self.history.record(domain, now)
+        self.cooccurrence.add(domain, now)
 
     def cleanup(self):
         """Удаляет старые записи из истории."""
-        now = time.time()
-        self.history = {
-            d: t for d, t in self.history.items()
-            if now - t < DNS_HISTORY_TTL
-        }
+        now = time.monotonic()
+        self.history.expire(now)
+        self.cooccurrence.expire(now)
 
     def is_ignorable(self, domain: str) -> bool:
         """Проверяет, нужно ли игнорировать домен."""
-        for suffix in IGNORED_SUFFIXES:
-            if domain.endswith(suffix):
-                return True
-        for sys_domain in SYSTEM_DOMAINS:
-            if domain == sys_domain or domain.endswith('.' + sys_domain):
-                return True
-        return False
+        category = classify_domain(domain)
+        return category != CANDIDATE and category != DIRECT
 
     def get_related_domains(self, base_domain: str) -> list[str]:
         """
-        Собирает все домены из DNS-истории, связанные с сайтом.
-        Возвращает список base-доменов для добавления в конфиг.
+        Собирает домены, резолвившиеся в пределах нескольких секунд от
+        запросов самого сайта. Возвращает base-домены для добавления
+        в конфиг, от самых связанных с сайтом к наименее связанным.
         """
-        now = time.time()
-        related = set()
-
-        for domain, timestamp in self.history.items():
-            if now - timestamp > DNS_HISTORY_TTL:
+        started = time.perf_counter()
+        self.cooccurrence.expire()
+        ranked: dict[str, None] = {}  # упорядоченное множество
+
+        for item in self.cooccurrence.related(base_domain):
+            domain = item.host
+            # Служебные, системные и российские домены — за один проход
+            if classify_domain(domain) != CANDIDATE:
                 continue
-            if self.is_ignorable(domain):
+
+            # Хост уже маршрутизируется правилом (суффикс, keyword, DIRECT)
+            if self.is_in_config(domain):
                 continue
 
             base = get_base_domain(domain)
 
-            # Пропускаем российские TLD
-            skip = False
-            for tld in DIRECT_TLDS:
-                if base.endswith(tld):
-                    skip = True
-                    break
-            if skip:
-                continue
-
             # Пропускаем уже в конфиге
-            if base in self.config_domains:
+            if self.is_in_config(base):
                 continue
 
-            related.add(base)
+            # related() уже отсортирован: первый хост base — самый сильный
+            ranked.setdefault(base, None)
 
-        return sorted(related)
+        metrics.related_latency.observe(time.perf_counter() - started)
+        return list(ranked)
 
-    def add_domains(self, domains: list[str]):
+    async def add_domains(self, domains: list[str]):
         """Добавляет домены в конфиг и обновляет кеш."""
-        for domain in domains:
-            add_domain_to_config(domain)
-            self.config_domains.add(domain)
-            print(f"[added] {domain}")
+        # Файл изменён снаружи, а watcher ещё не заметил — догоняем сейчас
+        if not is_current(self.document):
+            if self.watcher is not None:
+                await self.watcher.check()
+            if not is_current(self.document):
+                self._reload_config()
 
+        self.generation += 1
+        added = await add_domains_to_config_async(domains)
+        self.rules.add(added)
+        self.generation += 1
+        for rule in added:
+            print(f"[added] {rule.value}")
 
-# Глобальный tracker
-tracker = DomainTracker()
 
+# Глобальный tracker: окно DNS-истории — из снимка, правила — из конфига
+tracker = DomainTracker(SNAPSHOT_FILE)
 
-class APIHandler(BaseHTTPRequestHandler):
-    """HTTP API для браузерного расширения."""
+metrics.CallbackMetric('sr_history_size', 'Записей в DNS-истории',
+                       lambda: len(tracker.history))
+metrics.CallbackMetric('sr_history_evictions_total', 'Вытеснено записей из DNS-истории',
+                       lambda: tracker.history.evicted, type='counter')
 
-    def do_OPTIONS(self):
-        """CORS preflight."""
-        self.send_response(200)
-        self._cors_headers()
-        self.end_headers()
 
-    def do_POST(self):
-        if self.path == '/add':
-            self._handle_add()
-        else:
-            self.send_error(404)
-
-    def do_GET(self):
-        if self.path == '/status':
-            self._handle_status()
-        elif self.path.startswith('/domains'):
-            self._handle_domains()
-        else:
-            self.send_error(404)
-
-    def _handle_add(self):
-        """Добавляет домены текущего сайта в конфиг."""
-        content_length = int(self.headers.get('Content-Length', 0))
-        body = self.rfile.read(content_length).decode('utf-8')
+async def handle_add(request: Request) -> Response:
+    """Добавляет домены текущего сайта в конфиг."""
+    try:
+        data = request.json()
+        url = data.get('url', '')
+    except (json.JSONDecodeError, UnicodeDecodeError, AttributeError):
+        return json_response(400, {'error': 'Invalid JSON'})
+
+    parsed = urlparse(url)
+    site_domain = parsed.hostname
+    if not site_domain:
+        return json_response(400, {'error': 'No domain in URL'})
+
+    site_base = get_base_domain(site_domain)
+
+    # Собираем все связанные домены из DNS-истории
+    related = tracker.get_related_domains(site_base)
+
+    # Добавляем и сам домен сайта если его нет
+    if not tracker.is_in_config(site_base):
+        if site_base not in related:
+            related.insert(0, site_base)
+
+    if not related:
+        return json_response(200, {
+            'message': 'Все домены уже в конфиге',
+            'domains': [],
+        })
 
+    # Добавляем в конфиг (запись файла — вне цикла событий)
+    await tracker.add_domains(related)
+
+    # Git commit/push и VPN restart — пачкой в фоновом писателе
+    _publisher.submit(related)
+
+    return json_response(200, {
+        'message': f'Добавлено {len(related)} доменов',
+        'domains': related,
+    })
+
+
+async def handle_status(request: Request) -> Response:
+    """Статус сервиса."""
+    return json_response(200, {
+        'status': 'running',
+        'history_size': len(tracker.history),
+        'config_domains': len(tracker.rules),
+    })
+
+
+async def handle_domains(request: Request) -> Response:
+    """Показывает текущую DNS-историю."""
+    now = time.monotonic()
+    domains = [
+        {'domain': d, 'ago': round(now - t, 1)}
+        for d, t in tracker.history.newest_first()
+    ]
+    return json_response(200, {'domains': domains})
+
+
+def _parse_match_hosts(request: Request) -> list:
+    """Хосты из тела: JSON {"hosts": [...]} или [...], иначе — по одному на строку."""
+    content_type = request.headers.get('content-type', '')
+    if 'json' in content_type and 'ndjson' not in content_type:
+        data = request.json()
+        hosts = data['hosts'] if isinstance(data, dict) else data
+        if not isinstance(hosts, list):
+            raise TypeError('hosts must be a list')
+        return hosts
+    return request.body.decode('utf-8').split()
+
+
+def _match_host(item) -> str | None:
+    """Имя хоста из элемента запроса; URL (например, из HAR) сводится к хосту."""
+    if not isinstance(item, str):
+        return None
+    host = item.strip().lower()
+    if '/' in host:
         try:
-            data = json.loads(body)
-            url = data.get('url', '')
-        except json.JSONDecodeError:
-            self.send_error(400, 'Invalid JSON')
-            return
-
-        parsed = urlparse(url)
-        site_domain = parsed.hostname
-        if not site_domain:
-            self._json_response(400, {'error': 'No domain in URL'})
-            return
-
-        site_base = get_base_domain(site_domain)
-
-        # Собираем все связанные домены из DNS-истории
-        related = tracker.get_related_domains(site_base)
-
-        # Добавляем и сам домен сайта если его нет
-        if site_base not in tracker.config_domains:
-            if site_base not in related:
-                related.insert(0, site_base)
-
-        if not related:
-            self._json_response(200, {
-                'message': 'Все домены уже в конфиге',
-                'domains': [],
-            })
-            return
-
-        # Добавляем в конфиг
-        tracker.add_domains(related)
-
-        # Git push и VPN restart в фоне
-        asyncio.run_coroutine_threadsafe(
-            _push_and_restart(related),
-            _loop,
-        )
-
-        self._json_response(200, {
-            'message': f'Добавлено {len(related)} доменов',
-            'domains': related,
-        })
+            host = urlsplit(host if '//' in host else '//' + host).hostname or ''
+        except ValueError:  # 'http://[::1/' — битый IPv6-литерал
+            return None
+    host = host.rstrip('.')
+    if not host or ' ' in host:
+        return None
+    return host
+
+
+async def _match_lines(hosts: list):
+    """NDJSON по MATCH_CHUNK строк: правило, политика и позиция для каждого хоста."""
+    engine = tracker.rules
+    dumps = json.dumps
+    # Хвост JSON-строки на правило: тысячи хостов обычно делят десятки правил
+    tails: dict[int, str] = {}
+
+    def tail(rule) -> str:
+        key = id(rule)
+        if key not in tails:
+            if rule is None:
+                fields = {'rule': None, 'type': None, 'policy': None, 'position': None}
+            else:
+                fields = {'rule': rule.line, 'type': rule.type,
+                          'policy': rule.policy, 'position': rule.position}
+            tails[key] = dumps(fields, ensure_ascii=False)[1:]
+        return tails[key]
+
+    lines = []
+    for item in hosts:
+        host = _match_host(item)
+        if host is None:
+            lines.append(dumps({'host': item, 'error': 'invalid host'}, ensure_ascii=False))
+        else:
+            # Нет доменного правила — решает FINAL (GEOIP не учитывается)
+            hit = engine.match(host)
+            lines.append(f'{{"host": {dumps(host, ensure_ascii=False)}, '
+                         f'{tail(hit[0] if hit else engine.final)}')
+        if len(lines) >= MATCH_CHUNK:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+            lines.clear()
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+async def handle_match(request: Request) -> Response:
+    """Какое правило маршрутизирует каждый из хостов — по индексу в памяти, NDJSON."""
+    try:
+        hosts = _parse_match_hosts(request)
+    except (json.JSONDecodeError, UnicodeDecodeError, KeyError, TypeError):
+        return json_response(400, {'error': 'Expected {"hosts": [...]} or one host per line'})
+    if len(hosts) > MATCH_MAX_HOSTS:
+        return json_response(413, {'error': f'At most {MATCH_MAX_HOSTS} hosts per request'})
+    return StreamResponse(200, _match_lines(hosts))
+
+
+async def handle_revalidation(request: Request) -> Response:
+    """Прогресс перепроверки PROXY-правил и предложение на удаление."""
+    if _revalidator is None:
+        return json_response(200, {'status': 'disabled'})
+    return json_response(200, _revalidator.status())
+
+
+async def handle_prompts(request: Request) -> Response:
+    """Открытые вопросы о заблокированных доменах (backend 'callback')."""
+    backend = _notifier.backend if _notifier is not None else None
+    if not isinstance(backend, CallbackBackend):
+        return json_response(200, {'prompts': []})
+    return json_response(200, {'prompts': backend.pending()})
+
+
+async def handle_prompt_decision(request: Request) -> Response:
+    """Ответ на вопрос: {"id": 1, "domains": [...домены, которые добавить]}."""
+    backend = _notifier.backend if _notifier is not None else None
+    if not isinstance(backend, CallbackBackend):
+        return json_response(404, {'error': 'Callback backend disabled'})
+    try:
+        data = request.json()
+        prompt_id = int(data['id'])
+        approved = [str(d) for d in data.get('domains', [])]
+    except (json.JSONDecodeError, UnicodeDecodeError, AttributeError,
+            KeyError, TypeError, ValueError):
+        return json_response(400, {'error': 'Invalid JSON'})
+    if not backend.resolve(prompt_id, approved):
+        return json_response(404, {'error': 'No such prompt'})
+    return json_response(200, {'message': 'OK'})
 
-    def _handle_status(self):
-        """Статус сервиса."""
-        self._json_response(200, {
-            'status': 'running',
-            'history_size': len(tracker.history),
-            'config_domains': len(tracker.config_domains),
-        })
 
-    def _handle_domains(self):
-        """Показывает текущую DNS-историю."""
-        tracker.cleanup()
-        now = time.time()
-        domains = [
-            {'domain': d, 'ago': round(now - t, 1)}
-            for d, t in sorted(tracker.history.items(), key=lambda x: -x[1])
-        ]
-        self._json_response(200, {'domains': domains})
-
-    def _json_response(self, code: int, data: dict):
-        self.send_response(code)
-        self._cors_headers()
-        self.send_header('Content-Type', 'application/json')
-        self.end_headers()
-        self.wfile.write(json.dumps(data, ensure_ascii=False).encode('utf-8'))
-
-    def _cors_headers(self):
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-
-    def log_message(self, format, *args):
-        print(f"[api] {args[0]}")
-
-
-async def _push_and_restart(domains: list[str]):
-    """Git push + VPN restart параллельно."""
-    push_task = asyncio.create_task(git_push(', '.join(domains)))
-    vpn_task = asyncio.create_task(_restart_vpn())
-
-    await vpn_task
-    pushed = await push_task
-    if pushed:
-        print(f"[pushed] Изменения отправлены в GitHub")
-    else:
-        print(f"[warn] Не удалось отправить в GitHub")
+async def handle_metrics(request: Request) -> Response:
+    """Метрики в формате Prometheus."""
+    return Response(200, metrics.render().encode('utf-8'),
+                    'text/plain; version=0.0.4; charset=utf-8')
 
 
 async def _restart_vpn():
     """Переподключает VPN."""
     print("[vpn] Переподключаю VPN...")
     proc = await asyncio.create_subprocess_exec(
-        '/usr/sbin/scutil', '--nc', 'stop', 'Shadowrocket',
+        '/usr/sbin/scutil', '--nc', 'stop', VPN_SERVICE,
         stdout=asyncio.subprocess.DEVNULL,
         stderr=asyncio.subprocess.DEVNULL,
     )
     await proc.wait()
     await asyncio.sleep(1)
     proc = await asyncio.create_subprocess_exec(
-        '/usr/sbin/scutil', '--nc', 'start', 'Shadowrocket',
+        '/usr/sbin/scutil', '--nc', 'start', VPN_SERVICE,
         stdout=asyncio.subprocess.DEVNULL,
         stderr=asyncio.subprocess.DEVNULL,
     )
@@ -247,44 +343,89 @@ async def _restart_vpn():
     print("[vpn] VPN переподключен")
 
 
-async def dns_monitor():
-    """Мониторинг DNS-запросов."""
+async def dns_monitor(source: DomainSource | None = None):
+    """Мониторинг DNS-запросов (по умолчанию — живой tcpdump)."""
     print("[dns] Мониторинг DNS-запросов...")
-    cleanup_counter = 0
 
-    async for domain in stream_dns_domains():
+    async for domain in stream_dns_domains(source):
+        metrics.dns_names_matched.inc()
         tracker.record(domain)
-        cleanup_counter += 1
-        if cleanup_counter >= 100:
-            tracker.cleanup()
-            cleanup_counter = 0
-
-
-def start_api_server():
-    """Запускает HTTP API в отдельном потоке."""
-    server = HTTPServer(('127.0.0.1', API_PORT), APIHandler)
+        if _pipeline is not None:
+            _pipeline.feed(domain)
+
+
+async def start_api_server() -> ApiServer:
+    """Запускает HTTP API на текущем цикле событий."""
+    server = ApiServer('127.0.0.1', API_PORT)
+    server.route('POST', '/add', handle_add)
+    server.route('GET', '/status', handle_status)
+    server.route('GET', '/domains', handle_domains)
+    server.route('POST', '/match', handle_match, max_body=MATCH_MAX_BODY)
+    server.route('GET', '/metrics', handle_metrics)
+    server.route('GET', '/revalidation', handle_revalidation)
+    server.route('GET', '/prompts', handle_prompts)
+    server.route('POST', '/prompts', handle_prompt_decision)
+    await server.start()
     print(f"[api] HTTP API слушает на http://127.0.0.1:{API_PORT}")
-    server.serve_forever()
+    return server
 
 
-_loop: asyncio.AbstractEventLoop
+_publisher: ConfigPublisher
+_revalidator: Revalidator | None = None
+_notifier: Notifier | None = None
+_pipeline: DetectionPipeline | None = None
 
 
 async def main():
-    global _loop
-    _loop = asyncio.get_event_loop()
+    global _publisher, _revalidator, _notifier, _pipeline
+
+    # Единственный писатель в git: коммит, push и рестарт VPN раз в окно
+    _publisher = ConfigPublisher(on_published=_restart_vpn)
+    _publisher.start()
 
-    # API-сервер в отдельном потоке
-    api_thread = Thread(target=start_api_server, daemon=True)
-    api_thread.start()
+    # Вопросы пользователю: копятся за окно, обнаружение их не ждёт
+    _notifier = Notifier(make_backend())
+    notifier_task = _notifier.start()
+
+    # Автообнаружение: каждое новое имя проверяется и при блокировке — вопрос
+    if AUTO_DETECT:
+        _pipeline = DetectionPipeline(tracker, _notifier, publish=_publisher.submit)
+        _pipeline.start()
+
+    # API-сервер на том же цикле: DomainTracker трогается только отсюда
+    await start_api_server()
+
+    # Правки конфига снаружи (git pull, редактор) — без рестарта
+    tracker.watcher = ConfigWatcher(tracker)
+    watcher_task = asyncio.create_task(tracker.watcher.run())
+
+    # Перепроверка старых PROXY-правил: медленно, с продолжением после рестарта
+    _revalidator = Revalidator(lambda: tracker.rules.rules)
+    revalidate_task = asyncio.create_task(_revalidator.run())
+
+    # Снимок истории и индекса: переживает рестарт демона через launchd
+    snapshotter = Snapshotter(tracker, SNAPSHOT_FILE)
+    snapshot_task = asyncio.create_task(snapshotter.run())
+    asyncio.get_running_loop().add_signal_handler(
+        signal.SIGTERM, asyncio.current_task().cancel,
+    )
 
     # DNS-мониторинг в основном цикле
     print("[start] Shadowrocket AutoConfig Monitor запущен")
-    await dns_monitor()
+    try:
+        await dns_monitor()
+    finally:
+        notifier_task.cancel()
+        if _pipeline is not None:
+            _pipeline.stop()
+        watcher_task.cancel()
+        revalidate_task.cancel()
+        snapshot_task.cancel()
+        await snapshotter.save()
 
 
 if __name__ == '__main__':
     try:
         asyncio.run(main())
-    except KeyboardInterrupt:
+    except (KeyboardInterrupt, asyncio.CancelledError):
         print("\n[stop] Остановлен")
@@ -1,54 +1,260 @@
-"""macOS уведомления через osascript."""
+"""Уведомления о заблокированных доменах: очередь с агрегацией и сменные backend'ы.
+
+Обнаружение доменов никогда не ждёт пользователя: Notifier.submit() только
+кладёт домены в очередь. Фоновая задача собирает их за окно в один
+вопрос, задаёт его через backend и отдаёт решение в on_decision.
+"""
 
 import asyncio
+import itertools
 import os
+import time
+from typing import Awaitable, Callable, Protocol
 
+from config import (
+    NOTIFY_BACKEND, NOTIFY_WINDOW, NOTIFY_MAX_DELAY, NOTIFY_TIMEOUT, GUI_USER_TTL,
+)
 
-def _get_gui_user() -> str:
-    """Определяет пользователя текущей GUI-сессии."""
-    return os.popen("stat -f%Su /dev/console").read().strip() or "mac"
 
+class NotifierBackend(Protocol):
+    """Способ спросить пользователя. None — ответа не было (таймаут, ошибка)."""
 
-async def ask_user_add_domains(domains: list[str]) -> list[str]:
-    """
-    Показывает macOS диалог со списком заблокированных доменов.
-    Возвращает список доменов, которые пользователь согласился добавить.
-    """
-    if not domains:
-        return []
+    async def ask(self, domains: list[str]) -> list[str] | None: ...
 
+
+def _dialog_script(domains: list[str], timeout: int) -> str:
     domain_list = '\\n'.join(f'  • {d}' for d in domains)
     count = len(domains)
     word = _plural(count)
-
-    script = (
+    return (
         f'display dialog "Обнаружен{_ending(count)} {count} заблокированн{word} домен{_suffix(count)}:\\n'
         f'{domain_list}\\n\\n'
         f'Добавить в прокси Shadowrocket?" '
         f'with title "Shadowrocket AutoConfig" '
         f'buttons {{"Игнорировать", "Добавить все"}} '
         f'default button "Добавить все" '
-        f'giving up after 60'
+        f'giving up after {timeout}'
     )
 
-    gui_user = _get_gui_user()
 
-    if os.geteuid() == 0 and gui_user != 'root':
-        cmd = ['/usr/bin/sudo', '-u', gui_user, '/usr/bin/osascript', '-e', script]
-    else:
-        cmd = ['/usr/bin/osascript', '-e', script]
+class OsascriptBackend:
+    """Диалог macOS через osascript от имени пользователя GUI-сессии."""
 
-    proc = await asyncio.create_subprocess_exec(
-        *cmd,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.DEVNULL,
-    )
-    stdout, _ = await proc.communicate()
-    result = stdout.decode('utf-8', errors='ignore')
+    def __init__(self, timeout: int = NOTIFY_TIMEOUT, user_ttl: float = GUI_USER_TTL):
+        self.timeout = timeout
+        self.user_ttl = user_ttl
+        self._gui_user: str | None = None
+        self._gui_user_at = 0.0
+
+    async def gui_user(self) -> str:
+        """Пользователь консоли; перечитывается не чаще раза в user_ttl секунд."""
+        now = time.monotonic()
+        if self._gui_user is None or now - self._gui_user_at > self.user_ttl:
+            proc = await asyncio.create_subprocess_exec(
+                '/usr/bin/stat', '-f%Su', '/dev/console',
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+            stdout, _ = await proc.communicate()
+            self._gui_user = stdout.decode('utf-8', errors='ignore').strip() or 'mac'
+            self._gui_user_at = now
+        return self._gui_user
+
+    async def ask(self, domains: list[str]) -> list[str] | None:
+        script = _dialog_script(domains, self.timeout)
+        gui_user = await self.gui_user()
+
+        if os.geteuid() == 0 and gui_user != 'root':
+            cmd = ['/usr/bin/sudo', '-u', gui_user, '/usr/bin/osascript', '-e', script]
+        else:
+            cmd = ['/usr/bin/osascript', '-e', script]
+
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        stdout, _ = await proc.communicate()
+        result = stdout.decode('utf-8', errors='ignore')
+
+        if 'gave up:true' in result or proc.returncode != 0:
+            return None
+        if 'Добавить' in result:
+            return domains
+        return []
+
+
+class ConsoleBackend:
+    """
+    Без GUI (Linux, тесты): печатает вопрос. approve=None — ответа нет
+    (ничего не добавляется и не игнорируется), True/False — сразу всё
+    добавить или отклонить.
+    """
+
+    def __init__(self, approve: bool | None = None):
+        self.approve = approve
+
+    async def ask(self, domains: list[str]) -> list[str] | None:
+        print(f"[notify] Заблокировано {len(domains)}: {', '.join(domains)}")
+        if self.approve is None:
+            return None
+        return list(domains) if self.approve else []
+
+
+class Prompt:
+    """Вопрос, ждущий ответа через API."""
+
+    def __init__(self, prompt_id: int, domains: list[str]):
+        self.id = prompt_id
+        self.domains = domains
+        self.created = time.time()
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    def as_dict(self) -> dict:
+        return {'id': self.id, 'domains': self.domains, 'created': self.created}
+
+
+class CallbackBackend:
+    """
+    Вопрос ждёт ответа через HTTP API (расширение браузера): GET /prompts
+    показывает открытые вопросы, POST /prompts присылает решение.
+    """
+
+    def __init__(self, timeout: float = NOTIFY_TIMEOUT):
+        self.timeout = timeout
+        self.prompts: dict[int, Prompt] = {}
+        self._ids = itertools.count(1)
+
+    def pending(self) -> list[dict]:
+        return [prompt.as_dict() for prompt in self.prompts.values()]
+
+    def resolve(self, prompt_id: int, approved: list[str]) -> bool:
+        """Ответ пользователя; лишние домены в approved игнорируются."""
+        prompt = self.prompts.get(prompt_id)
+        if prompt is None or prompt.future.done():
+            return False
+        allowed = set(prompt.domains)
+        prompt.future.set_result([d for d in approved if d in allowed])
+        return True
+
+    async def ask(self, domains: list[str]) -> list[str] | None:
+        prompt = Prompt(next(self._ids), domains)
+        self.prompts[prompt.id] = prompt
+        try:
+            return await asyncio.wait_for(prompt.future, timeout=self.timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            del self.prompts[prompt.id]
+
+
+def make_backend(name: str = NOTIFY_BACKEND) -> NotifierBackend:
+    if name == 'osascript':
+        return OsascriptBackend()
+    if name == 'callback':
+        return CallbackBackend()
+    if name == 'console':
+        return ConsoleBackend()
+    raise ValueError(f'Неизвестный backend уведомлений: {name}')
+
+
+Decision = Callable[[list[str], list[str]], Awaitable[None]]
+
+
+class Notifier:
+    """
+    Очередь уведомлений. submit() не блокирует; домены, найденные за
+    window секунд (но не дольше max_delay от первого), уходят одним
+    вопросом. Пока вопрос открыт, новые домены копятся для следующего.
+    Решение — on_decision(добавить, отклонить); без ответа домены
+    просто забываются и могут быть найдены снова.
+    """
+
+    def __init__(
+        self,
+        backend: NotifierBackend,
+        on_decision: Decision | None = None,
+        window: float = NOTIFY_WINDOW,
+        max_delay: float = NOTIFY_MAX_DELAY,
+    ):
+        self.backend = backend
+        self.on_decision = on_decision
+        self.window = window
+        self.max_delay = max_delay
+
+        self._pending: dict[str, None] = {}  # упорядоченное множество
+        self._asking: set[str] = set()       # в открытом вопросе
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
 
-    if 'Добавить' in result and 'gave up:true' not in result:
-        return domains
-    return []
+    def submit(self, domains: list[str]) -> None:
+        """Ставит домены в очередь вопроса. Не блокирует."""
+        for domain in domains:
+            if domain not in self._asking:
+                self._pending[domain] = None
+        if self._pending:
+            self._wakeup.set()
+
+    def start(self) -> asyncio.Task:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            await self._debounce()
+            await self.flush()
+
+    async def _debounce(self) -> None:
+        """Ждёт тишины window секунд, но не дольше max_delay."""
+        loop = asyncio.get_running_loop()
+        give_up_at = loop.time() + self.max_delay
+        while True:
+            self._wakeup.clear()
+            timeout = min(self.window, give_up_at - loop.time())
+            if timeout <= 0:
+                return
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                return
+
+    async def flush(self) -> None:
+        """Задаёт вопрос по накопленным доменам и передаёт решение."""
+        self._wakeup.clear()
+        domains = list(self._pending)
+        self._pending.clear()
+        if not domains:
+            return
+
+        self._asking.update(domains)
+        try:
+            approved = await self.backend.ask(domains)
+        except Exception as e:
+            print(f"[notify error] {e!r}")
+            approved = None
+        finally:
+            self._asking.difference_update(domains)
+
+        if approved is None or self.on_decision is None:
+            return
+        chosen = set(approved)
+        rejected = [d for d in domains if d not in chosen]
+        try:
+            await self.on_decision(approved, rejected)
+        except Exception as e:
+            print(f"[notify error] Обработка решения: {e!r}")
+
+
+async def ask_user_add_domains(domains: list[str]) -> list[str]:
+    """
+    Показывает macOS диалог со списком заблокированных доменов.
+    Возвращает список доменов, которые пользователь согласился добавить.
+    """
+    if not domains:
+        return []
+    return await OsascriptBackend().ask(domains) or []
 
 
 def _plural(n: int) -> str:
@@ -0,0 +1,191 @@
+"""Автоматическое обнаружение: DNS → фильтр → checker → уведомление → запись.
+
+Этапы связаны ограниченными asyncio-очередями, у каждого свои воркеры.
+Захват DNS нельзя притормозить, поэтому очереди фильтра и проверки при
+переполнении вытесняют самые старые элементы; очереди уведомления и
+записи маленькие и дают обычное обратное давление. Так всплеск DNS
+ограничен по памяти размерами очередей.
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable
+
+from config import (
+    DEDUP_TTL,
+    PIPELINE_INGEST_QUEUE, PIPELINE_CHECK_QUEUE, PIPELINE_NOTIFY_QUEUE, PIPELINE_WRITE_QUEUE,
+    PIPELINE_CHECK_WORKERS, PIPELINE_DEDUP_MAX_SIZE,
+)
+from config_updater import load_ignored_domains, save_ignored_domain
+from domain_utils import get_base_domain, classify_domain, CANDIDATE
+import metrics
+
+
+class Stage:
+    """
+    Очередь и воркеры одного этапа. handler вызывается на каждый элемент;
+    исключения логируются и не останавливают воркер.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[Any], Awaitable[None]],
+        maxsize: int,
+        workers: int = 1,
+        drop_oldest: bool = False,
+        on_drop: Callable[[Any], None] | None = None,
+    ):
+        self.name = name
+        self.handler = handler
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.workers = workers
+        self.drop_oldest = drop_oldest
+        self.on_drop = on_drop
+
+        labels = {'stage': name}
+        self.processed = metrics.Counter(
+            'sr_pipeline_processed_total', 'Элементов, обработанных этапом конвейера', labels)
+        self.dropped = metrics.Counter(
+            'sr_pipeline_dropped_total', 'Элементов, вытесненных из очереди этапа', labels)
+        metrics.CallbackMetric(
+            'sr_pipeline_queue_depth', 'Элементов в очереди этапа конвейера',
+            self.queue.qsize, labels=labels)
+
+    def put_nowait(self, item) -> None:
+        """Для этапов с вытеснением: кладёт элемент, выбрасывая самый старый."""
+        if self.queue.full():
+            old = self.queue.get_nowait()
+            self.queue.task_done()
+            self.dropped.inc()
+            if self.on_drop is not None:
+                self.on_drop(old)
+        self.queue.put_nowait(item)
+
+    async def put(self, item) -> None:
+        if self.drop_oldest:
+            self.put_nowait(item)
+        else:
+            await self.queue.put(item)  # ждём, пока этап разгрузится
+
+    async def _work(self) -> None:
+        while True:
+            item = await self.queue.get()
+            try:
+                await self.handler(item)
+            except Exception as e:
+                print(f"[pipeline error] {self.name}: {e!r}")
+            finally:
+                self.queue.task_done()
+                self.processed.inc()
+
+    def start(self) -> list[asyncio.Task]:
+        return [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+
+class DetectionPipeline:
+    """
+    feed(имя) → classify (base-домен, фильтр, дедупликация) → check
+    (checker с кешем вердиктов) → notify (Notifier копит и спрашивает) →
+    write (решение пользователя: конфиг и публикация либо ignored_domains).
+
+    Домен, прошедший дедупликацию, не проверяется повторно DEDUP_TTL
+    секунд; если он вытеснен из очереди проверки, отметка снимается и
+    следующий DNS-запрос снова его поставит.
+    """
+
+    def __init__(self, tracker, notifier, publish: Callable[[list[str]], None] | None = None,
+                 check: Callable[[str], Awaitable[bool]] | None = None,
+                 check_workers: int = PIPELINE_CHECK_WORKERS, dedup_ttl: float = DEDUP_TTL):
+        self.tracker = tracker
+        self.notifier = notifier
+        self.publish = publish
+        self.check = check
+        self.dedup_ttl = dedup_ttl
+
+        self.ignored = load_ignored_domains()
+        self._recent: dict[str, float] = {}  # base → время постановки, по возрастанию
+
+        self.classify_stage = Stage('classify', self._classify, PIPELINE_INGEST_QUEUE,
+                                    drop_oldest=True)
+        self.check_stage = Stage('check', self._check, PIPELINE_CHECK_QUEUE,
+                                 workers=check_workers, drop_oldest=True,
+                                 on_drop=self._forget)
+        self.notify_stage = Stage('notify', self._notify, PIPELINE_NOTIFY_QUEUE)
+        self.write_stage = Stage('write', self._write, PIPELINE_WRITE_QUEUE)
+        self.stages = (self.classify_stage, self.check_stage, self.notify_stage, self.write_stage)
+
+        notifier.on_decision = self.decide
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        if self.check is None:
+            from checker import check_domain
+            self.check = check_domain
+        for stage in self.stages:
+            self._tasks.extend(stage.start())
+
+    def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self._tasks.clear()
+
+    def feed(self, domain: str) -> None:
+        """Имя из захвата DNS. Не блокирует."""
+        self.classify_stage.put_nowait(domain)
+
+    def _is_recent(self, base: str, now: float) -> bool:
+        recent = self._recent
+        # Словарь упорядочен по времени: истёкшие — в начале
+        while recent:
+            oldest = next(iter(recent))
+            if now - recent[oldest] < self.dedup_ttl and len(recent) < PIPELINE_DEDUP_MAX_SIZE:
+                break
+            del recent[oldest]
+        return base in recent
+
+    def _forget(self, base: str) -> None:
+        self._recent.pop(base, None)
+
+    async def _classify(self, domain: str) -> None:
+        base = get_base_domain(domain)
+        if self._is_recent(base, time.monotonic()):
+            return
+        if base in self.ignored or classify_domain(base) != CANDIDATE:
+            return
+        if self.tracker.is_in_config(base):
+            return
+        self._recent[base] = time.monotonic()
+        await self.check_stage.put(base)
+
+    async def _check(self, base: str) -> None:
+        if self.tracker.is_in_config(base):
+            return  # добавлен через /add, пока ждал очереди
+        if await self.check(base):
+            print(f"[detect] Заблокирован: {base}")
+            await self.notify_stage.put(base)
+
+    async def _notify(self, base: str) -> None:
+        if base not in self.ignored and not self.tracker.is_in_config(base):
+            self.notifier.submit([base])
+
+    async def decide(self, approved: list[str], rejected: list[str]) -> None:
+        """on_decision для Notifier: запись идёт отдельным этапом."""
+        await self.write_stage.put((approved, rejected))
+
+    async def _write(self, decision: tuple[list[str], list[str]]) -> None:
+        approved, rejected = decision
+        approved = [d for d in approved if not self.tracker.is_in_config(d)]
+        if approved:
+            await self.tracker.add_domains(approved)
+            if self.publish is not None:
+                self.publish(approved)
+        rejected = [d for d in rejected if d not in self.ignored]
+        if rejected:
+            self.ignored.update(rejected)
+
+            def save():
+                for domain in rejected:
+                    save_ignored_domain(domain)
+            await asyncio.to_thread(save)
+            print(f"[notify] Игнорирую: {', '.join(rejected)}")
@@ -0,0 +1,143 @@
+"""Отложенная публикация изменений конфига: один commit/push/рестарт VPN на окно."""
+
+import asyncio
+import time
+from typing import Awaitable, Callable
+
+from config import (
+    PUBLISH_WINDOW, PUBLISH_MAX_DELAY, PUSH_RETRIES, PUSH_BACKOFF,
+    PUBLISH_RETRY_DELAY, PUBLISH_RETRY_MAX_DELAY,
+)
+from config_updater import git_commit, git_push_remote
+import metrics
+
+
+def commit_message(domains: list[str]) -> str:
+    """Сообщение коммита для пачки доменов."""
+    if len(domains) <= 3:
+        return f"Add {', '.join(domains)} to proxy"
+    body = '\n'.join(f'- {d}' for d in domains)
+    return f"Add {len(domains)} domains to proxy\n\n{body}"
+
+
+class ConfigPublisher:
+    """
+    Единственный фоновый писатель в git.
+
+    submit() только копит домены. Фоновая задача ждёт, пока добавления
+    затихнут на PUBLISH_WINDOW секунд (но не дольше PUBLISH_MAX_DELAY),
+    делает один коммит с общим сообщением, один push с повторами и
+    экспоненциальной паузой и не больше одного рестарта VPN на окно.
+    Если коммит или push так и не удались, публикация повторяется сама
+    через retry_delay секунд (пауза удваивается до retry_max_delay),
+    не дожидаясь следующего submit().
+    """
+
+    def __init__(
+        self,
+        on_published: Callable[[], Awaitable[None]] | None = None,
+        window: float = PUBLISH_WINDOW,
+        max_delay: float = PUBLISH_MAX_DELAY,
+        retries: int = PUSH_RETRIES,
+        backoff: float = PUSH_BACKOFF,
+        retry_delay: float = PUBLISH_RETRY_DELAY,
+        retry_max_delay: float = PUBLISH_RETRY_MAX_DELAY,
+    ):
+        self.on_published = on_published
+        self.window = window
+        self.max_delay = max_delay
+        self.retries = retries
+        self.backoff = backoff
+        self.retry_delay = retry_delay
+        self.retry_max_delay = retry_max_delay
+
+        self._pending: dict[str, None] = {}  # упорядоченное множество
+        self._wakeup = asyncio.Event()
+        self._unpushed = False  # есть локальные коммиты, не дошедшие до remote
+        self._task: asyncio.Task | None = None
+
+    def submit(self, domains: list[str]) -> None:
+        """Ставит домены в очередь публикации. Не блокирует."""
+        for domain in domains:
+            self._pending[domain] = None
+        self._wakeup.set()
+
+    def start(self) -> asyncio.Task:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def run(self) -> None:
+        retry: float | None = None  # пауза до повтора неудачной публикации
+        while True:
+            if retry is None:
+                await self._wakeup.wait()
+                await self._debounce()
+            else:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=retry)
+                except asyncio.TimeoutError:
+                    pass  # повтор по таймеру — окно тишины уже было
+                else:
+                    await self._debounce()
+            if await self.flush():
+                retry = None
+            else:
+                retry = min(self.retry_max_delay, retry * 2 if retry else self.retry_delay)
+                print(f"[warn] Публикация не удалась, повтор через {retry:.0f}с")
+
+    async def _debounce(self) -> None:
+        """Ждёт тишины window секунд, но не дольше max_delay."""
+        loop = asyncio.get_running_loop()
+        give_up_at = loop.time() + self.max_delay
+        while True:
+            self._wakeup.clear()
+            timeout = min(self.window, give_up_at - loop.time())
+            if timeout <= 0:
+                return
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                return
+
+    async def flush(self) -> bool:
+        """Публикует накопленное прямо сейчас. True — всё дошло до remote."""
+        self._wakeup.clear()
+        domains = list(self._pending)
+        self._pending.clear()
+
+        if domains:
+            if not await git_commit(commit_message(domains)):
+                # Вернём домены в очередь — run() повторит после паузы
+                for domain in domains:
+                    self._pending.setdefault(domain, None)
+                return False
+            self._unpushed = True
+        if not self._unpushed:
+            return True
+
+        restart = None
+        if domains and self.on_published is not None:
+            restart = asyncio.create_task(self.on_published())
+
+        started = time.perf_counter()
+        pushed = await self._push_with_retry()
+        metrics.git_push.observe(time.perf_counter() - started)
+        if restart is not None:
+            await restart
+
+        if pushed:
+            self._unpushed = False
+            print(f"[pushed] Изменения отправлены ({len(domains)} доменов)")
+        return pushed
+
+    async def _push_with_retry(self) -> bool:
+        delay = self.backoff
+        for attempt in range(1, self.retries + 1):
+            if await git_push_remote():
+                return True
+            if attempt < self.retries:
+                print(f"[git] push не удался, повтор через {delay:.0f}с ({attempt}/{self.retries})")
+                await asyncio.sleep(delay)
+                delay *= 2
+        return False
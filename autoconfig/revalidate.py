@@ -0,0 +1,263 @@
+"""Фоновая перепроверка PROXY-правил с чекпоинтом и предложением на удаление."""
+
+import asyncio
+import json
+import time
+from pathlib import Path
+from typing import Awaitable, Callable
+
+from config import (
+    REVALIDATE_INTERVAL, REVALIDATE_RATE, REVALIDATE_CONCURRENCY, REVALIDATE_PRUNE_RUNS,
+    REVALIDATE_CHECKPOINT_FILE, REVALIDATE_PROPOSAL_FILE, REVALIDATE_VPN_RETRY,
+    VPN_SERVICE, VPN_STATUS_TTL,
+)
+from config_document import atomic_write
+from compact import is_hostname_keyword
+from rules import Rule
+
+
+CHECKPOINT_EVERY = 10  # проверок между записями чекпоинта
+
+
+async def vpn_connected(service: str = VPN_SERVICE) -> bool:
+    """
+    Подключён ли VPN-сервис (scutil --nc status). Через туннель любой
+    PROXY-домен доступен, так что проверка «напрямую» ничего не значит.
+    Нет scutil или сервиса — считаем, что VPN нет.
+    """
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            '/usr/sbin/scutil', '--nc', 'status', service,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+    except OSError:
+        return False
+    stdout, _ = await proc.communicate()
+    if proc.returncode != 0:
+        return False
+    lines = stdout.decode(errors='ignore').splitlines()
+    # Connecting/Disconnecting тоже не годятся: маршруты уже (или ещё) туннельные
+    return bool(lines) and lines[0].strip() != 'Disconnected'
+
+
+def checkable_domain(rule: Rule) -> str | None:
+    """Имя хоста, по которому можно проверить правило, или None."""
+    if rule.policy != 'PROXY':
+        return None
+    if rule.type in ('DOMAIN', 'DOMAIN-SUFFIX') or is_hostname_keyword(rule):
+        return rule.value
+    return None
+
+
+class Revalidator:
+    """
+    Прогон за прогоном проверяет PROXY-правила напрямую через checker.
+
+    Проверки идут медленно (rate в секунду, не больше concurrency сразу),
+    чтобы не занимать семафор checker у живых запросов из браузера.
+    Состояние — streak «сколько прогонов подряд правило доступно без прокси»
+    и список уже проверенных в текущем прогоне — пишется в JSON, поэтому
+    после рестарта прогон продолжается с того же места. Правила со
+    streak >= prune_runs попадают в предложение на удаление.
+
+    Проверки с той же машины, где поднят туннель Shadowrocket, идут через
+    VPN, и любой домен выглядит доступным. Поэтому при подключённом VPN
+    прогон приостанавливается (чекпоинт сохраняется), а результат
+    проверки, во время которой VPN оказался подключён, не засчитывается.
+    """
+
+    def __init__(
+        self,
+        rules: Callable[[], list[Rule]],
+        probe: Callable[[str], Awaitable[bool]] | None = None,
+        checkpoint: Path = REVALIDATE_CHECKPOINT_FILE,
+        proposal: Path = REVALIDATE_PROPOSAL_FILE,
+        interval: float = REVALIDATE_INTERVAL,
+        rate: float = REVALIDATE_RATE,
+        concurrency: int = REVALIDATE_CONCURRENCY,
+        prune_runs: int = REVALIDATE_PRUNE_RUNS,
+        vpn_active: Callable[[], Awaitable[bool]] = vpn_connected,
+        vpn_retry: float = REVALIDATE_VPN_RETRY,
+    ):
+        self.rules = rules
+        self.probe = probe
+        self.checkpoint = checkpoint
+        self.proposal_path = proposal
+        self.interval = interval
+        self.rate = rate
+        self.concurrency = concurrency
+        self.prune_runs = prune_runs
+        self.vpn_active = vpn_active
+        self.vpn_retry = vpn_retry
+        self._vpn_checked_at = float('-inf')
+        self._vpn = False
+
+        # Состояние, которое переживает рестарт
+        self.run_number = 0
+        self.in_progress = False
+        self.finished_at = 0.0        # unix-время окончания последнего прогона
+        self.done: set[str] = set()   # rule.line, проверенные в текущем прогоне
+        self.streak: dict[str, int] = {}
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            state = json.loads(self.checkpoint.read_text(encoding='utf-8'))
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"[revalidate] Чекпоинт {self.checkpoint} не прочитан ({e}), начинаю заново")
+            return
+        self.run_number = state.get('run', 0)
+        self.in_progress = state.get('in_progress', False)
+        self.finished_at = state.get('finished_at', 0.0)
+        self.done = set(state.get('done', []))
+        self.streak = dict(state.get('streak', {}))
+
+    def _state(self) -> str:
+        return json.dumps({
+            'run': self.run_number,
+            'in_progress': self.in_progress,
+            'finished_at': self.finished_at,
+            'done': sorted(self.done),
+            'streak': self.streak,
+        }, ensure_ascii=False, indent=1)
+
+    async def _vpn_up(self) -> bool:
+        """vpn_active() с кешем на VPN_STATUS_TTL: не запускать scutil на каждую проверку."""
+        now = time.monotonic()
+        if now - self._vpn_checked_at >= VPN_STATUS_TTL:
+            self._vpn = await self.vpn_active()
+            self._vpn_checked_at = now
+        return self._vpn
+
+    async def _save(self) -> None:
+        await asyncio.to_thread(atomic_write, self.checkpoint, self._state())
+
+    def proposal(self) -> list[tuple[Rule, int]]:
+        """(правило, streak) для правил, доступных напрямую prune_runs прогонов подряд."""
+        result = []
+        for rule in self.rules():
+            streak = self.streak.get(rule.line, 0)
+            if checkable_domain(rule) and streak >= self.prune_runs:
+                result.append((rule, streak))
+        return result
+
+    def _proposal_text(self) -> str:
+        lines = [
+            f'# Правила, доступные без прокси {self.prune_runs}+ прогонов подряд',
+            f'# (прогон #{self.run_number}, {time.strftime("%Y-%m-%d %H:%M")}).',
+            '# Проверьте вручную и удалите из shadsocks_in.conf.',
+        ]
+        lines += [f'{rule.line}  # доступен прогонов подряд: {streak}' for rule, streak in self.proposal()]
+        return '\n'.join(lines) + '\n'
+
+    def status(self) -> dict:
+        pending = [r for r in self.rules() if checkable_domain(r) and r.line not in self.done]
+        return {
+            'run': self.run_number,
+            'in_progress': self.in_progress,
+            'checked': len(self.done),
+            'pending': len(pending) if self.in_progress else 0,
+            'finished_at': self.finished_at,
+            'proposal': [rule.line for rule, _ in self.proposal()],
+        }
+
+    async def _check(self, rule: Rule, limit: asyncio.Semaphore) -> None:
+        try:
+            blocked = await self.probe(checkable_domain(rule))
+        except Exception as e:
+            print(f"[revalidate] {rule.value}: ошибка проверки {e!r}")
+            return  # не засчитываем ни в одну сторону, повторим в следующем прогоне
+        finally:
+            limit.release()
+        if not blocked and await self._vpn_up():
+            return  # «доступен» через туннель — не считается, повторим позже
+        line = rule.line
+        self.streak[line] = 0 if blocked else self.streak.get(line, 0) + 1
+        self.done.add(line)
+
+    async def run_once(self) -> bool:
+        """
+        Один прогон (или его продолжение после рестарта).
+        False — приостановлен из-за VPN, прогон останется in_progress.
+        """
+        if self.probe is None:
+            from checker import is_domain_blocked
+            self.probe = is_domain_blocked
+
+        if await self._vpn_up():
+            print(f"[revalidate] VPN {VPN_SERVICE} подключён — прямые проверки недостоверны, "
+                  f"откладываю на {self.vpn_retry:.0f}с")
+            return False
+
+        if not self.in_progress:
+            self.run_number += 1
+            self.in_progress = True
+            self.done.clear()
+            await self._save()
+        print(f"[revalidate] Прогон #{self.run_number}: уже проверено {len(self.done)}")
+
+        limit = asyncio.Semaphore(self.concurrency)
+        tasks: set[asyncio.Task] = set()
+        launched: set[str] = set()  # в конфиге бывают дубликаты строк
+        checked = 0
+        try:
+            # Список берём заново: конфиг мог измениться за время прогона
+            for rule in self.rules():
+                if not checkable_domain(rule) or rule.line in self.done or rule.line in launched:
+                    continue
+                if await self._vpn_up():
+                    break
+                launched.add(rule.line)
+                await limit.acquire()
+                task = asyncio.create_task(self._check(rule, limit))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                checked += 1
+                if checked % CHECKPOINT_EVERY == 0:
+                    await self._save()
+                await asyncio.sleep(1 / self.rate)
+            if tasks:
+                await asyncio.gather(*tasks)
+        except asyncio.CancelledError:
+            # Остановка демона: сохраняем прогресс синхронно, цикл уже сворачивается
+            atomic_write(self.checkpoint, self._state())
+            raise
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        if await self._vpn_up():
+            await self._save()
+            print(f"[revalidate] Прогон #{self.run_number} приостановлен: подключился VPN "
+                  f"(проверено {len(self.done)})")
+            return False
+
+        # Правила, которых больше нет в конфиге, забываем
+        alive = {rule.line for rule in self.rules()}
+        self.streak = {line: n for line, n in self.streak.items() if line in alive}
+        self.in_progress = False
+        self.finished_at = time.time()
+        await self._save()
+
+        proposal = self.proposal()
+        await asyncio.to_thread(atomic_write, self.proposal_path, self._proposal_text())
+        print(f"[revalidate] Прогон #{self.run_number} завершён: проверено {len(self.done)}, "
+              f"предложено удалить {len(proposal)} (см. {self.proposal_path})")
+        return True
+
+    async def run(self) -> None:
+        """Расписание: незавершённый прогон продолжается сразу, дальше — раз в interval."""
+        while True:
+            if not self.in_progress:
+                wait = self.finished_at + self.interval - time.time()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            try:
+                if not await self.run_once():
+                    await asyncio.sleep(self.vpn_retry)
+            except OSError as e:
+                print(f"[revalidate] Не удалось записать состояние: {e}")
+                await asyncio.sleep(60)
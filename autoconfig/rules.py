@@ -0,0 +1,395 @@
+"""Скомпилированный движок правил [Rule] с семантикой первого совпадения.
+
+DOMAIN и DOMAIN-SUFFIX хранятся в дереве по перевёрнутым меткам домена,
+DOMAIN-KEYWORD — в автомате Ахо-Корасик. Оба индекса для каждого узла
+держат правило с наименьшей позицией, поэтому match() работает за
+O(len(domain)) независимо от числа правил.
+"""
+
+import re
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+
+
+# Типы правил, которые можно проверить по одному имени хоста
+DOMAIN_RULE_TYPES = ('DOMAIN', 'DOMAIN-SUFFIX', 'DOMAIN-KEYWORD')
+
+# Имя хоста: метки из [a-z0-9_-] по 1–63 символа, всего до 253.
+# Всё, что попадает в [Rule], проходит эту проверку: запятая, пробел
+# или перевод строки в значении испортили бы секцию.
+HOSTNAME_RE = re.compile(r'(?=.{1,253}\Z)[a-z0-9_-]{1,63}(?:\.[a-z0-9_-]{1,63})*')
+KEYWORD_RE = re.compile(r'[a-z0-9._-]+')
+
+
+def is_hostname(name: str) -> bool:
+    return HOSTNAME_RE.fullmatch(name) is not None
+
+
+def is_valid_value(rule: 'Rule') -> bool:
+    """Может ли значение доменного правила вообще совпасть с хостом."""
+    if rule.type == 'DOMAIN-KEYWORD':
+        return KEYWORD_RE.fullmatch(rule.value) is not None
+    return HOSTNAME_RE.fullmatch(rule.value) is not None
+
+
+def is_writable(rule: 'Rule') -> bool:
+    """
+    Можно ли записать правило в [Rule] одной строкой, не меняя других:
+    доменное значение — имя хоста или keyword, в остальных полях нет
+    переводов строк, в значении и политике — запятых.
+    """
+    if rule.type in DOMAIN_RULE_TYPES and not is_valid_value(rule):
+        return False
+    fields = (rule.type, rule.value, rule.policy)
+    if any(',' in f or '\n' in f or '\r' in f for f in fields):
+        return False
+    return bool(rule.policy) and '\n' not in rule.options and '\r' not in rule.options
+
+
+@dataclass(eq=False)
+class Rule:
+    """Одно правило секции [Rule]. position — порядковый номер в секции."""
+
+    type: str
+    value: str
+    policy: str
+    position: int = 0
+    options: str = ''  # хвост после политики, например 'no-resolve'
+
+    @property
+    def line(self) -> str:
+        if self.type == 'FINAL':
+            line = f'FINAL,{self.policy}'
+        else:
+            line = f'{self.type},{self.value},{self.policy}'
+        return f'{line},{self.options}' if self.options else line
+
+    @property
+    def key(self) -> tuple[str, str, str]:
+        return (self.type, self.value, self.policy)
+
+    def __repr__(self) -> str:
+        return f'Rule({self.line!r}, position={self.position})'
+
+
+def normalize_value(rule_type: str, value: str) -> str:
+    """Приводит значение доменного правила к виду, в котором оно матчится.
+
+    Ведущая точка у DOMAIN-SUFFIX ('.ru') эквивалентна её отсутствию.
+    Внутренние пробелы не трогаем: '. org' не должно превратиться в 'org'.
+    """
+    value = value.lower()
+    if rule_type == 'DOMAIN-SUFFIX':
+        value = value.lstrip('.')
+    return value
+
+
+def parse_rule(line: str) -> Rule | None:
+    """Разбирает строку правила. Комментарии и пустые строки → None."""
+    line = line.strip()
+    if not line or line.startswith('//') or line.startswith('#'):
+        return None
+
+    parts = [p.strip() for p in line.split(',')]
+    rule_type = parts[0].upper()
+
+    if rule_type == 'FINAL':
+        policy = parts[1] if len(parts) > 1 else 'DIRECT'
+        return Rule('FINAL', '', policy, options=','.join(parts[2:]))
+    if len(parts) < 3:
+        return None
+
+    # Значение берём без strip(): '. org' должно остаться сломанным
+    raw_value = line.split(',')[1]
+    if rule_type in DOMAIN_RULE_TYPES:
+        value = normalize_value(rule_type, raw_value.lstrip())
+    else:
+        value = raw_value.strip()
+    return Rule(rule_type, value, parts[2], options=','.join(parts[3:]))
+
+
+def parse_rules(text: str) -> list[Rule]:
+    """Извлекает правила секции [Rule] в порядке следования."""
+    rules: list[Rule] = []
+    in_rules = False
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped.startswith('[') and stripped.endswith(']'):
+            in_rules = stripped == '[Rule]'
+            continue
+        if not in_rules:
+            continue
+        rule = parse_rule(stripped)
+        if rule is not None:
+            rule.position = len(rules)
+            rules.append(rule)
+    return rules
+
+
+def _earliest(a: Rule | None, b: Rule | None) -> Rule | None:
+    if a is None:
+        return b
+    if b is None or a.position <= b.position:
+        return a
+    return b
+
+
+class _TrieNode:
+    __slots__ = ('children', 'suffix', 'exact')
+
+    def __init__(self):
+        self.children: dict[str, _TrieNode] = {}
+        self.suffix: list[Rule] = []  # DOMAIN-SUFFIX, отсортированы по позиции
+        self.exact: list[Rule] = []   # DOMAIN
+
+
+class _KeywordAutomaton:
+    """Автомат Ахо-Корасик по значениям DOMAIN-KEYWORD."""
+
+    def __init__(self, rules: list[Rule]):
+        self.goto: list[dict[str, int]] = [{}]
+        self.fail: list[int] = [0]
+        self.own: list[list[Rule]] = [[]]
+        self.best: list[Rule | None] = [None]
+
+        for rule in rules:
+            self._insert(rule)
+        self._link()
+
+    def _insert(self, rule: Rule) -> None:
+        state = 0
+        for ch in rule.value:
+            nxt = self.goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[state][ch] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.own.append([])
+                self.best.append(None)
+            state = nxt
+        self.own[state].append(rule)
+
+    def _link(self) -> None:
+        """Строит fail-ссылки в BFS-порядке и лучшие выходы по цепочке."""
+        queue = deque(self.goto[0].values())
+        order = []
+        while queue:
+            state = queue.popleft()
+            order.append(state)
+            for ch, nxt in self.goto[state].items():
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                cand = self.goto[f].get(ch, 0)
+                self.fail[nxt] = cand if cand != nxt else 0
+                queue.append(nxt)
+        self._order = order
+        self.refresh()
+
+    def refresh(self) -> None:
+        """Пересчитывает best после изменения позиций или own-списков."""
+        self.best[0] = min(self.own[0], key=_position, default=None)
+        for state in self._order:
+            own = min(self.own[state], key=_position, default=None)
+            self.best[state] = _earliest(own, self.best[self.fail[state]])
+
+    def search(self, text: str) -> Rule | None:
+        goto, fail, best = self.goto, self.fail, self.best
+        state = 0
+        found = None
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            hit = best[state]
+            if hit is not None and (found is None or hit.position < found.position):
+                found = hit
+        return found
+
+    def find_all(self, text: str) -> list[Rule]:
+        """Все keyword-правила, входящие в text (с повторами)."""
+        goto, fail, own = self.goto, self.fail, self.own
+        state = 0
+        found = []
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            s = state
+            while s:
+                found.extend(own[s])
+                s = fail[s]
+        return found
+
+
+def _position(rule: Rule) -> int:
+    return rule.position
+
+
+def compile_keywords(rules: list[Rule]) -> _KeywordAutomaton:
+    """Автомат по DOMAIN-KEYWORD правилам из rules (остальные пропускаются)."""
+    return _KeywordAutomaton([r for r in rules if r.type == 'DOMAIN-KEYWORD'])
+
+
+class RuleEngine:
+    """Индекс правил [Rule] с ответом «какое правило сработает первым»."""
+
+    def __init__(self, rules: list[Rule]):
+        self.rules = rules
+        self.final: Rule | None = None
+        self._root = _TrieNode()
+        keywords = []
+
+        for rule in rules:
+            if rule.type == 'FINAL' and self.final is None:
+                self.final = rule
+            elif rule.type == 'DOMAIN-KEYWORD':
+                keywords.append(rule)
+            elif rule.type in ('DOMAIN', 'DOMAIN-SUFFIX'):
+                self._trie_insert(rule)
+
+        self._keywords = _KeywordAutomaton(keywords)
+
+    @classmethod
+    def from_text(cls, text: str) -> 'RuleEngine':
+        return cls(parse_rules(text))
+
+    @classmethod
+    def from_file(cls, path: Path) -> 'RuleEngine':
+        if not path.exists():
+            return cls([])
+        return cls.from_text(path.read_text(encoding='utf-8'))
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def add(self, rules: list[Rule]) -> None:
+        """
+        Добавляет правила в индекс. Позиции должны быть уже проставлены
+        документом; существующие правила могут быть перенумерованы с
+        сохранением порядка — индекс от этого не портится.
+        """
+        self.apply_changes([], rules)
+
+    def remove(self, rules: list[Rule]) -> None:
+        """Убирает правила (те же объекты Rule, что были добавлены) из индекса."""
+        self.apply_changes(rules, [])
+
+    def apply_changes(self, removed: list[Rule], inserted: list[Rule],
+                      keywords: _KeywordAutomaton | None = None) -> None:
+        """
+        Удаляет и вставляет правила за один проход. keywords — автомат,
+        заранее построенный по новому списку DOMAIN-KEYWORD (например,
+        в другом потоке): ему пересчитываются только лучшие выходы.
+        """
+        gone = set(removed)
+        keywords_changed = False
+        for rule in gone:
+            if rule.type == 'DOMAIN-KEYWORD':
+                keywords_changed = True
+            elif rule.type in ('DOMAIN', 'DOMAIN-SUFFIX'):
+                self._trie_remove(rule)
+        for rule in inserted:
+            if rule.type == 'DOMAIN-KEYWORD':
+                keywords_changed = True
+            elif rule.type in ('DOMAIN', 'DOMAIN-SUFFIX'):
+                self._trie_insert(rule)
+
+        rules = [r for r in self.rules if r not in gone] if gone else self.rules
+        self.rules = sorted([*rules, *inserted], key=_position)
+        if self.final in gone or any(r.type == 'FINAL' for r in inserted):
+            self.final = next((r for r in self.rules if r.type == 'FINAL'), None)
+
+        if keywords is not None:
+            keywords.refresh()
+            self._keywords = keywords
+        elif keywords_changed:
+            self._keywords = compile_keywords(self.rules)
+
+    def _trie_insert(self, rule: Rule) -> None:
+        node = self._root
+        for label in reversed(rule.value.split('.')):
+            child = node.children.get(label)
+            if child is None:
+                child = node.children[label] = _TrieNode()
+            node = child
+        bucket = node.suffix if rule.type == 'DOMAIN-SUFFIX' else node.exact
+        bucket.append(rule)
+        bucket.sort(key=_position)
+
+    def _trie_remove(self, rule: Rule) -> None:
+        path = [self._root]
+        labels = list(reversed(rule.value.split('.')))
+        for label in labels:
+            node = path[-1].children.get(label)
+            if node is None:
+                return
+            path.append(node)
+        node = path[-1]
+        bucket = node.suffix if rule.type == 'DOMAIN-SUFFIX' else node.exact
+        for i, existing in enumerate(bucket):
+            if existing is rule:
+                del bucket[i]
+                break
+        # Убираем опустевшие узлы снизу вверх
+        for depth in range(len(labels), 0, -1):
+            node = path[depth]
+            if node.children or node.suffix or node.exact:
+                break
+            del path[depth - 1].children[labels[depth - 1]]
+
+    def match_suffix(self, domain: str) -> Rule | None:
+        """Первое DOMAIN/DOMAIN-SUFFIX правило для домена."""
+        node = self._root
+        found = None
+        labels = domain.split('.')
+        for i in range(len(labels) - 1, -1, -1):
+            node = node.children.get(labels[i])
+            if node is None:
+                return found
+            if node.suffix:
+                found = _earliest(found, node.suffix[0])
+        if node.exact:
+            found = _earliest(found, node.exact[0])
+        return found
+
+    def match_keyword(self, domain: str) -> Rule | None:
+        """Первое DOMAIN-KEYWORD правило, чьё значение входит в домен."""
+        return self._keywords.search(domain)
+
+    def keywords_in(self, text: str) -> list[Rule]:
+        """Все DOMAIN-KEYWORD правила, чьё значение входит в text."""
+        return self._keywords.find_all(text)
+
+    def suffix_node(self, domain: str) -> _TrieNode | None:
+        """Узел дерева для домена (для обхода вложенных правил)."""
+        node = self._root
+        for label in reversed(domain.split('.')):
+            node = node.children.get(label)
+            if node is None:
+                return None
+        return node
+
+    def match(self, domain: str) -> tuple[Rule, str] | None:
+        """
+        Возвращает (правило, политика) первого доменного правила,
+        которое сработает для хоста, или None — тогда решают GEOIP/FINAL.
+        """
+        domain = domain.lower().rstrip('.')
+        rule = _earliest(self.match_suffix(domain), self.match_keyword(domain))
+        if rule is None:
+            return None
+        return rule, rule.policy
+
+    def policy(self, domain: str) -> str | None:
+        """Политика для домена с учётом FINAL (без GEOIP)."""
+        hit = self.match(domain)
+        if hit is not None:
+            return hit[1]
+        return self.final.policy if self.final else None
+
+    def covers(self, domain: str) -> bool:
+        """True если домен уже маршрутизируется каким-либо правилом."""
+        return self.match(domain) is not None
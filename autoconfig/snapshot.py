@@ -0,0 +1,84 @@
+"""Снимок состояния демона: окно DNS-истории.
+
+Формат файла: SNAPSHOT_MAGIC, затем zlib(JSON). Только данные, никаких
+сериализованных объектов Python: файл лежит в репозитории пользователя,
+а читает его демон под root. Хранятся только события истории — после
+рестарта /add сразу находит связанные домены. Индекс правил в снимок
+не входит: разбор конфига и сборка RuleEngine из файла занимают
+миллисекунды, столько же, сколько заняла бы проверка копии в снимке.
+"""
+
+import asyncio
+import json
+import time
+import zlib
+from pathlib import Path
+
+from config import SNAPSHOT_INTERVAL
+from config_document import atomic_write
+from rules import is_hostname
+
+
+SNAPSHOT_MAGIC = b'SRSNAP2\n'
+
+
+class Snapshot:
+    """Прочитанный снимок: события DNS-истории."""
+
+    def __init__(self, events: list[tuple[str, float]]):
+        self.events = events  # (хост, время по time.monotonic())
+
+
+def write_snapshot(path: Path, events: list[tuple[str, float]]) -> None:
+    """Пишет снимок атомарно. events — (хост, unix-время)."""
+    state = {'saved_at': time.time(), 'events': events}
+    data = json.dumps(state, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    atomic_write(path, SNAPSHOT_MAGIC + zlib.compress(data, 1))
+
+
+def load_snapshot(path: Path) -> Snapshot | None:
+    """Читает снимок; None, если его нет или он повреждён."""
+    try:
+        raw = path.read_bytes()
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        print(f"[snapshot] Не удалось прочитать {path}: {e}")
+        return None
+    if not raw.startswith(SNAPSHOT_MAGIC):
+        print(f"[snapshot] {path}: неизвестный формат, пропускаю")
+        return None
+
+    try:
+        state = json.loads(zlib.decompress(raw[len(SNAPSHOT_MAGIC):]))
+        # Монотонные часы не переживают перезапуск: переводим из unix-времени
+        offset = time.time() - time.monotonic()
+        events = [(host, float(seen) - offset) for host, seen in state['events']
+                  if isinstance(host, str) and is_hostname(host)]
+    except (zlib.error, KeyError, TypeError, AttributeError, ValueError) as e:
+        print(f"[snapshot] {path} повреждён ({e!r}), пропускаю")
+        return None
+
+    return Snapshot(events)
+
+
+class Snapshotter:
+    """Периодически сохраняет окно DNS-истории DomainTracker."""
+
+    def __init__(self, tracker, path: Path, interval: float = SNAPSHOT_INTERVAL):
+        self.tracker = tracker
+        self.path = path
+        self.interval = interval
+
+    async def save(self) -> None:
+        offset = time.time() - time.monotonic()
+        events = [(host, seen + offset) for host, seen in self.tracker.cooccurrence.events()]
+        await asyncio.to_thread(write_snapshot, self.path, events)
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.save()
+            except OSError as e:
+                print(f"[snapshot] Не удалось записать снимок: {e}")
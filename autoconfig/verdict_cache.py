@@ -0,0 +1,119 @@
+"""Персистентный TTL-кеш вердиктов checker (SQLite в режиме WAL)."""
+
+import asyncio
+import sqlite3
+import time
+from pathlib import Path
+from typing import Awaitable, Callable
+
+
+class VerdictCache:
+    """
+    Кеш «домен → заблокирован ли» с раздельными TTL для положительных
+    (заблокирован) и отрицательных вердиктов.
+
+    Живые записи при старте читаются из SQLite в словарь, дальше чтение
+    идёт из памяти, а каждая новая запись сразу пишется на диск.
+    Одновременные проверки одного домена сливаются в одну.
+    """
+
+    def __init__(self, path: Path, positive_ttl: float, negative_ttl: float):
+        self.path = path
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+        self._entries: dict[str, tuple[bool, float]] = {}  # domain -> (blocked, expires)
+        self._inflight: dict[str, asyncio.Future] = {}
+
+        self._db = sqlite3.connect(str(path), isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS verdicts ('
+            ' domain TEXT PRIMARY KEY,'
+            ' blocked INTEGER NOT NULL,'
+            ' expires REAL NOT NULL)'
+        )
+        self._load()
+
+    def _load(self) -> None:
+        now = time.time()
+        self._db.execute('DELETE FROM verdicts WHERE expires <= ?', (now,))
+        for domain, blocked, expires in self._db.execute(
+            'SELECT domain, blocked, expires FROM verdicts'
+        ):
+            self._entries[domain] = (bool(blocked), expires)
+
+    def get(self, domain: str) -> bool | None:
+        """Закешированный вердикт или None, если его нет или он истёк."""
+        entry = self._entries.get(domain)
+        if entry is None:
+            return None
+        blocked, expires = entry
+        if expires <= time.time():
+            del self._entries[domain]
+            return None
+        return blocked
+
+    def put(self, domain: str, blocked: bool) -> None:
+        ttl = self.positive_ttl if blocked else self.negative_ttl
+        expires = time.time() + ttl
+        self._entries[domain] = (blocked, expires)
+        self._db.execute(
+            'INSERT OR REPLACE INTO verdicts (domain, blocked, expires) VALUES (?, ?, ?)',
+            (domain, int(blocked), expires),
+        )
+
+    def invalidate(self, domain: str) -> None:
+        self._entries.pop(domain, None)
+        self._db.execute('DELETE FROM verdicts WHERE domain = ?', (domain,))
+
+    async def check(self, domain: str, probe: Callable[[str], Awaitable[bool]]) -> bool:
+        """
+        Вердикт из кеша, иначе — результат probe(domain). Если домен уже
+        проверяется, ждём ту же проверку вместо запуска второй.
+        """
+        cached = self.get(domain)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        inflight = self._inflight.get(domain)
+        if inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[domain] = future
+        try:
+            blocked = await probe(domain)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Исключение уже передано ожидающим — не ругаемся "never retrieved"
+            future.exception()
+            raise
+        else:
+            self.put(domain, blocked)
+            future.set_result(blocked)
+            return blocked
+        finally:
+            del self._inflight[domain]
+
+    def stats(self) -> dict:
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'inflight': len(self._inflight),
+        }
+
+    def close(self) -> None:
+        self._db.close()